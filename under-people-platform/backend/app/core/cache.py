@@ -0,0 +1,355 @@
+"""
+Кэширование поверх Redis (REDIS_URL).
+
+ReadThroughCache - read-through кэш JSON-значений с TTL, явной инвалидацией
+и защитой от cache stampede:
+- внутри процесса конкурентные промахи по одному ключу ждут одну загрузку;
+- между воркерами загрузку выполняет только владелец короткого SET NX lock,
+  остальные ждут появления значения в Redis;
+- invalidate() увеличивает поколение ключа, а загруженное значение
+  записывается, только если поколение не изменилось с начала загрузки:
+  строка, прочитанная до commit, не возвращается в кэш после его инвалидации.
+
+Если Redis недоступен, кэш прозрачно деградирует до прямой загрузки из БД.
+
+LocalTTLCache - in-process LRU с TTL и negative caching для горячих
+ключей, где даже поход в Redis лишний (публичные профили).
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+import orjson
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from app.core.config import settings
+from app.db.hooks import after_commit
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+# KEYS[1] - значение, KEYS[2] - поколение; ARGV: поколение на начало загрузки
+# ("" - ключа не было), значение, TTL (с). 1 - записано, 0 - была инвалидация.
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def get_redis():
+    """Общий redis.asyncio клиент процесса (создаётся лениво)"""
+    global _redis
+    if _redis is None:
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def set_redis(client) -> None:
+    """Подменить клиент (например, fakeredis.aioredis.FakeRedis в тестах)"""
+    global _redis
+    _redis = client
+
+
+def _reset_redis_after_fork() -> None:
+    """Соединения клиента принадлежат родителю - в дочернем процессе создаём новый"""
+    global _redis
+    _redis = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_redis_after_fork)
+
+
+class ReadThroughCache:
+    """Read-through кэш с TTL и защитой от stampede"""
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: int,
+        lock_ttl: float = 5.0,
+        poll_interval: float = 0.05,
+        client=None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._client = client
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._set_script = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.stale_writes = 0
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    @staticmethod
+    def generation_key(full_key: str) -> str:
+        return f"{full_key}:gen"
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Вернуть значение из кэша или загрузить его через loader (один раз на ключ).
+        
+        При промахе выполняется loader первого запроса, остальные ждут его
+        результат, и загрузка продолжается после отмены этого запроса -
+        loader не должен замыкать объекты запроса (его AsyncSession), а
+        открывает свою сессию через AsyncSessionLocal().
+        """
+        full_key = self.key(key)
+        try:
+            cached = await self.client.get(full_key)
+        except RedisError as e:
+            self.errors += 1
+            logger.warning("Cache %s unavailable, loading directly: %s", self.namespace, e)
+            return await loader()
+
+        if cached is not None:
+            self.hits += 1
+            return orjson.loads(cached)
+
+        self.misses += 1
+        task = self._inflight.get(full_key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(full_key, loader))
+            self._inflight[full_key] = task
+            task.add_done_callback(lambda done: self._forget(full_key, done))
+        # shield: отмена одного ожидающего запроса не отменяет общую загрузку
+        return await asyncio.shield(task)
+
+    def _forget(self, full_key: str, task: asyncio.Task) -> None:
+        # После invalidate() под ключом может быть уже новая загрузка
+        if self._inflight.get(full_key) is task:
+            del self._inflight[full_key]
+
+    async def _load(self, full_key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        lock_key = f"{full_key}:lock"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except RedisError:
+            self.errors += 1
+            return await loader()
+
+        if not acquired:
+            # Другой воркер уже грузит значение - ждём его, а не идём в БД
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.lock_ttl
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    cached = await self.client.get(full_key)
+                except RedisError:
+                    break
+                if cached is not None:
+                    return orjson.loads(cached)
+
+        try:
+            client = self.client
+            try:
+                # Поколение читается до loader: инвалидация во время загрузки его сменит
+                generation = await client.get(self.generation_key(full_key))
+            except RedisError:
+                self.errors += 1
+                return await loader()
+            value = await loader()
+            if self._set_script is None:
+                self._set_script = client.register_script(SET_IF_GENERATION_SCRIPT)
+            try:
+                written = await self._set_script(
+                    keys=[full_key, self.generation_key(full_key)],
+                    args=[generation or "", orjson.dumps(value, default=str), self.ttl],
+                    client=client,
+                )
+                if not written:
+                    self.stale_writes += 1
+            except RedisError:
+                self.errors += 1
+            return value
+        finally:
+            if acquired:
+                try:
+                    # Не атомарно, но lock живёт lock_ttl, а сравнение токена
+                    # не даёт снять чужой lock после истечения своего
+                    if await self.client.get(lock_key) == token:
+                        await self.client.delete(lock_key)
+                except RedisError:
+                    pass
+
+    def _invalidate_commands(self, pipe, keys: Iterable[str]) -> None:
+        for full_key in map(self.key, keys):
+            pipe.delete(full_key)
+            pipe.incr(self.generation_key(full_key))
+            # Поколение нужно только на время загрузки (намного меньше ttl);
+            # истёкшее поколение даёт лишний промах, а не устаревшее значение
+            pipe.expire(self.generation_key(full_key), self.ttl)
+
+    async def invalidate(self, *keys: str) -> None:
+        """Удалить ключи из кэша и сменить их поколение"""
+        if not keys:
+            return
+        for key in keys:
+            # Новые запросы не присоединяются к загрузке, начатой до инвалидации
+            self._inflight.pop(self.key(key), None)
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            self._invalidate_commands(pipe, keys)
+            await pipe.execute()
+        except RedisError as e:
+            self.errors += 1
+            logger.warning("Cache %s invalidation failed: %s", self.namespace, e)
+
+    def invalidate_sync(self, *keys: str) -> None:
+        """Инвалидация вне event loop (скрипты, миграции)"""
+        if not keys:
+            return
+        import redis
+        try:
+            client = redis.Redis.from_url(settings.REDIS_URL)
+            pipe = client.pipeline(transaction=True)
+            self._invalidate_commands(pipe, keys)
+            pipe.execute()
+            client.close()
+        except RedisError as e:
+            logger.warning("Cache %s invalidation failed: %s", self.namespace, e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "stale_writes": self.stale_writes,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LocalTTLCache:
+    """
+    LRU + TTL кэш внутри процесса.
+    
+    Отрицательные записи (ключ точно не существует) живут negative_ttl
+    секунд - это гасит перебор несуществующих ключей ботами. Инвалидация
+    локальна для воркера; в остальных воркерах запись истечёт по TTL.
+    """
+
+    _NEGATIVE = object()
+
+    def __init__(self, name: str, max_size: int, ttl: float, negative_ttl: float):
+        self.namespace = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Tuple[bool, Optional[Any]]:
+        """(найдено, значение); для отрицательной записи - (True, None)"""
+        item = self._items.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return False, None
+        self._items.move_to_end(key)
+        if item[1] is self._NEGATIVE:
+            self.negative_hits += 1
+            return True, None
+        self.hits += 1
+        return True, item[1]
+
+    def set(self, key: str, value: Any) -> None:
+        self._put(key, value, self.ttl)
+
+    def set_missing(self, key: str) -> None:
+        self._put(key, self._NEGATIVE, self.negative_ttl)
+
+    def _put(self, key: str, value: Any, ttl: float) -> None:
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_sync(self, *keys: str) -> None:
+        for key in keys:
+            self._items.pop(key, None)
+
+    async def invalidate(self, *keys: str) -> None:
+        self.invalidate_sync(*keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._items),
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Инвалидация по изменениям ORM-моделей
+# ---------------------------------------------------------------------------
+
+
+def invalidate_on_change(
+    model,
+    cache,
+    keys_for: Callable[[Any], Iterable[str]],
+    fields: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Сбрасывать ключи keys_for(obj) после commit, в котором obj был создан,
+    изменён или удалён через ORM. cache - ReadThroughCache или LocalTTLCache.
+    
+    fields ограничивает реакцию на UPDATE изменением перечисленных атрибутов.
+
+    Массовые UPDATE/DELETE через Core не вызывают mapper events - после них
+    нужно вызывать cache.invalidate() явно.
+    """
+    watched = tuple(fields) if fields else None
+
+    def collect(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            keys = tuple(keys_for(target))
+            after_commit(
+                session,
+                lambda: cache.invalidate(*keys),
+                lambda: cache.invalidate_sync(*keys),
+            )
+
+    def collect_update(mapper, connection, target):
+        if watched:
+            state = inspect(target)
+            if not any(state.attrs[name].history.has_changes() for name in watched):
+                return
+        collect(mapper, connection, target)
+
+    event.listen(model, "after_insert", collect)
+    event.listen(model, "after_update", collect_update)
+    event.listen(model, "after_delete", collect)
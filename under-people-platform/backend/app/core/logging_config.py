@@ -0,0 +1,187 @@
+"""
+Логирование: неблокирующий конвейер со структурированным JSON.
+
+- Обработчики приложения пишут только в QueueHandler (in-memory очередь);
+  форматирование в JSON и запись в stdout выполняет фоновый поток
+  QueueListener, поэтому event loop не ждёт I/O.
+- Каждая запись получает request_id текущего запроса (см. RequestContextMiddleware).
+- Для шумных логгеров можно включить сэмплирование успешных путей:
+  LOG_SAMPLING="app.routers.auth=0.1,app.routers.users=0.05" - записи ниже
+  WARNING этих логгеров (и их потомков) пропускаются с заданной вероятностью.
+  Предупреждения и ошибки не сэмплируются никогда.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями (extra=...)
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Фиксирует request_id в записи в момент вызова логгера (до очереди)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей < WARNING для заданных логгеров"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Сначала самые длинные префиксы - точное совпадение важнее родителя
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self._resolved: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix, value in self.rates:
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = value
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение, request_id, extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не форматирует сообщение в вызывающем потоке.
+    
+    Стандартный prepare() делает record.getMessage() и копирует запись;
+    здесь в очередь уходит сама запись, а форматирование (включая
+    подстановку аргументов) выполняет поток QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # traceback нельзя форматировать позже - кадры могут измениться
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """'a=0.1,b.c=0.5' -> {'a': 0.1, 'b.c': 0.5}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        rates[name.strip()] = max(0.0, min(1.0, float(value)))
+    return rates
+
+
+def disable_costly_record_fields() -> None:
+    """
+    Не собирать в LogRecord поля, которые мы не выводим.
+    
+    Поиск вызывающего кадра (findCaller) и данные о потоке/процессе -
+    основная стоимость logger.info() в вызывающем потоке
+    (см. раздел Optimization документации logging).
+    """
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json", sampling: str = "") -> None:
+    """Настроить корневой логгер на очередь + фоновую запись в stdout"""
+    global _listener
+    if _listener is not None:
+        return
+
+    disable_costly_record_fields()
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    rates = parse_sampling(sampling)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        ))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def _restart_listener_after_fork() -> None:
+    """
+    Поток QueueListener не переживает fork (gunicorn --preload): в дочернем
+    процессе запускаем новый слушатель на той же очереди и обработчиках.
+    """
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(
+            _listener.queue, *_listener.handlers,
+            respect_handler_level=_listener.respect_handler_level,
+        )
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Дописать очередь и остановить фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
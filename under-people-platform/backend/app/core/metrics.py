@@ -0,0 +1,172 @@
+"""
+Метрики приложения в формате Prometheus (GET /metrics).
+
+- HTTP: счётчик запросов и гистограмма latency по (method, route) - route
+  берётся из шаблона пути FastAPI, поэтому кардинальность ограничена;
+  gauge запросов в обработке.
+- Пул соединений SQLAlchemy: время ожидания checkout (TimedQueuePool),
+  а также size/checked out/overflow на момент scrape.
+- Кэши и фоновые задачи: зарегистрированные источники stats() читаются
+  при scrape, на горячем пути ничего не считается дополнительно.
+
+При нескольких gunicorn-воркерах и заданном PROMETHEUS_MULTIPROC_DIR
+счётчики и гистограммы агрегируются по всем воркерам (multiprocess mode);
+пулы и кэши отражают воркер, обслуживший scrape.
+"""
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being processed", multiprocess_mode="livesum",
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements issued per HTTP request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests rejected with 429", ["policy"],
+)
+MARKET_PURCHASES = Counter(
+    "market_purchases_total", "Marketplace purchase attempts", ["outcome"],
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ["engine"],
+    buckets=POOL_WAIT_BUCKETS,
+)
+
+_pools: Dict[str, Callable[[], object]] = {}
+_stats_sources: List[Tuple[str, str, Callable[[], dict]]] = []
+
+
+def register_pool(name: str, get_pool: Callable[[], object]) -> None:
+    """
+    Публиковать состояние пула соединений при scrape.
+    
+    Передаётся функция, а не пул: engine.dispose() заменяет engine.pool.
+    """
+    _pools[name] = get_pool
+
+
+def register_stats(kind: str, name: str, stats: Callable[[], dict]) -> None:
+    """
+    Публиковать числовые поля stats() как gauge up_{kind}_{field}{name=...}.
+    
+    Например, register_stats("cache", "products", product_cache.stats)
+    даёт up_cache_hits{name="products"}, up_cache_hit_ratio{...} и т.д.
+    """
+    _stats_sources.append((kind, name, stats))
+
+
+class _ScrapeTimeCollector:
+    """Значения, которые дешевле прочитать при scrape, чем считать на каждый запрос"""
+
+    def collect(self):
+        pool_metrics = {
+            "size": GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["engine"]),
+            "checkedout": GaugeMetricFamily("db_pool_checked_out", "Connections in use", labels=["engine"]),
+            "checkedin": GaugeMetricFamily("db_pool_checked_in", "Idle pooled connections", labels=["engine"]),
+            "overflow": GaugeMetricFamily(
+                "db_pool_overflow", "Connections above pool_size (negative: not yet opened)", labels=["engine"],
+            ),
+        }
+        for name, get_pool in _pools.items():
+            pool = get_pool()
+            for attr, family in pool_metrics.items():
+                family.add_metric([name], getattr(pool, attr)())
+        yield from pool_metrics.values()
+
+        families: Dict[str, GaugeMetricFamily] = {}
+        for kind, name, stats in _stats_sources:
+            for field, value in stats().items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                metric = f"up_{kind}_{field}"
+                family = families.get(metric)
+                if family is None:
+                    family = families[metric] = GaugeMetricFamily(metric, f"{kind} {field}", labels=["name"])
+                family.add_metric([name], value)
+        yield from families.values()
+
+
+_scrape_collector = _ScrapeTimeCollector()
+REGISTRY.register(_scrape_collector)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Текст экспозиции и Content-Type"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_scrape_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Чистый ASGI middleware: latency и статус по шаблону маршрута.
+    
+    Дочерние метрики (labels) кэшируются, чтобы на запрос приходился
+    только observe/inc без построения label-словарей.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._latency: Dict[Tuple[str, str], object] = {}
+        self._counts: Dict[Tuple[str, str, int], object] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+
+            latency = self._latency.get((method, route))
+            if latency is None:
+                latency = self._latency[(method, route)] = HTTP_LATENCY.labels(method, route)
+            latency.observe(elapsed)
+
+            key = (method, route, status_code)
+            counter = self._counts.get(key)
+            if counter is None:
+                counter = self._counts[key] = HTTP_REQUESTS.labels(method, route, str(status_code))
+            counter.inc()
@@ -0,0 +1,83 @@
+"""
+ASGI middleware приложения.
+
+Написаны как "чистые" ASGI-классы, а не BaseHTTPMiddleware: они не
+оборачивают тело ответа и не создают лишних задач на каждый запрос.
+"""
+import uuid
+
+from app.core.logging_config import request_id_var
+from app.core.metrics import DB_QUERIES_PER_REQUEST
+from app.db.instrumentation import QueryStats, query_stats_var
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class RequestContextMiddleware:
+    """
+    Присваивает запросу request_id (из X-Request-ID или новый) и
+    возвращает его в заголовке ответа; значение доступно логам через contextvar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+
+class QueryAccountingMiddleware:
+    """
+    Считает SQL-запросы и время в БД для каждого HTTP-запроса.
+    
+    В DEBUG добавляет заголовки X-DB-Query-Count и X-DB-Time-Ms;
+    число запросов всегда попадает в гистограмму db_queries_per_request.
+    """
+
+    def __init__(self, app, expose_headers: bool = False):
+        self.app = app
+        self.expose_headers = expose_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats(scope)
+        token = query_stats_var.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start" and self.expose_headers:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(stats.count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.total_seconds * 1000:.2f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            query_stats_var.reset(token)
+            DB_QUERIES_PER_REQUEST.labels(stats.route).observe(stats.count)
@@ -0,0 +1,355 @@
+"""
+Ограничение частоты запросов, общее для всех воркеров.
+
+Счётчик - скользящее окно в Redis (два фиксированных окна с весом:
+estimate = previous * (1 - elapsed / window) + current), обновляется одним
+Lua-скриптом, поэтому лимит не умножается на число воркеров/инстансов.
+
+Быстрый путь: после каждого обращения к Redis воркер получает локальный
+бюджет токенов - долю (RATE_LIMIT_LOCAL_FRACTION) оставшегося запаса до
+лимита. Пока бюджет не исчерпан и не устарел, запросы пропускаются без
+Redis, а накопленные попадания отправляются одним INCRBY при следующей
+синхронизации или фоновым сбросом (RATE_LIMIT_FLUSH_INTERVAL). У строгих
+политик (маленький лимит) бюджет равен нулю - каждый запрос проверяется в
+Redis. Отклонённые запросы в счётчик не попадают: клиент, который
+продолжает повторять, снова пропускается, как только окно сдвинется.
+
+Ключ политики - IP клиента, либо целочисленный параметр запроса
+(key="query:<имя>", значение нормализуется через int). Маршрут может
+иметь несколько политик - запрос должен пройти все. /auth/generate-code
+вызывает бот с одного адреса, поэтому там лимит на telegram_id и общий
+потолок на IP: перебор telegram_id упирается в него.
+
+Если Redis недоступен, действует локальный счётчик воркера по тому же лимиту.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl
+
+from redis.exceptions import RedisError
+
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.core.metrics import RATE_LIMIT_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] - текущее окно, KEYS[2] - предыдущее; ARGV[1] - уже пропущенные локально
+# попадания (учитываются всегда), ARGV[2] - TTL (мс), ARGV[3] - вес предыдущего окна,
+# ARGV[4] - лимит, ARGV[5] - 1, если проверяется новый запрос (0 - только сброс).
+# Новый запрос учитывается, только если он разрешён.
+SLIDING_WINDOW_SCRIPT = """
+local pending = tonumber(ARGV[1])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local allowed = 0
+if tonumber(ARGV[5]) == 1 and previous * tonumber(ARGV[3]) + current + pending + 1 <= tonumber(ARGV[4]) then
+    allowed = 1
+end
+local hits = pending + allowed
+if hits > 0 then
+    current = redis.call('INCRBY', KEYS[1], hits)
+    if current == hits then
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+end
+return {allowed, current, previous}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    limit: int
+    window: float  # секунды
+    key: str = "ip"  # "ip" или "query:<целочисленный параметр>" (без него - IP)
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "RateLimitPolicy":
+        """'100/60' - 100 запросов за 60 секунд"""
+        limit, window = spec.split("/", 1)
+        return cls(name=name, limit=int(limit), window=float(window))
+
+    def identity(self, scope, trusted_proxies: int) -> str:
+        if self.key.startswith("query:"):
+            name = self.key[len("query:"):]
+            for param, value in parse_qsl(scope.get("query_string", b"").decode("latin-1")):
+                if param != name:
+                    continue
+                # "007", "+7" и "7" - один ключ; не число - запрос всё равно
+                # получит 422, считаем его по IP
+                try:
+                    return f"{name}={int(value)}"
+                except ValueError:
+                    break
+        return client_ip(scope, trusted_proxies)
+
+
+# Политики по (method, path); остальные запросы под /api/ - политика "default"
+ROUTE_POLICIES: Dict[Tuple[str, str], Tuple[RateLimitPolicy, ...]] = {
+    # Вызывает бот (один IP на всех): лимит на пользователя Telegram и общий
+    # потолок на IP - перебор telegram_id не даёт выпускать коды без предела
+    ("POST", "/api/auth/generate-code"): (
+        RateLimitPolicy("auth_generate_code", limit=5, window=60, key="query:telegram_id"),
+        RateLimitPolicy.parse("auth_generate_code_ip", settings.RATE_LIMIT_GENERATE_CODE_IP),
+    ),
+    ("POST", "/api/auth/callback"): (RateLimitPolicy("auth_callback", limit=20, window=60),),
+}
+
+
+class _LocalState:
+    """Состояние ключа в воркере: бюджет быстрого пути и резервный счётчик"""
+
+    __slots__ = ("policy", "tokens", "pending", "synced_at", "fallback_window", "fallback_count")
+
+    def __init__(self, policy: "RateLimitPolicy"):
+        self.policy = policy
+        self.tokens = 0
+        self.pending = 0
+        self.synced_at = 0.0
+        self.fallback_window = -1
+        self.fallback_count = 0
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        default_policy: RateLimitPolicy,
+        route_policies: Dict[Tuple[str, str], Tuple[RateLimitPolicy, ...]],
+        local_fraction: float = 0.1,
+        flush_interval: float = 1.0,
+        max_keys: int = 50_000,
+        prefix: str = "ratelimit",
+        client=None,
+    ):
+        self.enabled = True
+        self.default_policy = default_policy
+        self.route_policies = route_policies
+        self.local_fraction = local_fraction
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.prefix = prefix
+        self._client = client
+        self._script = None
+        self._task: Optional[asyncio.Task] = None
+        self._local: "OrderedDict[str, _LocalState]" = OrderedDict()
+        self._local_hits = 0
+        self._redis_checks = 0
+        self._rejected = 0
+        self._redis_errors = 0
+        self._flushed = 0
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def policies_for(self, method: str, path: str) -> Sequence[RateLimitPolicy]:
+        policies = self.route_policies.get((method, path))
+        if policies is not None:
+            return policies
+        if path.startswith("/api/"):
+            return (self.default_policy,)
+        return ()
+
+    def _state(self, key: str, policy: RateLimitPolicy) -> _LocalState:
+        state = self._local.get(key)
+        if state is None:
+            state = self._local[key] = _LocalState(policy)
+            if len(self._local) > self.max_keys:
+                self._local.popitem(last=False)
+        else:
+            self._local.move_to_end(key)
+        return state
+
+    async def _sync(self, policy: RateLimitPolicy, key: str, pending: int, now: float, request: bool):
+        """Отправить pending попаданий (и проверить новый запрос); (allowed, current, previous)"""
+        window_index = int(now // policy.window)
+        elapsed = now - window_index * policy.window
+        client = self.client
+        if self._script is None:
+            self._script = client.register_script(SLIDING_WINDOW_SCRIPT)
+        allowed, current, previous = await self._script(
+            keys=[f"{self.prefix}:{key}:{window_index}", f"{self.prefix}:{key}:{window_index - 1}"],
+            args=[pending, int(policy.window * 2000), 1 - elapsed / policy.window, policy.limit, int(request)],
+            client=client,
+        )
+        return bool(allowed), int(current), int(previous)
+
+    async def hit(self, policy: RateLimitPolicy, identity: str) -> Tuple[bool, int, float]:
+        """
+        Учесть запрос. Возвращает (разрешён, осталось, retry_after секунд).
+        """
+        key = f"{policy.name}:{identity}"
+        state = self._state(key, policy)
+        now = time.time()
+
+        # Быстрый путь: бюджет есть и синхронизация свежая (не старше 1/10 окна)
+        if state.tokens > 0 and now - state.synced_at < policy.window / 10:
+            state.tokens -= 1
+            state.pending += 1
+            self._local_hits += 1
+            return True, state.tokens, 0.0
+
+        window_index = int(now // policy.window)
+        elapsed = now - window_index * policy.window
+        # Забираем pending до await: быстрые попадания во время запроса не теряются
+        pending, state.pending = state.pending, 0
+        try:
+            allowed, current, previous = await self._sync(policy, key, pending, now, request=True)
+        except RedisError as e:
+            self._redis_errors += 1
+            logger.debug("Rate limiter falls back to local counter: %s", e)
+            return self._fallback_hit(policy, state, window_index, elapsed)
+
+        self._redis_checks += 1
+        state.synced_at = now
+        if not allowed:
+            state.tokens = 0
+            self._rejected += 1
+            RATE_LIMIT_REJECTIONS.labels(policy.name).inc()
+            return False, 0, policy.window - elapsed
+        estimate = previous * (1 - elapsed / policy.window) + current
+        remaining = max(0, policy.limit - math.ceil(estimate))
+        state.tokens = int(remaining * self.local_fraction)
+        return True, remaining, 0.0
+
+    async def flush(self) -> int:
+        """Отправить в Redis попадания, пропущенные локально; возвращает их число"""
+        now = time.time()
+        flushed = 0
+        for key, state in list(self._local.items()):
+            if state.pending <= 0:
+                continue
+            pending, state.pending = state.pending, 0
+            try:
+                await self._sync(state.policy, key, pending, now, request=False)
+            except RedisError as e:
+                self._redis_errors += 1
+                logger.debug("Rate limiter flush failed: %s", e)
+                return flushed
+            flushed += pending
+        self._flushed += flushed
+        return flushed
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Rate limiter flush failed: %s", e, exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever(), name="rate-limit-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            pass
+
+    def _fallback_hit(self, policy, state: _LocalState, window_index: int, elapsed: float):
+        state.tokens = 0
+        state.pending = 0
+        if state.fallback_window != window_index:
+            state.fallback_window = window_index
+            state.fallback_count = 0
+        if state.fallback_count >= policy.limit:
+            self._rejected += 1
+            RATE_LIMIT_REJECTIONS.labels(policy.name).inc()
+            return False, 0, policy.window - elapsed
+        state.fallback_count += 1
+        return True, policy.limit - state.fallback_count, 0.0
+
+    def stats(self) -> dict:
+        checks = self._local_hits + self._redis_checks
+        return {
+            "local_hits": self._local_hits,
+            "redis_checks": self._redis_checks,
+            "rejected": self._rejected,
+            "redis_errors": self._redis_errors,
+            "flushed_hits": self._flushed,
+            "tracked_keys": len(self._local),
+            "local_ratio": round(self._local_hits / checks, 4) if checks else 0.0,
+        }
+
+
+def client_ip(scope, trusted_proxies: int) -> str:
+    """
+    IP клиента. За trusted_proxies доверенными прокси (Render) реальный адрес -
+    N-я запись X-Forwarded-For с конца; более левые значения клиент может подделать.
+    """
+    if trusted_proxies > 0:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",") if hop.strip()]
+                if hops:
+                    return hops[max(0, len(hops) - trusted_proxies)]
+                break
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """
+    Чистый ASGI middleware: 429 с Retry-After до маршрутизации и обработчика.
+    """
+
+    def __init__(self, app, limiter: "RateLimiter", trusted_proxies: int = 1):
+        self.app = app
+        self.limiter = limiter
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            return await self.app(scope, receive, send)
+
+        # Первая отклонившая политика даёт 429; более узкие политики маршрута
+        # идут первыми, чтобы их отказ не расходовал общий потолок
+        for policy in self.limiter.policies_for(scope["method"], scope["path"]):
+            allowed, remaining, retry_after = await self.limiter.hit(
+                policy, policy.identity(scope, self.trusted_proxies)
+            )
+            if not allowed:
+                break
+        else:
+            return await self.app(scope, receive, send)
+
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                (b"x-ratelimit-limit", str(policy.limit).encode()),
+                (b"x-ratelimit-remaining", b"0"),
+            ],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b'{"detail":"Too many requests. Rate limit exceeded."}',
+        })
+
+
+rate_limiter = RateLimiter(
+    default_policy=RateLimitPolicy.parse("default", settings.RATE_LIMIT_DEFAULT),
+    route_policies=ROUTE_POLICIES,
+    local_fraction=settings.RATE_LIMIT_LOCAL_FRACTION,
+    flush_interval=settings.RATE_LIMIT_FLUSH_INTERVAL,
+)
+rate_limiter.enabled = settings.RATE_LIMIT_ENABLED
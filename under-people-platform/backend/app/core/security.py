@@ -1,14 +1,27 @@
+import asyncio
 import hashlib
 import hmac
+import logging
 import os
-from typing import Dict
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import jwt
+from fastapi import Header, HTTPException, status
+from redis.exceptions import RedisError
+
+from app.core.cache import get_redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
 
 def verify_telegram_auth(data: Dict[str, str]) -> bool:
     """
     Проверяет подлинность данных авторизации от Telegram.
     """
-    from app.core.config import settings
-    
     bot_token = settings.TELEGRAM_BOT_TOKEN
     if not bot_token:
         return False
@@ -27,3 +40,291 @@ def verify_telegram_auth(data: Dict[str, str]) -> bool:
     hash_result = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
 
     return hash_result == check_hash
+
+
+# ---------------------------------------------------------------------------
+# Access-токены (JWT, подписаны SECRET_KEY)
+# ---------------------------------------------------------------------------
+
+# Значения по умолчанию из config.py и .env.example
+INSECURE_SECRET_KEYS = frozenset({
+    "",
+    "super-secret-key-change-in-production",
+    "your-secret-key-change-this-in-production",
+})
+MIN_SECRET_KEY_LENGTH = 32
+
+
+def check_secret_key() -> None:
+    """
+    Не запускаться с известным SECRET_KEY вне DEBUG.
+    
+    Identity берётся только из claims токена (без запроса к БД), так что
+    с известным ключом любой может подписать токен на чужой user_id.
+    """
+    key = settings.SECRET_KEY.strip()
+    if key in INSECURE_SECRET_KEYS or len(key) < MIN_SECRET_KEY_LENGTH:
+        if not settings.DEBUG:
+            raise RuntimeError(
+                f"SECRET_KEY is a default or shorter than {MIN_SECRET_KEY_LENGTH} characters - "
+                "set a random key (openssl rand -hex 32)"
+            )
+        logger.warning("SECRET_KEY is a default or too short - acceptable only with DEBUG")
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    """Проверенные claims access-токена - достаточно для identity без БД"""
+    user_id: uuid.UUID
+    telegram_id: int
+    referral_code: Optional[str]
+    jti: str
+    expires_at: int
+
+
+def create_access_token(user) -> str:
+    """Выпустить подписанный токен для пользователя"""
+    now = int(time.time())
+    payload = {
+        "sub": str(user.id),
+        "tg": user.telegram_id,
+        "ref": user.referral_code,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def decode_access_token(token: str) -> TokenClaims:
+    """Проверить подпись и срок действия токена (jwt.PyJWTError при ошибке)"""
+    payload = jwt.decode(
+        token,
+        settings.SECRET_KEY,
+        algorithms=[settings.ALGORITHM],
+        options={"require": ["sub", "jti", "exp"]},
+    )
+    try:
+        return TokenClaims(
+            user_id=uuid.UUID(payload["sub"]),
+            telegram_id=int(payload.get("tg", 0)),
+            referral_code=payload.get("ref"),
+            jti=payload["jti"],
+            expires_at=int(payload["exp"]),
+        )
+    except (TypeError, ValueError):
+        raise jwt.InvalidTokenError("Malformed token claims")
+
+
+class VerifiedTokenCache:
+    """LRU уже проверенных токенов: повторная проверка подписи не нужна"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, TokenClaims]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[TokenClaims]:
+        claims = self._items.get(token)
+        if claims is None:
+            return None
+        if claims.expires_at <= time.time():
+            del self._items[token]
+            return None
+        self._items.move_to_end(token)
+        return claims
+
+    def put(self, token: str, claims: TokenClaims) -> None:
+        self._items[token] = claims
+        self._items.move_to_end(token)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+# KEYS[1] - jti -> exp, KEYS[2] - журнал отзывов "jti:exp" -> время отзыва (мс
+# по часам Redis); ARGV: jti, exp, время хранения журнала (мс).
+# Время берётся из TIME внутри скрипта - порядок очков совпадает с порядком
+# записей, поэтому воркер дочитывает журнал от последнего виденного очка.
+REVOKE_SCRIPT = """
+local time = redis.call('TIME')
+local now_ms = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('ZADD', KEYS[2], now_ms, ARGV[1] .. ':' .. ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', math.floor(now_ms / 1000))
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now_ms - tonumber(ARGV[3]))
+return now_ms
+"""
+
+
+class RevocationSet:
+    """
+    Отозванные jti до истечения их exp.
+    
+    Локальная копия проверяется на каждом запросе без сетевых вызовов.
+    В Redis два sorted set: REDIS_KEY (jti, score = exp) - полный набор
+    для загрузки при старте, LOG_KEY ("jti:exp", score = время отзыва) -
+    журнал последних отзывов. Фоновая задача раз в REVOCATION_SYNC_SECONDS
+    дочитывает журнал от своей отметки - передаются только новые отзывы.
+    Полная загрузка - при старте и если отметка старше хранения журнала.
+    Истёкшие записи чистит скрипт отзыва.
+    """
+
+    REDIS_KEY = "auth:revoked"
+    LOG_KEY = "auth:revoked:log"
+    LOG_RETENTION_MS = 3_600_000
+
+    def __init__(self, sync_interval: float, client=None):
+        self.sync_interval = sync_interval
+        self._client = client
+        self._script = None
+        self._revoked: Dict[str, int] = {}
+        # Очко журнала (мс), до которого отзывы уже загружены; None - нужна полная загрузка
+        self._watermark: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        # Метрики
+        self.full_loads = 0
+        self.synced_entries = 0
+        self.errors = 0
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def _prune(self, now: float) -> None:
+        expired = [jti for jti, exp in self._revoked.items() if exp <= now]
+        for jti in expired:
+            del self._revoked[jti]
+
+    async def revoke(self, claims: TokenClaims) -> None:
+        self._revoked[claims.jti] = claims.expires_at
+        client = self.client
+        if self._script is None:
+            self._script = client.register_script(REVOKE_SCRIPT)
+        try:
+            await self._script(
+                keys=[self.REDIS_KEY, self.LOG_KEY],
+                args=[claims.jti, claims.expires_at, self.LOG_RETENTION_MS],
+                client=client,
+            )
+        except RedisError as e:
+            logger.warning("Could not publish token revocation: %s", e)
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    async def _redis_time_ms(self) -> int:
+        seconds, micros = await self.client.time()
+        return int(seconds) * 1000 + int(micros) // 1000
+
+    async def sync(self) -> int:
+        """Загрузить новые отзывы из Redis; возвращает число полученных записей"""
+        client = self.client
+        try:
+            now_ms = await self._redis_time_ms()
+            # Запас в половину хранения: журнал режется по часам следующих отзывов
+            if self._watermark is None or now_ms - self._watermark >= self.LOG_RETENTION_MS // 2:
+                # Отметка до чтения: отзывы во время загрузки попадут в следующий проход
+                watermark = now_ms
+                entries = await client.zrangebyscore(self.REDIS_KEY, now_ms / 1000, "+inf", withscores=True)
+                self._revoked.update({jti: int(exp) for jti, exp in entries})
+                self.full_loads += 1
+            else:
+                # Граница включительно: записи с тем же очком придут повторно, это безвредно
+                log = await client.zrangebyscore(self.LOG_KEY, self._watermark, "+inf", withscores=True)
+                watermark = max([self._watermark] + [int(score) for _, score in log])
+                entries = []
+                for member, _ in log:
+                    jti, _, exp = member.rpartition(":")
+                    entries.append((jti, exp))
+                    self._revoked[jti] = int(exp)
+        except RedisError as e:
+            self.errors += 1
+            logger.warning("Could not sync token revocations: %s", e)
+            return 0
+        self._watermark = watermark
+        self.synced_entries += len(entries)
+        self._prune(time.time())
+        return len(entries)
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Token revocation sync failed: %s", e, exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever(), name="token-revocations")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self._revoked),
+            "full_loads": self.full_loads,
+            "synced_entries": self.synced_entries,
+            "errors": self.errors,
+        }
+
+
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_SIZE)
+revoked_tokens = RevocationSet(settings.REVOCATION_SYNC_SECONDS)
+
+
+def extract_bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+def verify_access_token(token: str) -> TokenClaims:
+    """Проверка токена через кэш проверенных токенов"""
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = decode_access_token(token)
+        token_cache.put(token, claims)
+    return claims
+
+
+async def get_current_claims(authorization: str = Header(None)) -> TokenClaims:
+    """
+    FastAPI dependency: identity текущего пользователя из Bearer-токена.
+    
+    Не делает запросов к БД - пользователь определяется по claims.
+    """
+    token = extract_bearer_token(authorization)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing authorization header",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        claims = verify_access_token(token)
+    except jwt.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if revoked_tokens.is_revoked(claims.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return claims
@@ -0,0 +1,145 @@
+"""
+Сериализация ответов API.
+
+Каждое представление модели описано один раз (поле ответа -> атрибут) и
+компилируется в функцию, возвращающую dict-литерал: никаких циклов по
+полям, getattr и isinstance на каждый объект. Функции принимают и
+ORM-объекты, и строки select(...) с теми же именами колонок.
+
+Значения отдаются "как есть" (UUID, datetime, Enum): их кодирует orjson
+в ORJSONResponse, поэтому str()/isoformat() в Python не нужны. Ответ
+ORJSONResponse, возвращённый из обработчика напрямую, минует
+jsonable_encoder FastAPI.
+"""
+from typing import Any, Callable, Dict
+
+from fastapi.responses import ORJSONResponse
+
+
+class Expr(str):
+    """Выражение от obj вместо имени атрибута: Expr("obj.username or 'Member'")"""
+
+
+def compile_serializer(name: str, fields: Dict[str, str]) -> Callable[[Any], dict]:
+    """Собрать функцию obj -> dict по описанию {поле ответа: атрибут | Expr}"""
+    items = []
+    for key, source in fields.items():
+        if isinstance(source, Expr):
+            expression = source
+        elif source.isidentifier():
+            expression = f"obj.{source}"
+        else:
+            raise ValueError(f"{name}.{key}: {source!r} is not an attribute name")
+        items.append(f"{key!r}: {expression}")
+
+    source_code = f"def {name}(obj):\n    return {{{', '.join(items)}}}\n"
+    namespace: Dict[str, Any] = {}
+    exec(compile(source_code, f"<serializer {name}>", "exec"), namespace)
+    serializer = namespace[name]
+    serializer.fields = tuple(fields)
+    return serializer
+
+
+# -- User -------------------------------------------------------------------
+
+USER_PUBLIC_FIELDS = {
+    "id": "id",
+    "username": "username",
+    "referral_code": "referral_code",
+    "avatar_url": "avatar_url",
+    "is_verified": "is_verified",
+    "created_at": "created_at",
+    "clan_name": "clan_name",
+}
+
+# Владелец профиля: /users/me, /users/me/refresh, /auth/callback
+user_private = compile_serializer("user_private", {
+    **USER_PUBLIC_FIELDS,
+    "telegram_id": "telegram_id",
+    "up_coins": "up_coins",
+    "role": "role",
+    "is_active": "is_active",
+    "last_login": "last_login",
+})
+
+user_public = compile_serializer("user_public", USER_PUBLIC_FIELDS)
+
+# /users/profile/{user_id} (исторические имена полей coins/ref_code)
+user_profile = compile_serializer("user_profile", {
+    "id": "id",
+    "username": "username",
+    "coins": "up_coins",
+    "clan_name": "clan_name",
+    "avatar_url": "avatar_url",
+    "ref_code": "referral_code",
+    "role": "role",
+    "created_at": "created_at",
+})
+
+# Публичная карточка /users/u/{referral_code}
+user_public_card = compile_serializer("user_public_card", {
+    "id": "id",
+    "full_name": Expr("obj.username or 'Member'"),
+    "role": "role",
+    "created_at": "created_at",
+    "achievements_count": Expr("0"),  # Placeholder для расширения в будущем
+    "referral_code": "referral_code",
+    "photo_url": "avatar_url",
+    "telegram_id": "telegram_id",
+})
+
+
+# -- Product ----------------------------------------------------------------
+
+PRODUCT_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "description": "description",
+    "price": "price",
+    "image_url": "image_url",
+    "type": "product_type",
+}
+
+product_item = compile_serializer("product_item", PRODUCT_FIELDS)
+product_detail = compile_serializer("product_detail", {**PRODUCT_FIELDS, "stock": "stock"})
+
+
+# -- Order ------------------------------------------------------------------
+
+order_item = compile_serializer("order_item", {
+    "id": "id",
+    "product_id": "product_id",
+    "status": "status",
+    "amount_rub": "amount_rub",
+    "coins_used": "coins_used",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+})
+
+
+# -- Card -------------------------------------------------------------------
+
+card_item = compile_serializer("card_item", {
+    "id": "id",
+    "name": "name",
+    "description": "description",
+    "image_url": "image_url",
+    "rarity": "rarity",
+    "power": "power",
+    "clan": "clan",
+})
+
+
+# -- Event ------------------------------------------------------------------
+
+event_item = compile_serializer("event_item", {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "start_date": "start_date",
+    "end_date": "end_date",
+    "location": "location",
+    "price": "price",
+    "image_url": "image_url",
+    "capacity": "capacity",
+})
@@ -0,0 +1,84 @@
+"""
+Профиль запуска воркера: сколько времени заняли импорты, сборка приложения,
+прогрев пула соединений и прочие шаги lifespan.
+
+Первый импорт модуля задаёт точку отсчёта, поэтому app.main импортирует его
+раньше всего остального. При gunicorn --preload импорты и сборка приложения
+выполняются один раз в мастере; воркеры наследуют эти замеры после fork и
+добавляют свои (forked_at отмечает момент fork).
+
+Отчёт: GET /health/startup и gauges up_startup_*{name="worker"} в /metrics.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.started_at = time.perf_counter()
+        self.forked_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self._last_checkpoint = self.started_at
+
+    def checkpoint(self, name: str) -> None:
+        """Записать время, прошедшее с предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases[name] = now - self._last_checkpoint
+        self._last_checkpoint = now
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases[name] = now - started
+            self._last_checkpoint = now
+
+    def after_fork(self) -> None:
+        self.pid = os.getpid()
+        self.forked_at = time.perf_counter()
+        self.ready_at = None
+        self._last_checkpoint = self.forked_at
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+        logger.info(
+            "Worker ready in %.0f ms",
+            self.stats()["ready_seconds"] * 1000,
+            extra={"startup_phases_ms": {k: round(v * 1000, 1) for k, v in self.phases.items()}},
+        )
+
+    def report(self) -> dict:
+        """Разбивка по фазам в миллисекундах"""
+        stats = self.stats()
+        return {
+            "pid": self.pid,
+            "preloaded": self.forked_at is not None,
+            "ready": self.ready_at is not None,
+            "ready_ms": round(stats["ready_seconds"] * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+        }
+
+    def stats(self) -> dict:
+        """Плоский числовой вид для register_stats (секунды)"""
+        # Для воркера после fork готовность считается от fork, а не от старта мастера
+        origin = self.forked_at if self.forked_at is not None else self.started_at
+        ready = (self.ready_at - origin) if self.ready_at is not None else 0.0
+        stats = {"ready_seconds": ready}
+        stats.update({f"{name}_seconds": seconds for name, seconds in self.phases.items()})
+        return stats
+
+
+startup_profile = StartupProfile()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=startup_profile.after_fork)
@@ -0,0 +1,63 @@
+"""
+Колбэки после commit сессии.
+
+Позволяет из mapper events (где нет async) запланировать побочные эффекты -
+инвалидацию кэша, обновление Redis-структур - строго после успешного commit.
+При rollback накопленные колбэки отбрасываются.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_AFTER_COMMIT = "after_commit_callbacks"
+
+# Ссылки на запущенные задачи, чтобы их не собрал GC до завершения
+_background_tasks: Set[asyncio.Task] = set()
+
+AsyncCallback = Callable[[], Awaitable[None]]
+SyncCallback = Callable[[], None]
+
+
+def after_commit(
+    session: Session,
+    async_callback: AsyncCallback,
+    sync_callback: Optional[SyncCallback] = None,
+) -> None:
+    """
+    Выполнить колбэк после commit сессии.
+    
+    Внутри event loop запускается async_callback, вне его (скрипты) -
+    sync_callback, если он задан.
+    """
+    session.info.setdefault(_AFTER_COMMIT, []).append((async_callback, sync_callback))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session):
+    callbacks: List[Tuple[AsyncCallback, Optional[SyncCallback]]] = session.info.pop(_AFTER_COMMIT, [])
+    if not callbacks:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    for async_callback, sync_callback in callbacks:
+        if loop is not None:
+            task = loop.create_task(async_callback())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        elif sync_callback is not None:
+            try:
+                sync_callback()
+            except Exception as e:
+                logger.warning("after_commit callback failed: %s", e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session):
+    session.info.pop(_AFTER_COMMIT, None)
@@ -0,0 +1,97 @@
+"""
+Учёт SQL-запросов на уровне HTTP-запроса.
+
+События движка (before/after_cursor_execute) считают число запросов и
+суммарное время в БД для текущего HTTP-запроса (QueryStats в contextvar,
+его выставляет QueryAccountingMiddleware). Дополнительно:
+- запросы дольше SLOW_QUERY_MS пишутся в лог вместе с маршрутом;
+- одинаковый текст запроса, повторённый N_PLUS_ONE_THRESHOLD раз за
+  один HTTP-запрос, помечается как вероятный N+1.
+
+Контекст доступен и для AsyncEngine: SQLAlchemy запускает greenlet
+драйвера с контекстом вызывающей корутины.
+"""
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STARTED = "query_started_at"
+
+
+class QueryStats:
+    """Статистика SQL одного HTTP-запроса"""
+
+    __slots__ = ("scope", "count", "total_seconds", "statements")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statements: Counter = Counter()
+
+    @property
+    def route(self) -> str:
+        if self.scope is None:
+            return "background"
+        return getattr(self.scope.get("route"), "path", None) or "unmatched"
+
+
+query_stats_var: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STARTED, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info[_STARTED].pop()
+    stats = query_stats_var.get()
+
+    if stats is not None:
+        stats.count += 1
+        stats.total_seconds += elapsed
+        stats.statements[statement] += 1
+        if stats.statements[statement] == settings.N_PLUS_ONE_THRESHOLD:
+            logger.warning(
+                "Suspected N+1 query pattern",
+                extra={
+                    "route": stats.route,
+                    "repeats": settings.N_PLUS_ONE_THRESHOLD,
+                    "statement": statement[:500],
+                },
+            )
+
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query",
+            extra={
+                "route": stats.route if stats is not None else "background",
+                "duration_ms": round(elapsed * 1000, 2),
+                "statement": statement[:500],
+            },
+        )
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается при ошибке - снимаем отметку времени здесь
+    connection = exception_context.connection
+    if connection is not None:
+        started = connection.info.get(_STARTED)
+        if started:
+            started.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Подключить учёт к движку (для AsyncEngine - к его sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,33 @@
+"""
+Пулы соединений с замером ожидания checkout.
+
+Стандартные события пула срабатывают уже после получения соединения,
+поэтому время ожидания свободного соединения меряется вокруг _do_get.
+"""
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.metrics import DB_POOL_WAIT
+
+
+class TimedQueuePool(QueuePool):
+    engine_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.labels(self.engine_label).observe(time.perf_counter() - started)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.labels(self.engine_label).observe(time.perf_counter() - started)
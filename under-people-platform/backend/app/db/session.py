@@ -1,12 +1,22 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import os
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.metrics import register_pool
+from app.db.instrumentation import instrument_engine
+from app.db.pool import TimedAsyncQueuePool, TimedQueuePool
 
+# Синхронный движок - для миграций, скриптов и CLI-инструментов
 engine = create_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
-    pool_size=20,
-    max_overflow=40,
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     pool_pre_ping=True,
 )
 
@@ -16,9 +26,83 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+# Асинхронный движок (asyncpg) - для всех HTTP-обработчиков,
+# чтобы запросы к БД не блокировали event loop воркера
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    echo=settings.DEBUG,
+    poolclass=TimedAsyncQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+register_pool("sync", lambda: engine.pool)
+register_pool("async", lambda: async_engine.sync_engine.pool)
+
+logger = logging.getLogger(__name__)
+
+
+def _dispose_pools_after_fork() -> None:
+    """
+    При gunicorn --preload соединения, открытые в мастере, не должны
+    использоваться воркерами: close=False бросает их без закрытия сокетов
+    родителя, дочерний процесс открывает свои.
+    """
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_pools_after_fork)
+
+
+async def warm_async_pool(size: int) -> int:
+    """
+    Открыть size соединений одновременно и вернуть их в пул, чтобы первые
+    запросы воркера не платили за установку соединения (TCP + TLS + auth).
+    Возвращает число прогретых соединений.
+    """
+    size = min(size, settings.DB_POOL_SIZE)
+    if size <= 0:
+        return 0
+
+    async def _checkout():
+        conn = await async_engine.connect()
+        try:
+            await conn.execute(text("SELECT 1"))
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    # Держим все соединения до конца, иначе пул переиспользует первое же вернувшееся
+    results = await asyncio.gather(*(_checkout() for _ in range(size)), return_exceptions=True)
+    connections = [r for r in results if not isinstance(r, BaseException)]
+    await asyncio.gather(*(conn.close() for conn in connections))
+    failed = len(results) - len(connections)
+    if failed:
+        logger.warning("Pool warmup: %d of %d connections failed: %s", failed, size,
+                       next(r for r in results if isinstance(r, BaseException)))
+    return len(connections)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
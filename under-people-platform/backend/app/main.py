@@ -1,40 +1,98 @@
-from fastapi import FastAPI, Request
+# Первым - точка отсчёта профиля запуска
+from app.core.startup import startup_profile
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.db.base import Base
-from app.db.session import engine
-from app.routers import auth, users, products, events
-
-# Rate limiting (optionally install slowapi)
-try:
-    from slowapi import Limiter
-    from slowapi.util import get_remote_address
-    from slowapi.errors import RateLimitExceeded
-    
-    limiter = Limiter(key_func=get_remote_address)
-    RATE_LIMITING_ENABLED = True
-except ImportError:
-    RATE_LIMITING_ENABLED = False
-    print("⚠️ slowapi not installed - rate limiting disabled")
-
-# Создаем таблицы
-Base.metadata.create_all(bind=engine)
+from app.core.logging_config import setup_logging
+from app.core.metrics import MetricsMiddleware, register_stats, render_metrics
+from app.core.middleware import QueryAccountingMiddleware, RequestContextMiddleware
+from app.core.rate_limit import RateLimitMiddleware, rate_limiter
+from app.core.security import check_secret_key, revoked_tokens
+from app.core.serializers import ORJSONResponse
+from app.db.session import warm_async_pool
+from app.routers import auth, users, products, events, cards, market, orders, referrals
+from app.services.leaderboard import leaderboard
+from app.services.flash_sale import booking_releaser, flash_sale
+from app.services.ledger import ledger_snapshotter
+from app.services.maintenance import auth_code_sweeper
+from app.services.packs import pack_engine
+
+startup_profile.checkpoint("imports")
+
+setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_SAMPLING)
+logger = logging.getLogger(__name__)
+# Воркер с известным ключом подписи токенов не стартует
+check_secret_key()
+
+_warmup_tasks = set()
+
+async def warm_leaderboard():
+    # Лидерборд в Redis строится из БД один раз (первым стартовавшим воркером)
+    try:
+        with startup_profile.phase("leaderboard"):
+            await leaderboard.ensure_loaded()
+    except Exception as e:
+        logger.warning("Leaderboard warmup skipped: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновое обслуживание: очистка истёкших/использованных auth_codes
+    auth_code_sweeper.start()
+    # Освобождение просроченных броней товаров
+    booking_releaser.start()
+    # Запись заказов батчами (контекст задачи не зависит от запросов)
+    flash_sale.start()
+    # Снимки балансов UP Coins по журналу
+    ledger_snapshotter.start()
+    # Фоновый сброс локально пропущенных запросов в счётчики rate limit
+    rate_limiter.start()
+    # Отозванные токены: полная загрузка до приёма трафика, дальше - журнал в фоне
+    await revoked_tokens.sync()
+    revoked_tokens.start()
+    # Периодическая сверка лидерборда с БД
+    leaderboard.start()
+    # Соединения с БД открываются до приёма трафика, а не на первых запросах
+    with startup_profile.phase("pool_warmup"):
+        try:
+            await warm_async_pool(settings.DB_POOL_WARMUP)
+        except Exception as e:
+            logger.warning("Pool warmup skipped: %s", e)
+    if settings.FAST_BOOT:
+        # Воркер принимает запросы сразу; /leaderboard до готовности Redis читает из БД
+        task = asyncio.create_task(warm_leaderboard())
+        _warmup_tasks.add(task)
+        task.add_done_callback(_warmup_tasks.discard)
+    else:
+        await warm_leaderboard()
+    startup_profile.mark_ready()
+    yield
+    await auth_code_sweeper.stop()
+    await booking_releaser.stop()
+    await ledger_snapshotter.stop()
+    await rate_limiter.stop()
+    await leaderboard.stop()
+    await revoked_tokens.stop()
+    await flash_sale.stop()
 
 app = FastAPI(
     title=settings.API_TITLE,
     version=settings.API_VERSION,
     debug=settings.DEBUG,
+    lifespan=lifespan,
+    # orjson вместо stdlib json для всех ответов без явного Response
+    default_response_class=ORJSONResponse,
 )
 
-# Rate limiting
-if RATE_LIMITING_ENABLED:
-    app.state.limiter = limiter
-    @app.exception_handler(RateLimitExceeded)
-    async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
-        return {
-            "detail": "Too many requests. Rate limit exceeded.",
-            "retry_after": exc.detail
-        }
+# Rate limiting (общий счётчик в Redis; внутри CORS, чтобы 429 нёс CORS-заголовки)
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    trusted_proxies=settings.RATE_LIMIT_TRUSTED_PROXIES,
+)
 
 # CORS
 app.add_middleware(
@@ -45,16 +103,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Учёт SQL-запросов на HTTP-запрос (заголовки X-DB-* только в DEBUG)
+app.add_middleware(QueryAccountingMiddleware, expose_headers=settings.DEBUG)
+
+# Метрики HTTP (latency по шаблону маршрута, in-flight)
+app.add_middleware(MetricsMiddleware)
+
+# Request ID для структурированных логов (внешний слой - оборачивает всё остальное)
+app.add_middleware(RequestContextMiddleware)
+
 # Routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(products.router, prefix="/api")
 app.include_router(events.router, prefix="/api")
+app.include_router(cards.router, prefix="/api")
+app.include_router(market.router, prefix="/api")
+app.include_router(orders.router, prefix="/api")
+app.include_router(referrals.router, prefix="/api")
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "message": "Under People API is running"}
 
+register_stats("cache", "products", products.product_cache.stats)
+register_stats("cache", "public_profiles", users.public_profile_cache.stats)
+register_stats("sweeper", "auth_codes", auth_code_sweeper.stats)
+register_stats("startup", "worker", startup_profile.stats)
+register_stats("ratelimit", "http", rate_limiter.stats)
+register_stats("packs", "cards", pack_engine.stats)
+register_stats("orders", "flash_sale", flash_sale.stats)
+register_stats("sweeper", "reservations", booking_releaser.stats)
+register_stats("ledger", "snapshots", ledger_snapshotter.stats)
+register_stats("leaderboard", "redis", leaderboard.stats)
+register_stats("auth", "revocations", revoked_tokens.stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus exposition format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/health/cache")
+async def cache_stats():
+    """Счётчики попаданий/промахов кэшей текущего воркера"""
+    return {
+        "products": products.product_cache.stats(),
+        "public_profiles": users.public_profile_cache.stats(),
+    }
+
+@app.get("/health/startup")
+async def startup_report():
+    """Разбивка времени запуска текущего воркера по фазам"""
+    return startup_profile.report()
+
 @app.get("/")
 async def root():
     return {
@@ -63,6 +165,8 @@ async def root():
         "status": "running"
     }
 
+startup_profile.checkpoint("app_build")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
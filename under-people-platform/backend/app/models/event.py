@@ -1,6 +1,6 @@
 """Events database model."""
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Index
 from app.db.base import Base
 
 
@@ -20,3 +20,8 @@ class Event(Base):
     is_active = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Keyset pagination: WHERE is_active = 1 AND (start_date, id) > (:d, :id)
+        Index('ix_events_active_start_id', 'is_active', 'start_date', 'id'),
+    )
@@ -0,0 +1,50 @@
+"""
+Migration: Initial schema
+
+This migration:
+1. Creates every table declared on Base.metadata that does not exist yet
+   (replaces the create_all() call that used to run at app import)
+
+Existing databases are left untouched: create_all() checks each table
+first, so the migration only records the baseline in schema_migrations.
+
+Version: 001
+"""
+
+from sqlalchemy.orm import Session
+import logging
+
+from app.db.base import Base
+import app.models.event  # noqa: F401 - register events table
+import app.models.models  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(session: Session):
+    """Upgrade: Create base tables"""
+    
+    try:
+        logger.info("🔄 Creating base tables...")
+        Base.metadata.create_all(bind=session.connection())
+        session.commit()
+        logger.info("✅ Base tables are in place")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop all tables"""
+    
+    try:
+        Base.metadata.drop_all(bind=session.connection())
+        session.commit()
+        logger.info("✅ Dropped base tables")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
@@ -14,7 +14,6 @@ Date: 2024
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,96 +25,73 @@ def upgrade(session: Session):
     try:
         # 1. Add columns to users table if they don't exist
         logger.info("🔄 Adding is_verified column to users table...")
-        try:
-            session.execute(text("""
-                ALTER TABLE users ADD COLUMN is_verified BOOLEAN DEFAULT FALSE;
-            """))
-            logger.info("✅ Added is_verified column")
-        except Exception as e:
-            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
-                logger.info("✓ is_verified column already exists")
-            else:
-                raise
+        session.execute(text("""
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS is_verified BOOLEAN DEFAULT FALSE;
+        """))
+        logger.info("✅ is_verified column is in place")
 
         logger.info("🔄 Adding updated_at column to users table...")
-        try:
-            session.execute(text("""
-                ALTER TABLE users ADD COLUMN updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
-            """))
-            logger.info("✅ Added updated_at column")
-        except Exception as e:
-            if "already exists" in str(e).lower() or "duplicate" in str(e).lower():
-                logger.info("✓ updated_at column already exists")
-            else:
-                raise
-
-        # 2. Alter telegram_id to BIGINT
+        session.execute(text("""
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+        """))
+        logger.info("✅ updated_at column is in place")
+
+        # 2. Alter telegram_id to BIGINT (only if it is still INTEGER -
+        # ALTER TYPE takes an ACCESS EXCLUSIVE lock even when nothing changes)
         logger.info("🔄 Altering telegram_id type to BIGINT...")
-        try:
-            session.execute(text("""
-                ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT;
-            """))
-            logger.info("✅ Altered telegram_id to BIGINT")
-        except Exception as e:
-            logger.warning(f"⚠️ Could not alter telegram_id type: {e}")
+        session.execute(text("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'users' AND column_name = 'telegram_id'
+                      AND data_type <> 'bigint'
+                ) THEN
+                    ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT;
+                END IF;
+            END $$;
+        """))
+        logger.info("✅ telegram_id is BIGINT")
 
         # 3. Create auth_codes table
         logger.info("🔄 Creating auth_codes table...")
-        try:
-            session.execute(text("""
-                CREATE TABLE IF NOT EXISTS auth_codes (
-                    id SERIAL PRIMARY KEY,
-                    code VARCHAR(255) UNIQUE NOT NULL,
-                    telegram_id BIGINT NOT NULL,
-                    user_id INTEGER,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
-                    used BOOLEAN DEFAULT FALSE,
-                    used_at TIMESTAMP WITH TIME ZONE,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
-                );
-            """))
-            logger.info("✅ Created auth_codes table")
-        except Exception as e:
-            if "already exists" in str(e).lower():
-                logger.info("✓ auth_codes table already exists")
-            else:
-                raise
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS auth_codes (
+                id SERIAL PRIMARY KEY,
+                code VARCHAR(255) UNIQUE NOT NULL,
+                telegram_id BIGINT NOT NULL,
+                user_id UUID,
+                username VARCHAR(255),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                used BOOLEAN DEFAULT FALSE,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+            );
+        """))
+        logger.info("✅ auth_codes table is in place")
 
         # 4. Create indexes for performance
         logger.info("🔄 Creating indexes...")
         
-        try:
-            session.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_auth_codes_code ON auth_codes(code);
-            """))
-            logger.info("✅ Created index on auth_codes.code")
-        except Exception as e:
-            logger.warning(f"⚠️ Could not create index on code: {e}")
-
-        try:
-            session.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_auth_codes_telegram_id ON auth_codes(telegram_id);
-            """))
-            logger.info("✅ Created index on auth_codes.telegram_id")
-        except Exception as e:
-            logger.warning(f"⚠️ Could not create index on telegram_id: {e}")
-
-        try:
-            session.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_auth_codes_user_id ON auth_codes(user_id);
-            """))
-            logger.info("✅ Created index on auth_codes.user_id")
-        except Exception as e:
-            logger.warning(f"⚠️ Could not create index on user_id: {e}")
-
-        try:
-            session.execute(text("""
-                CREATE INDEX IF NOT EXISTS idx_auth_codes_expires_at ON auth_codes(expires_at);
-            """))
-            logger.info("✅ Created index on auth_codes.expires_at")
-        except Exception as e:
-            logger.warning(f"⚠️ Could not create index on expires_at: {e}")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_auth_codes_code ON auth_codes(code);
+        """))
+        logger.info("✅ Created index on auth_codes.code")
+
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_auth_codes_telegram_id ON auth_codes(telegram_id);
+        """))
+        logger.info("✅ Created index on auth_codes.telegram_id")
+
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_auth_codes_user_id ON auth_codes(user_id);
+        """))
+        logger.info("✅ Created index on auth_codes.user_id")
+
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_auth_codes_expires_at ON auth_codes(expires_at);
+        """))
+        logger.info("✅ Created index on auth_codes.expires_at")
 
         session.commit()
         logger.info("✅ Migration completed successfully!")
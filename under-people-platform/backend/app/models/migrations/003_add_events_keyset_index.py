@@ -0,0 +1,47 @@
+"""
+Migration: Composite index for events keyset pagination
+
+This migration:
+1. Creates (is_active, start_date, id) index on events so that
+   /api/v1/events/upcoming?cursor=... is an index range scan
+
+Version: 003
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(session: Session):
+    """Upgrade: Add composite keyset index on events"""
+    
+    try:
+        logger.info("🔄 Creating ix_events_active_start_id...")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_events_active_start_id
+            ON events (is_active, start_date, id);
+        """))
+        session.commit()
+        logger.info("✅ Created ix_events_active_start_id")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop composite keyset index"""
+    
+    try:
+        session.execute(text("DROP INDEX IF EXISTS ix_events_active_start_id;"))
+        session.commit()
+        logger.info("✅ Dropped ix_events_active_start_id")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
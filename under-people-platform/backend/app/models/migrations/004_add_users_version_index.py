@@ -0,0 +1,54 @@
+"""
+Migration: Covering index for /users/me ETag validation
+
+This migration:
+1. Creates ix_users_id_version on users(id) INCLUDE (updated_at) so the
+   ETag check is an index-only scan
+2. Backfills NULL updated_at values (ETag version source)
+
+Version: 004
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(session: Session):
+    """Upgrade: Add covering version index on users"""
+    
+    try:
+        logger.info("🔄 Backfilling users.updated_at...")
+        session.execute(text("""
+            UPDATE users SET updated_at = COALESCE(last_login, created_at, CURRENT_TIMESTAMP)
+            WHERE updated_at IS NULL;
+        """))
+        
+        logger.info("🔄 Creating ix_users_id_version...")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_users_id_version
+            ON users (id) INCLUDE (updated_at);
+        """))
+        session.commit()
+        logger.info("✅ Created ix_users_id_version")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop covering version index"""
+    
+    try:
+        session.execute(text("DROP INDEX IF EXISTS ix_users_id_version;"))
+        session.commit()
+        logger.info("✅ Dropped ix_users_id_version")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
@@ -0,0 +1,47 @@
+"""
+Migration: Index for leaderboard queries
+
+This migration:
+1. Creates ix_users_active_coins on users(is_active, up_coins) used by the
+   SQL fallback of /users/leaderboard and by the Redis leaderboard rebuild
+
+Version: 005
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(session: Session):
+    """Upgrade: Add leaderboard index on users"""
+    
+    try:
+        logger.info("🔄 Creating ix_users_active_coins...")
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_users_active_coins
+            ON users (is_active, up_coins);
+        """))
+        session.commit()
+        logger.info("✅ Created ix_users_active_coins")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop leaderboard index"""
+    
+    try:
+        session.execute(text("DROP INDEX IF EXISTS ix_users_active_coins;"))
+        session.commit()
+        logger.info("✅ Dropped ix_users_active_coins")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
@@ -0,0 +1,158 @@
+"""
+Migration: Denormalized filter columns and browse indexes for market_listings
+
+This migration:
+1. upgrade: adds card_id, rarity, clan to market_listings (copied from
+   user_cards/cards) so /api/market/listings filters without joining
+   user_cards and cards
+2. backfill (outside the upgrade transaction, one commit per 50k-row
+   batch): fills the columns, deletes orphan listings whose user_card_id
+   is NULL or points to no card (they cannot be bought anyway; their ids
+   are logged), then makes the columns NOT NULL (created_at too - it is
+   a keyset column)
+3. backfill: creates one composite index per supported filter/sort
+   combination
+
+Version: 006
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH = 50_000
+
+INDEXES = {
+    "ix_market_price_id": "(price, id)",
+    "ix_market_rarity_price_id": "(rarity, price, id)",
+    "ix_market_clan_price_id": "(clan, price, id)",
+    "ix_market_rarity_clan_price_id": "(rarity, clan, price, id)",
+    "ix_market_created_id": "(created_at, id) INCLUDE (price)",
+    "ix_market_rarity_created_id": "(rarity, created_at, id) INCLUDE (price)",
+    "ix_market_clan_created_id": "(clan, created_at, id) INCLUDE (price)",
+    "ix_market_rarity_clan_created_id": "(rarity, clan, created_at, id) INCLUDE (price)",
+}
+
+
+def upgrade(session: Session):
+    """Upgrade: Add denormalized card attribute columns"""
+    
+    try:
+        logger.info("🔄 Adding card_id, rarity, clan to market_listings...")
+        session.execute(text("""
+            ALTER TABLE market_listings
+                ADD COLUMN IF NOT EXISTS card_id INTEGER REFERENCES cards(id),
+                ADD COLUMN IF NOT EXISTS rarity rarity,
+                ADD COLUMN IF NOT EXISTS clan VARCHAR;
+        """))
+        session.commit()
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def backfill(session: Session):
+    """Backfill: Fill card attributes in batches, then NOT NULL and indexes"""
+    
+    try:
+        logger.info("🔄 Backfilling market_listings...")
+        total = 0
+        orphans = 0
+        last_id = 0
+        while True:
+            batch = session.execute(text("""
+                SELECT id FROM market_listings
+                WHERE id > :last_id
+                  AND (card_id IS NULL OR rarity IS NULL OR clan IS NULL OR created_at IS NULL)
+                ORDER BY id
+                LIMIT :batch
+            """), {"last_id": last_id, "batch": BACKFILL_BATCH}).scalars().all()
+            if not batch:
+                break
+            last_id = batch[-1]
+            
+            total += session.execute(text("""
+                UPDATE market_listings ml
+                SET card_id = uc.card_id,
+                    rarity = COALESCE(c.rarity, 'COMMON'),
+                    clan = COALESCE(c.clan, 'Outcasts'),
+                    created_at = COALESCE(ml.created_at, now())
+                FROM user_cards uc
+                JOIN cards c ON c.id = uc.card_id
+                WHERE uc.id = ml.user_card_id AND ml.id = ANY(:ids)
+            """), {"ids": batch}).rowcount
+            
+            # Лоты без карты (user_card_id NULL или висячий) заполнить нечем
+            deleted = session.execute(text("""
+                DELETE FROM market_listings ml
+                WHERE ml.id = ANY(:ids)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM user_cards uc JOIN cards c ON c.id = uc.card_id
+                      WHERE uc.id = ml.user_card_id
+                  )
+                RETURNING ml.id, ml.user_card_id
+            """), {"ids": batch}).all()
+            if deleted:
+                orphans += len(deleted)
+                logger.warning(
+                    "⚠️ Deleted orphan listings (id, user_card_id): "
+                    + ", ".join(f"({row.id}, {row.user_card_id})" for row in deleted)
+                )
+            session.commit()
+        logger.info(f"✅ Backfilled {total} listings, deleted {orphans} orphans")
+        
+        unfilled = session.execute(text("""
+            SELECT count(*) FROM market_listings
+            WHERE card_id IS NULL OR rarity IS NULL OR clan IS NULL OR created_at IS NULL
+        """)).scalar()
+        if unfilled:
+            raise RuntimeError(f"{unfilled} listings still have NULL card attributes - rerun the migration")
+        
+        session.execute(text("""
+            ALTER TABLE market_listings
+                ALTER COLUMN card_id SET NOT NULL,
+                ALTER COLUMN rarity SET NOT NULL,
+                ALTER COLUMN clan SET NOT NULL,
+                ALTER COLUMN created_at SET NOT NULL;
+        """))
+        session.commit()
+        
+        for name, columns in INDEXES.items():
+            logger.info(f"🔄 Creating {name}...")
+            session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON market_listings {columns};"))
+            session.commit()
+        
+        session.execute(text("ANALYZE market_listings;"))
+        session.commit()
+        logger.info("✅ market_listings browse indexes created")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Backfill failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop browse indexes and denormalized columns"""
+    
+    try:
+        for name in INDEXES:
+            session.execute(text(f"DROP INDEX IF EXISTS {name};"))
+        session.execute(text("""
+            ALTER TABLE market_listings
+                ALTER COLUMN created_at DROP NOT NULL,
+                DROP COLUMN IF EXISTS clan,
+                DROP COLUMN IF EXISTS rarity,
+                DROP COLUMN IF EXISTS card_id;
+        """))
+        session.commit()
+        logger.info("✅ Dropped market_listings denormalized columns")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
@@ -0,0 +1,53 @@
+"""
+Migration: Indexes for order reservations
+
+Flash-sale reservations (app.services.flash_sale) are PENDING orders:
+
+1. ix_orders_status_created - the releaser cancels PENDING orders older
+   than the reservation TTL (status = 'PENDING' AND created_at < :cutoff)
+2. ix_orders_user_created - GET /api/orders/ lists the user's orders,
+   newest first
+
+Version: 007
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "ix_orders_status_created": "(status, created_at)",
+    "ix_orders_user_created": "(user_id, created_at)",
+}
+
+
+def upgrade(session: Session):
+    """Upgrade: Create order indexes"""
+    
+    try:
+        for name, columns in INDEXES.items():
+            session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON orders {columns};"))
+            logger.info(f"✅ Created {name}")
+        session.commit()
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop order indexes"""
+    
+    try:
+        for name in INDEXES:
+            session.execute(text(f"DROP INDEX IF EXISTS {name};"))
+        session.commit()
+        logger.info("✅ Dropped order indexes")
+    
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
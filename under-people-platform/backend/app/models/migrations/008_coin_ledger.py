@@ -0,0 +1,125 @@
+"""
+Migration: Append-only coin ledger with balance snapshots
+
+UP Coin changes become entries in coin_ledger (app.services.ledger);
+users.up_coins stays as the projection of the ledger.
+
+1. coin_ledger - one row per balance change, entry_id is the idempotency
+   key (a repeated posting is a no-op); ix_coin_ledger_user_id_id covers
+   "entries of a user after the snapshot" with amount in the index
+2. coin_balance_snapshots - per-user balance folded up to last_entry_id
+3. backfill (outside the upgrade transaction, one commit per batch of
+   users): opening entries for existing users - "opening:<user id>" for
+   up_coins minus entries already posted by the new code while the
+   backfill runs, so ledger and projection agree from the start. Each
+   batch locks its users first and reads balances in the next statement,
+   so a concurrent posting is either fully seen or waits for the batch.
+
+Version: 008
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH = 5_000  # строки users под FOR UPDATE до commit пачки
+
+
+def upgrade(session: Session):
+    """Upgrade: Create ledger tables"""
+
+    try:
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS coin_ledger (
+                id BIGSERIAL PRIMARY KEY,
+                entry_id VARCHAR(128) NOT NULL UNIQUE,
+                user_id UUID NOT NULL REFERENCES users(id),
+                amount BIGINT NOT NULL,
+                reason VARCHAR(32) NOT NULL,
+                ref VARCHAR,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+            );
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_coin_ledger_user_id_id
+            ON coin_ledger (user_id, id) INCLUDE (amount);
+        """))
+        logger.info("✅ Created coin_ledger")
+
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS coin_balance_snapshots (
+                user_id UUID PRIMARY KEY REFERENCES users(id),
+                balance BIGINT NOT NULL,
+                last_entry_id BIGINT NOT NULL,
+                taken_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+            );
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_coin_balance_snapshots_last_entry_id
+            ON coin_balance_snapshots (last_entry_id);
+        """))
+        logger.info("✅ Created coin_balance_snapshots")
+        session.commit()
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def backfill(session: Session):
+    """Backfill: Opening entries for existing users"""
+
+    try:
+        total = 0
+        last_id = None
+        while True:
+            user_ids = session.execute(text("""
+                SELECT id FROM users
+                WHERE CAST(:last_id AS uuid) IS NULL OR id > CAST(:last_id AS uuid)
+                ORDER BY id
+                LIMIT :batch
+                FOR UPDATE
+            """), {"last_id": last_id, "batch": BACKFILL_BATCH}).scalars().all()
+            if not user_ids:
+                break
+            last_id = str(user_ids[-1])
+
+            total += session.execute(text("""
+                INSERT INTO coin_ledger (entry_id, user_id, amount, reason, created_at)
+                SELECT 'opening:' || o.id, o.id, o.amount, 'opening_balance', now()
+                FROM (
+                    SELECT u.id, COALESCE(u.up_coins, 0) - COALESCE((
+                               SELECT sum(l.amount) FROM coin_ledger l WHERE l.user_id = u.id
+                           ), 0) AS amount
+                    FROM users u
+                    WHERE u.id = ANY(CAST(:user_ids AS uuid[]))
+                      AND NOT EXISTS (SELECT 1 FROM coin_ledger l WHERE l.entry_id = 'opening:' || u.id)
+                ) o
+                WHERE o.amount <> 0
+                ON CONFLICT (entry_id) DO NOTHING
+            """), {"user_ids": [str(user_id) for user_id in user_ids]}).rowcount
+            session.commit()
+        logger.info(f"✅ Opening entries: {total}")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Backfill failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop ledger tables"""
+
+    try:
+        session.execute(text("DROP TABLE IF EXISTS coin_balance_snapshots;"))
+        session.execute(text("DROP TABLE IF EXISTS coin_ledger;"))
+        session.commit()
+        logger.info("✅ Dropped coin ledger tables")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
@@ -0,0 +1,78 @@
+"""
+Migration: Referral closure table and per-level counters
+
+Referral stats without recursive walks over users.invited_by_code
+(app.services.referrals):
+
+1. referral_closure - one row per (ancestor, descendant) pair with depth;
+   ix_referral_closure_descendant_depth serves linking a new user under
+   the inviter's ancestors, ix_referral_closure_ancestor_depth lists the
+   invitees of a level
+2. referral_level_counts - descendants per (user, depth)
+
+Existing users are linked by `python backfill_referrals.py` (set-based,
+one statement per tree level) - run it once after this migration.
+
+Version: 009
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(session: Session):
+    """Upgrade: Create referral tree tables"""
+
+    try:
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS referral_closure (
+                ancestor_id UUID NOT NULL REFERENCES users(id),
+                descendant_id UUID NOT NULL REFERENCES users(id),
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor_id, descendant_id)
+            );
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_referral_closure_descendant_depth
+            ON referral_closure (descendant_id, depth);
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_referral_closure_ancestor_depth
+            ON referral_closure (ancestor_id, depth);
+        """))
+        logger.info("✅ Created referral_closure")
+
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS referral_level_counts (
+                user_id UUID NOT NULL REFERENCES users(id),
+                depth INTEGER NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, depth)
+            );
+        """))
+        logger.info("✅ Created referral_level_counts")
+        session.commit()
+        logger.info("ℹ️ Run backfill_referrals.py to link existing users")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop referral tree tables"""
+
+    try:
+        session.execute(text("DROP TABLE IF EXISTS referral_level_counts;"))
+        session.execute(text("DROP TABLE IF EXISTS referral_closure;"))
+        session.commit()
+        logger.info("✅ Dropped referral tree tables")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
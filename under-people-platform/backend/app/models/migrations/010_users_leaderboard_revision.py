@@ -0,0 +1,54 @@
+"""
+Migration: Leaderboard revision counter on users
+
+The Redis leaderboard (app.services.leaderboard) applies updates from
+unordered after-commit tasks. Every write that changes up_coins, username,
+clan_name or is_active increments users.leaderboard_revision under the row
+lock, and Redis keeps only the highest revision per user, so a late update
+with an older balance is dropped.
+
+1. users.leaderboard_revision BIGINT NOT NULL DEFAULT 0 (metadata-only on
+   PostgreSQL 11+, no table rewrite)
+
+The leaderboard format version changes with this migration, so the first
+worker to start rebuilds the Redis structures.
+
+Version: 010
+"""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(session: Session):
+    """Upgrade: Add users.leaderboard_revision"""
+
+    try:
+        session.execute(text("""
+            ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS leaderboard_revision BIGINT NOT NULL DEFAULT 0;
+        """))
+        session.commit()
+        logger.info("✅ Added users.leaderboard_revision")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        raise
+
+
+def downgrade(session: Session):
+    """Downgrade: Drop users.leaderboard_revision"""
+
+    try:
+        session.execute(text("ALTER TABLE users DROP COLUMN IF EXISTS leaderboard_revision;"))
+        session.commit()
+        logger.info("✅ Dropped users.leaderboard_revision")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Downgrade failed: {e}")
+        raise
@@ -6,6 +6,7 @@ from enum import Enum as PyEnum
 from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Enum, Float, Text, event, BigInteger, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, backref
+from app.core.serializers import user_private, user_public
 from app.db.base import Base
 from urllib.parse import quote
 
@@ -49,6 +50,9 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     last_login = Column(DateTime(timezone=True), nullable=True)
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # Счётчик изменений полей лидерборда: растёт под блокировкой строки,
+    # Redis применяет только более новую ревизию (app.services.leaderboard)
+    leaderboard_revision = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     # Relationships
     referrals = relationship(
@@ -59,6 +63,13 @@ class User(Base):
     orders = relationship("Order", back_populates="user")
     cards = relationship("UserCard", back_populates="user")
     
+    __table_args__ = (
+        # Покрывающий индекс для ETag /users/me: index-only scan по (id) -> updated_at
+        Index('ix_users_id_version', 'id', postgresql_include=['updated_at']),
+        # Лидерборд: fallback-запрос и перестроение Redis ZSET
+        Index('ix_users_active_coins', 'is_active', 'up_coins'),
+    )
+    
     @staticmethod
     def generate_referral_code() -> str:
         """Генерирует уникальный referral_code в формате UP-XXXXXX"""
@@ -80,26 +91,12 @@ class User(Base):
             self.avatar_url = self.dicebear_avatar
     
     def to_public_dict(self) -> dict:
-        """Публичные данные для отображения"""
-        return {
-            "id": str(self.id),
-            "username": self.username,
-            "referral_code": self.referral_code,
-            "avatar_url": self.avatar_url,
-            "is_verified": self.is_verified,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "clan_name": self.clan_name,
-        }
+        """Публичные данные для отображения (UUID/datetime кодирует ORJSONResponse)"""
+        return user_public(self)
     
     def to_private_dict(self) -> dict:
         """Приватные данные для владельца профиля"""
-        return {
-            **self.to_public_dict(),
-            "telegram_id": self.telegram_id,
-            "up_coins": self.up_coins,
-            "role": self.role.value if hasattr(self.role, 'value') else str(self.role),
-            "last_login": self.last_login.isoformat() if self.last_login else None,
-        }
+        return user_private(self)
 
 
 class AuthCode(Base):
@@ -209,6 +206,13 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     product = relationship("Product")
 
+    __table_args__ = (
+        # Освобождение просроченных броней: PENDING старше TTL
+        Index('ix_orders_status_created', 'status', 'created_at'),
+        # Заказы пользователя, новые первыми
+        Index('ix_orders_user_created', 'user_id', 'created_at'),
+    )
+
 class MarketListing(Base):
     __tablename__ = "market_listings"
     
@@ -217,4 +221,90 @@ class MarketListing(Base):
     user_card_id = Column(Integer, ForeignKey("user_cards.id"), unique=True)
     price = Column(Integer, nullable=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Денормализовано из user_cards/cards: фильтры витрины без JOIN
+    # (заполняются при вставке, см. app.services.market)
+    card_id = Column(Integer, ForeignKey("cards.id"), nullable=False)
+    rarity = Column(Enum(Rarity), nullable=False)
+    clan = Column(String, nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        # Витрина /market/listings: для каждой комбинации фильтров (нет /
+        # rarity / clan / оба) и сортировки (цена / новизна) - свой индекс,
+        # keyset по (колонка сортировки, id) остаётся range scan.
+        Index('ix_market_price_id', 'price', 'id'),
+        Index('ix_market_rarity_price_id', 'rarity', 'price', 'id'),
+        Index('ix_market_clan_price_id', 'clan', 'price', 'id'),
+        Index('ix_market_rarity_clan_price_id', 'rarity', 'clan', 'price', 'id'),
+        # Сортировка по новизне: price в INCLUDE - фильтр по цене без чтения heap
+        Index('ix_market_created_id', 'created_at', 'id', postgresql_include=['price']),
+        Index('ix_market_rarity_created_id', 'rarity', 'created_at', 'id', postgresql_include=['price']),
+        Index('ix_market_clan_created_id', 'clan', 'created_at', 'id', postgresql_include=['price']),
+        Index('ix_market_rarity_clan_created_id', 'rarity', 'clan', 'created_at', 'id', postgresql_include=['price']),
+    )
+
+
+class CoinReason(str, PyEnum):
+    OPENING_BALANCE = "opening_balance"
+    PACK_OPEN = "pack_open"
+    MARKET_PURCHASE = "market_purchase"
+    MARKET_SALE = "market_sale"
+    REFERRAL_BONUS = "referral_bonus"
+    ADJUSTMENT = "adjustment"
+
+class CoinLedgerEntry(Base):
+    """
+    Журнал движения UP Coins (только INSERT). users.up_coins - проекция
+    журнала, обновляется в той же транзакции (app.services.ledger).
+    """
+    __tablename__ = "coin_ledger"
+    
+    id = Column(BigInteger, primary_key=True)
+    # Ключ идемпотентности: повторная проводка с тем же entry_id не применяется
+    entry_id = Column(String(128), nullable=False, unique=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    amount = Column(BigInteger, nullable=False)  # > 0 - зачисление, < 0 - списание
+    reason = Column(String(32), nullable=False)  # CoinReason.value
+    ref = Column(String, nullable=True)  # связанный объект: id лота, тип пака, приглашённый
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    __table_args__ = (
+        # Баланс = снимок + сумма записей после него: range scan по (user_id, id)
+        Index('ix_coin_ledger_user_id_id', 'user_id', 'id', postgresql_include=['amount']),
+    )
+
+class CoinBalanceSnapshot(Base):
+    """Баланс пользователя по журналу на момент записи last_entry_id"""
+    __tablename__ = "coin_balance_snapshots"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    balance = Column(BigInteger, nullable=False)
+    last_entry_id = Column(BigInteger, nullable=False, index=True)  # max - граница следующего прохода
+    taken_at = Column(DateTime(timezone=True), nullable=False)
+
+class ReferralClosure(Base):
+    """
+    Замыкание реферального дерева: строка на каждую пару (предок, потомок)
+    с расстоянием depth (1 - прямой приглашённый). Заполняется при создании
+    пользователя (app.services.referrals), для существующих - backfill_referrals.py.
+    """
+    __tablename__ = "referral_closure"
+    
+    ancestor_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    descendant_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    depth = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        # Предки пользователя (вставка нового потомка) и приглашённые уровня N
+        Index('ix_referral_closure_descendant_depth', 'descendant_id', 'depth'),
+        Index('ix_referral_closure_ancestor_depth', 'ancestor_id', 'depth'),
+    )
+
+class ReferralLevelCount(Base):
+    """Число потомков пользователя на каждом уровне - счётчики к referral_closure"""
+    __tablename__ = "referral_level_counts"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    depth = Column(Integer, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
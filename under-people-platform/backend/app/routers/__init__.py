@@ -1,4 +1,4 @@
 # Routers Init
-from . import auth, users, products
+from . import auth, users, products, events, cards, market, orders, referrals
 
-__all__ = ["auth", "users", "products"]
+__all__ = ["auth", "users", "products", "events", "cards", "market", "orders", "referrals"]
@@ -1,10 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
-from sqlalchemy.orm import Session
-from sqlalchemy import delete, and_
-from app.db.session import get_db
-from app.models.models import User, AuthCode
-from datetime import datetime, timedelta, timezone
-import uuid
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.core.config import settings
+from app.core.security import create_access_token, extract_bearer_token, revoked_tokens, verify_access_token
+from app.core.serializers import ORJSONResponse, user_private
+from app.db.session import get_async_db
+from app.services.auth_codes import auth_code_store
+from app.services.referrals import find_inviter
+from app.models.models import User
+from datetime import datetime, timezone
+from typing import Optional
+import jwt
 import logging
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -14,37 +20,33 @@ logger = logging.getLogger(__name__)
 @router.post("/callback")
 async def auth_callback(
     code: str = Query(...),
-    db: Session = Depends(get_db)
+    ref: Optional[str] = Query(None, max_length=32),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Обработка авторизации через Telegram
     
-    КРИТИЧНО: telegram_id берётся из БД по auth_code, НЕ из WebApp initData!
+    ref - referral_code пригласившего; учитывается только при создании
+    пользователя (неизвестный код игнорируется).
+    
+    КРИТИЧНО: telegram_id берётся из хранилища кодов, НЕ из WebApp initData!
     
     Flow:
     1. Получаем код из URL параметра
-    2. Ищем код в БД (AuthCode таблица)
+    2. Атомарно погашаем код (Redis GETDEL или UPDATE auth_codes)
     3. Извлекаем telegram_id из записи кода
     4. Создаём/обновляем пользователя
-    5. Помечаем код как использованный
-    6. Возвращаем токен
+    5. Возвращаем токен
     """
     
     try:
-        logger.info(f"🔐 [AUTH CALLBACK] Auth callback received with code: {code[:8]}...")
-        
-        # Шаг 1: Проверяем код в БД
-        now = datetime.now(timezone.utc)
-        auth_code = db.query(AuthCode).filter(
-            and_(
-                AuthCode.code == code,
-                AuthCode.used == False,
-                AuthCode.expires_at > now
-            )
-        ).first()
+        logger.debug("[AUTH CALLBACK] Auth callback received", extra={"code_prefix": code[:8]})
+        
+        # Шаг 1: Погашаем код - одноразовость гарантирует хранилище
+        auth_code = await auth_code_store.consume(db, code)
         
         if not auth_code:
-            logger.warning(f"❌ [AUTH CALLBACK] Invalid or expired auth code: {code[:8]}...")
+            logger.warning("[AUTH CALLBACK] Invalid or expired auth code", extra={"code_prefix": code[:8]})
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid or expired authorization code"
@@ -52,55 +54,59 @@ async def auth_callback(
         
         # Шаг 2: Извлекаем telegram_id из кода
         telegram_id = auth_code.telegram_id
-        logger.info(f"✅ [AUTH CALLBACK] Auth code validated for telegram_id: {telegram_id}")
         
         # Шаг 3: Ищем или создаём пользователя
-        user = db.query(User).filter(User.telegram_id == telegram_id).first()
+        result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+        user = result.scalars().first()
         
         if user:
             # Обновляем last_login
             user.last_login = datetime.now(timezone.utc)
             user.updated_at = datetime.now(timezone.utc)
             user.is_verified = True
-            logger.info(f"✅ [AUTH CALLBACK] Existing user logged in: {user.id}")
+            logger.debug("[AUTH CALLBACK] Existing user logged in", extra={"user_id": user.id})
         else:
-            # Создаём нового пользователя
+            # Создаём нового пользователя (реферальное дерево обновляет after_insert)
+            inviter_id = await find_inviter(db, ref)
             user = User(
                 telegram_id=telegram_id,
                 username=f"User_{telegram_id}",
                 up_coins=100,
+                invited_by_code=ref if inviter_id is not None else None,
                 last_login=datetime.now(timezone.utc),
                 is_verified=True
             )
             db.add(user)
-            db.flush()  # Получаем ID без commit
-            logger.info(f"✅ [AUTH CALLBACK] New user created: {user.id}, referral_code: {user.referral_code}")
-        
-        # Шаг 4: Помечаем код как использованный (одноразовый)
-        auth_code.used = True
-        auth_code.user_id = user.id
-        auth_code.used_at = datetime.now(timezone.utc)
+            await db.flush()  # Получаем ID без commit
+            logger.info(
+                "[AUTH CALLBACK] New user created",
+                extra={"user_id": user.id, "referral_code": user.referral_code, "invited_by": user.invited_by_code},
+            )
         
         # Commit всех изменений
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         
-        # Шаг 5: Генерируем простой токен (в production используйте JWT)
-        token = str(uuid.uuid4())
+        # Шаг 5: Выпускаем подписанный access-токен (identity без обращений к БД)
+        token = create_access_token(user)
         
-        logger.info(f"✅ [AUTH CALLBACK] Authentication successful for user {user.id}")
+        logger.info(
+            "[AUTH CALLBACK] Authentication successful",
+            extra={"user_id": user.id, "telegram_id": telegram_id},
+        )
         
-        return {
+        return ORJSONResponse({
             "status": "ok",
             "token": token,
-            "user": user.to_private_dict()
-        }
+            "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            "user": user_private(user),
+        })
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ [AUTH CALLBACK] Error: {str(e)}", exc_info=True)
-        db.rollback()
+        logger.error("[AUTH CALLBACK] Error: %s", e, exc_info=True)
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error during authentication"
@@ -110,7 +116,7 @@ async def auth_callback(
 @router.post("/generate-code")
 async def generate_auth_code(
     telegram_id: int = Query(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Endpoint для бота: генерирует одноразовый код авторизации
@@ -123,36 +129,27 @@ async def generate_auth_code(
     """
     
     try:
-        logger.info(f"🔐 [GENERATE CODE] Generating auth code for telegram_id: {telegram_id}")
-        
         # Ищем пользователя в БД
-        user = db.query(User).filter(User.telegram_id == telegram_id).first()
-        
-        # Генерируем одноразовый код
-        code = str(uuid.uuid4())
-        expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
-        
-        # Сохраняем в БД
-        auth_code = AuthCode(
-            code=code,
-            telegram_id=telegram_id,
-            user_id=user.id if user else None,
-            expires_at=expires_at
-        )
-        db.add(auth_code)
-        db.commit()
+        result = await db.execute(select(User.id).where(User.telegram_id == telegram_id))
+        user_id = result.scalar_one_or_none()
         
-        logger.info(f"✅ [GENERATE CODE] Auth code generated: {code[:8]}... for telegram_id: {telegram_id}")
+        # Генерируем одноразовый код (Redis с TTL, либо таблица auth_codes)
+        code = await auth_code_store.issue(db, telegram_id, user_id)
+        
+        logger.info(
+            "[GENERATE CODE] Auth code generated",
+            extra={"code_prefix": code[:8], "telegram_id": telegram_id},
+        )
         
         return {
             "status": "ok",
             "code": code,
-            "expires_in": 600  # 10 минут в секундах
+            "expires_in": settings.AUTH_CODE_TTL_SECONDS
         }
     
     except Exception as e:
-        logger.error(f"❌ [GENERATE CODE] Error: {str(e)}", exc_info=True)
-        db.rollback()
+        logger.error("[GENERATE CODE] Error: %s", e, exc_info=True)
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error generating auth code"
@@ -162,12 +159,11 @@ async def generate_auth_code(
 @router.post("/logout")
 async def logout(
     authorization: str = Header(None),
-    db: Session = Depends(get_db)
 ):
     """
     Выход пользователя из системы
     
-    Удаляет все auth_codes пользователя
+    Отзывает токен (jti попадает в revocation set до истечения exp)
     Клиент должен удалить токен из localStorage
     
     Headers: Authorization: Bearer {token}
@@ -180,19 +176,17 @@ async def logout(
             )
         
         # Извлекаем token из заголовка Authorization: Bearer {token}
-        token = authorization.replace("Bearer ", "").strip()
-        
-        # Удаляем все неиспользованные коды для очистки
-        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=1)
-        
-        old_codes_count = db.query(AuthCode).filter(
-            AuthCode.created_at < cutoff_time,
-            AuthCode.used == False
-        ).delete()
+        token = extract_bearer_token(authorization)
         
-        db.commit()
+        # Отзываем токен, если он валиден (повторный logout - не ошибка)
+        if token:
+            try:
+                await revoked_tokens.revoke(verify_access_token(token))
+            except jwt.PyJWTError:
+                pass
         
-        logger.info(f"✅ [LOGOUT] User logged out, cleaned up {old_codes_count} expired codes")
+        # Очистка auth_codes выполняется фоновым AuthCodeSweeper
+        logger.info("[LOGOUT] User logged out")
         
         return {
             "status": "ok",
@@ -202,8 +196,7 @@ async def logout(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ [LOGOUT] Error: {str(e)}")
-        db.rollback()
+        logger.error("[LOGOUT] Error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error during logout"
@@ -0,0 +1,130 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.security import TokenClaims, get_current_claims
+from app.core.serializers import ORJSONResponse
+from app.db.session import get_async_db
+from app.models.models import CoinLedgerEntry, CoinReason, UserCard
+from app.services.ledger import InsufficientCoins, LedgerEntry, post_entries
+from app.services.packs import PACK_TYPES, pack_engine
+import logging
+import uuid
+
+router = APIRouter(prefix="/cards", tags=["cards"])
+logger = logging.getLogger(__name__)
+
+# entry_id журнала - "pack:<user_id>:<ключ>", колонка String(128)
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+
+class OpenPackRequest(BaseModel):
+    pack_type: str = "standard"
+
+
+@router.get("/")
+async def list_cards(db: AsyncSession = Depends(get_async_db)):
+    """
+    Каталог карт (из снимка каталога воркера, без запроса к БД на каждый вызов)
+    """
+    catalog = await pack_engine.catalog(db)
+    return ORJSONResponse({
+        "cards": [card.payload for card in catalog.cards],
+        "packs": [
+            {
+                "type": pack.name,
+                "price": pack.price,
+                "size": pack.size,
+                "drop_rates": catalog.drop_rates(pack.name) if pack.name in catalog.tables else {},
+            }
+            for pack in PACK_TYPES.values()
+        ],
+    })
+
+
+@router.post("/open-pack")
+async def open_pack(
+    body: OpenPackRequest,
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: str = Header(None, alias="Idempotency-Key"),
+):
+    """
+    Открыть пак: списать UP Coins и выдать карты.
+    
+    POST /api/cards/open-pack  {"pack_type": "standard"}
+    Idempotency-Key: <ключ клиента>  (необязательно)
+    
+    Списание - запись журнала UP Coins (app.services.ledger, отклоняется при
+    нехватке баланса) без SELECT ... FOR UPDATE, карты выбираются по alias-таблице в памяти и записываются одним INSERT.
+    
+    entry_id списания выводится из Idempotency-Key: повтор запроса с тем же
+    ключом (ретрай после таймаута) не списывает монеты второй раз и
+    получает 409. Без ключа каждый вызов - новое открытие.
+    """
+    pack = PACK_TYPES.get(body.pack_type)
+    if pack is None:
+        raise HTTPException(status_code=400, detail=f"Unknown pack type: {body.pack_type}")
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+        )
+    
+    catalog = await pack_engine.catalog(db)
+    if pack.name not in catalog.tables:
+        raise HTTPException(status_code=503, detail="Card catalog is empty")
+    
+    try:
+        if idempotency_key is None:
+            entry_id = f"pack:{uuid.uuid4()}"
+        else:
+            entry_id = f"pack:{claims.user_id}:{idempotency_key}"
+        entry = LedgerEntry(entry_id, claims.user_id, -pack.price, CoinReason.PACK_OPEN, pack.name)
+        try:
+            balance = (await post_entries(db, [entry])).get(claims.user_id)
+        except InsufficientCoins:
+            raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail="Not enough UP coins")
+        if balance is None:
+            # Запись с этим entry_id уже есть (встречный запрос ждал её commit
+            # на уникальном индексе) - пак по ключу уже открыт
+            opened = (await db.execute(
+                select(CoinLedgerEntry.id).where(CoinLedgerEntry.entry_id == entry_id)
+            )).scalar()
+            if opened is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Pack already opened for this Idempotency-Key",
+                )
+            raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail="Not enough UP coins")
+        
+        cards = pack_engine.draw(catalog, pack)
+        # Одна команда insertmanyvalues; порядок RETURNING совпадает с порядком карт
+        result = await db.execute(
+            insert(UserCard).returning(UserCard.id, sort_by_parameter_order=True),
+            [{"user_id": claims.user_id, "card_id": card.id, "is_locked": False} for card in cards],
+        )
+        user_card_ids = result.scalars().all()
+        
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        logger.error("[OPEN PACK] Error: %s", e, exc_info=True)
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Error opening pack")
+    
+    logger.info(
+        "[OPEN PACK] Pack opened",
+        extra={"user_id": claims.user_id, "pack_type": pack.name, "cards": [card.id for card in cards]},
+    )
+    
+    return ORJSONResponse({
+        "pack_type": pack.name,
+        "balance": balance.up_coins,
+        "cards": [
+            {**card.payload, "user_card_id": user_card_id}
+            for card, user_card_id in zip(cards, user_card_ids)
+        ],
+    })
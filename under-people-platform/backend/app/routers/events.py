@@ -1,92 +1,100 @@
 """Events routes."""
+import base64
+import binascii
 import logging
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.serializers import ORJSONResponse, event_item
+from app.db.session import get_async_db
 from app.models.event import Event
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/v1/events", tags=["events"])
 
 
+def encode_cursor(event: Event) -> str:
+    """Encode the (start_date, id) position of an event as an opaque cursor."""
+    raw = f"{event.start_date.isoformat()}|{event.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        start_date, event_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(start_date), int(event_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/upcoming")
 async def get_upcoming_events(
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
-    db: Session = None
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get upcoming events."""
+    """
+    Get upcoming events.
+    
+    With `cursor` the page is resolved by keyset over (start_date, id) using
+    ix_events_active_start_id, so every page costs the same as the first one.
+    `offset` is kept for old clients and is ignored when a cursor is given.
+    """
     try:
-        # Если db не передана в зависимость, это будет обработано FastAPI
-        # Здесь используется прямое подключение для примера
-        if db is None:
-            from app.db.session import SessionLocal
-            db = SessionLocal()
-        
         # Получаем события которые еще не прошли
         now = datetime.utcnow()
-        events = db.query(Event).filter(
+        query = select(Event).where(
             Event.start_date >= now,
             Event.is_active == 1
         ).order_by(
-            Event.start_date.asc()
-        ).limit(limit).offset(offset).all()
+            Event.start_date.asc(),
+            Event.id.asc()
+        )
         
-        return {
+        if cursor:
+            after_date, after_id = decode_cursor(cursor)
+            query = query.where(tuple_(Event.start_date, Event.id) > (after_date, after_id))
+        elif offset:
+            query = query.offset(offset)
+        
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        result = await db.execute(query.limit(limit + 1))
+        events = result.scalars().all()
+        has_more = len(events) > limit
+        events = events[:limit]
+        
+        return ORJSONResponse({
             "success": True,
-            "events": [
-                {
-                    "id": event.id,
-                    "title": event.title,
-                    "description": event.description,
-                    "start_date": event.start_date.isoformat(),
-                    "end_date": event.end_date.isoformat() if event.end_date else None,
-                    "location": event.location,
-                    "price": event.price,
-                    "image_url": event.image_url,
-                    "capacity": event.capacity,
-                }
-                for event in events
-            ],
-            "count": len(events)
-        }
+            "events": [event_item(event) for event in events],
+            "count": len(events),
+            "next_cursor": encode_cursor(events[-1]) if has_more else None,
+        })
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fetching upcoming events: {e}")
+        logger.error("Error fetching upcoming events: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{event_id}")
-async def get_event(event_id: int, db: Session = None):
+async def get_event(event_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get event by ID."""
     try:
-        if db is None:
-            from app.db.session import SessionLocal
-            db = SessionLocal()
-        
-        event = db.query(Event).filter(Event.id == event_id).first()
+        result = await db.execute(select(Event).where(Event.id == event_id))
+        event = result.scalars().first()
         
         if not event:
             raise HTTPException(status_code=404, detail="Event not found")
         
-        return {
-            "success": True,
-            "event": {
-                "id": event.id,
-                "title": event.title,
-                "description": event.description,
-                "start_date": event.start_date.isoformat(),
-                "end_date": event.end_date.isoformat() if event.end_date else None,
-                "location": event.location,
-                "price": event.price,
-                "image_url": event.image_url,
-                "capacity": event.capacity,
-            }
-        }
+        return ORJSONResponse({"success": True, "event": event_item(event)})
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching event: {e}")
+        logger.error("Error fetching event: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
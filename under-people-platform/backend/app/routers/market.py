@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.security import TokenClaims, get_current_claims
+from app.core.serializers import ORJSONResponse
+from app.db.session import get_async_db
+from app.models.models import Rarity
+from app.services.market import (
+    DEFAULT_SORT,
+    SORTS,
+    InsufficientFunds,
+    InvalidCursor,
+    ListingFilters,
+    ListingUnavailable,
+    OwnListing,
+    browse_listings,
+    purchase_listing,
+)
+from app.services.packs import pack_engine
+from typing import Optional
+import logging
+
+router = APIRouter(prefix="/market", tags=["market"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/listings")
+async def list_listings(
+    rarity: Optional[Rarity] = None,
+    clan: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    sort: str = Query(DEFAULT_SORT, pattern="^(" + "|".join(SORTS) + ")$"),
+    limit: int = Query(20, ge=1, le=settings.MARKET_PAGE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Лоты маркетплейса.
+    
+    GET /api/market/listings?rarity=epic&clan=Outcasts&min_price=100&sort=price_asc&limit=20
+    
+    Следующая страница - тот же запрос с cursor=next_cursor из ответа
+    (next_cursor = null на последней странице).
+    """
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="min_price is greater than max_price")
+    
+    filters = ListingFilters(rarity=rarity, clan=clan, min_price=min_price, max_price=max_price)
+    try:
+        page = await browse_listings(db, filters, sort_name=sort, limit=limit, cursor=cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return ORJSONResponse(page)
+
+
+@router.post("/listings/{listing_id}/buy")
+async def buy_listing(
+    listing_id: int,
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Купить лот за UP Coins.
+    
+    POST /api/market/listings/{listing_id}/buy
+    
+    Из одновременных покупателей лот получает один, остальным - 404.
+    """
+    try:
+        purchase = await purchase_listing(db, listing_id, claims.user_id)
+    except ListingUnavailable:
+        raise HTTPException(status_code=404, detail="Listing not found or already sold")
+    except OwnListing:
+        raise HTTPException(status_code=400, detail="Cannot buy your own listing")
+    except InsufficientFunds:
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail="Not enough UP coins")
+    except Exception as e:
+        logger.error("[MARKET BUY] Error: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Error purchasing listing")
+    
+    logger.info(
+        "[MARKET BUY] Listing purchased",
+        extra={"listing_id": listing_id, "buyer_id": claims.user_id, "price": purchase["price"]},
+    )
+    
+    catalog = await pack_engine.catalog(db)
+    card = catalog.by_id.get(purchase["card_id"])
+    return ORJSONResponse({
+        "status": "success",
+        "message": "Card purchased successfully",
+        "listing_id": listing_id,
+        "price": purchase["price"],
+        "balance": purchase["balance"],
+        "card": {
+            **(card.payload if card is not None else {"id": purchase["card_id"]}),
+            "user_card_id": purchase["user_card_id"],
+        },
+    })
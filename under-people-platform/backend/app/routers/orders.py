@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.security import TokenClaims, get_current_claims
+from app.core.serializers import ORJSONResponse, order_item
+from app.db.session import get_async_db
+from app.models.models import Order
+from app.services.flash_sale import ProductUnavailable, ReservationsUnavailable, SoldOut, flash_sale
+import logging
+import uuid
+
+router = APIRouter(prefix="/orders", tags=["orders"])
+logger = logging.getLogger(__name__)
+
+
+class CreateOrderRequest(BaseModel):
+    product_id: int
+
+
+def payment_link(order_id) -> str:
+    return f"https://t.me/{settings.TELEGRAM_BOT_NAME}?start=pay_{order_id}"
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_order(
+    body: CreateOrderRequest,
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Создать заказ (бронь товара).
+    
+    POST /api/orders/  {"product_id": 1}
+    
+    Для товара с ограниченным остатком единица остатка бронируется на
+    ORDER_RESERVATION_TTL секунд; неоплаченный заказ отменяется, остаток
+    возвращается (app.services.flash_sale).
+    """
+    try:
+        order = await flash_sale.reserve(db, claims.user_id, body.product_id)
+    except ProductUnavailable:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except SoldOut:
+        raise HTTPException(status_code=409, detail="Sold out")
+    except ReservationsUnavailable:
+        raise HTTPException(status_code=503, detail="Reservations are temporarily unavailable")
+    
+    return ORJSONResponse(
+        {**order, "telegram_payment_link": payment_link(order["id"])},
+        status_code=status.HTTP_201_CREATED,
+    )
+
+
+@router.get("/")
+async def get_orders(
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Заказы текущего пользователя (новые первыми)
+    """
+    result = await db.execute(
+        select(Order).where(Order.user_id == claims.user_id).order_by(Order.created_at.desc()).limit(100)
+    )
+    return ORJSONResponse({"orders": [order_item(order) for order in result.scalars().all()]})
+
+
+@router.get("/{order_id}")
+async def get_order(
+    order_id: uuid.UUID,
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Заказ текущего пользователя
+    """
+    result = await db.execute(select(Order).where(Order.id == order_id, Order.user_id == claims.user_id))
+    order = result.scalars().first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    return ORJSONResponse({**order_item(order), "telegram_payment_link": payment_link(order.id)})
@@ -1,44 +1,54 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import select
+from app.core.cache import ReadThroughCache, invalidate_on_change
+from app.core.config import settings
+from app.core.serializers import ORJSONResponse, product_detail, product_item
+from app.db.session import AsyncSessionLocal
 from app.models.models import Product
+from app.services.flash_sale import flash_sale
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+# Каталог читается гораздо чаще, чем меняется: кэшируем список и карточки товаров.
+# Любое изменение Product через ORM сбрасывает список и карточку после commit.
+product_cache = ReadThroughCache("products", ttl=settings.PRODUCT_CACHE_TTL)
+invalidate_on_change(Product, product_cache, lambda p: ("list", str(p.id)))
+# Остаток меняется и при записи заказов (Core UPDATE) - карточку сбрасывает flash_sale
+flash_sale.stock_caches.append(product_cache)
+# loader'ы открывают свою сессию - загрузка общая для ждущих запросов (ReadThroughCache.get_or_load)
+
 @router.get("/")
-async def get_products(db: Session = Depends(get_db)):
+async def get_products():
     """
     Получить список всех товаров
     """
-    products = db.query(Product).filter(Product.is_active == True).all()
+    async def load():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Product).where(Product.is_active == True))
+            products = result.scalars().all()
+            
+            return {"products": [product_item(p) for p in products]}
     
-    return {
-        "products": [
-            {
-                "id": p.id,
-                "name": p.name,
-                "description": p.description,
-                "price": p.price,
-                "image_url": p.image_url,
-                "type": p.product_type,
-            }
-            for p in products
-        ]
-    }
+    return ORJSONResponse(await product_cache.get_or_load("list", load))
 
 @router.get("/{product_id}")
-async def get_product(product_id: int, db: Session = Depends(get_db)):
+async def get_product(product_id: int):
     """
     Получить информацию о товаре
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
+    async def load():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Product).where(Product.id == product_id))
+            product = result.scalars().first()
+            
+            if not product:
+                # Кэшируем и отсутствие товара: перебор id не должен доходить до БД
+                return None
+            
+            return product_detail(product)
+    
+    product = await product_cache.get_or_load(str(product_id), load)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
     
-    return {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "image_url": product.image_url,
-        "type": product.product_type,
-        "stock": product.stock,
-    }
+    return ORJSONResponse(product)
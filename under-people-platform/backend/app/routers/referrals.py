@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.security import TokenClaims, get_current_claims
+from app.core.serializers import ORJSONResponse
+from app.db.session import get_async_db
+from app.models.models import User
+from app.services.referrals import referral_stats
+import logging
+
+router = APIRouter(prefix="/referrals", tags=["referrals"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/me")
+async def get_my_referrals(
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Мои приглашённые: прямые, всего по всем уровням и разбивка по уровням.
+
+    GET /api/referrals/me
+
+    Счётчики ведутся при регистрации (app.services.referrals) - ответ не
+    зависит от размера дерева.
+    """
+    stats = await referral_stats(db, claims.user_id)
+    return ORJSONResponse({"user_id": claims.user_id, "referral_code": claims.referral_code, **stats})
+
+
+@router.get("/u/{referral_code}")
+async def get_referrals_by_code(referral_code: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Реферальная статистика пользователя по его коду (публичная).
+
+    GET /api/referrals/u/{referral_code}
+    """
+    user_id = (await db.execute(
+        select(User.id).where(User.referral_code == referral_code, User.is_active == True)
+    )).scalar()
+    if user_id is None:
+        raise HTTPException(status_code=404, detail=f"PROFILE NOT FOUND - CODE: {referral_code}")
+
+    stats = await referral_stats(db, user_id)
+    return ORJSONResponse({"referral_code": referral_code, **stats})
@@ -1,19 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Header
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Header, Query
+from pydantic import BaseModel, Field
+from redis.exceptions import RedisError
+from sqlalchemy import any_, bindparam, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import LocalTTLCache, invalidate_on_change
+from app.core.config import settings
+from app.core.security import TokenClaims, get_current_claims
+from app.core.serializers import ORJSONResponse, user_private, user_profile, user_public_card
+from app.db.session import get_async_db
 from app.models.models import User
+from app.services.leaderboard import LeaderboardEntry, LeaderboardNotReady, leaderboard
+from app.services.ledger import ledger_balance, ledger_history
 from datetime import datetime, timedelta
-import hashlib
-import json
+from typing import Dict, List, Optional
+import logging
+import uuid
 
 router = APIRouter(prefix="/users", tags=["users"])
+logger = logging.getLogger(__name__)
+
+# Публичные профили /users/u/{referral_code}: LRU + TTL в памяти воркера.
+# Изменение публичных полей (или создание пользователя с этим кодом)
+# сбрасывает запись после commit.
+PUBLIC_PROFILE_FIELDS = ("username", "role", "avatar_url", "referral_code", "telegram_id", "created_at", "is_active")
+public_profile_cache = LocalTTLCache(
+    "public_profiles",
+    max_size=settings.PROFILE_CACHE_SIZE,
+    ttl=settings.PROFILE_CACHE_TTL,
+    negative_ttl=settings.PROFILE_CACHE_NEGATIVE_TTL,
+)
+invalidate_on_change(
+    User,
+    public_profile_cache,
+    lambda user: (user.referral_code,),
+    fields=PUBLIC_PROFILE_FIELDS,
+)
+
+# Колонки публичной карточки: batch-запрос читает только их, без ORM-объектов
+PUBLIC_CARD_COLUMNS = (
+    User.id, User.username, User.role, User.created_at,
+    User.referral_code, User.avatar_url, User.telegram_id,
+)
+
+# Batch не отдаёт telegram_id: id пользователей публичны (лидерборд, продавцы
+# на маркете), и поиск по ним не должен раскрывать аккаунты Telegram
+BATCH_HIDDEN_FIELDS = ("telegram_id",)
+
+
+def batch_card(card: dict) -> dict:
+    return {key: value for key, value in card.items() if key not in BATCH_HIDDEN_FIELDS}
+
+ME_CACHE_HEADERS = {
+    "Cache-Control": "private, max-age=300",  # 5 минут
+    "Vary": "Authorization",
+}
+
+
+def user_etag(user_id: uuid.UUID, updated_at: Optional[datetime]) -> str:
+    """
+    ETag профиля из версии строки (id + updated_at в микросекундах).
+    
+    updated_at обновляется при любом изменении User через ORM, поэтому
+    сравнение не требует ни загрузки строки целиком, ни сериализации.
+    """
+    version = int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+    return f'"{user_id.hex}-{version:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match (поддерживает списки, W/ и *)"""
+    if not if_none_match:
+        return False
+    candidates = {
+        candidate.strip().removeprefix("W/").strip('"')
+        for candidate in if_none_match.split(",")
+    }
+    return "*" in candidates or etag.strip('"') in candidates
+
 
 @router.get("/me")
 async def get_current_user(
-    response: Response,
     if_none_match: str = Header(None, alias="If-None-Match"),
-    current_user: dict = Depends(lambda: {}),  # Placeholder для JWT в будущем
-    db: Session = Depends(get_db)
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Получить текущего пользователя - защищено от excessive polling.
@@ -23,61 +93,49 @@ async def get_current_user(
     Кэширование: 5 минут (max-age=300)
     Поддерживает: If-None-Match для ETag валидации
     
+    ETag считается по (id, updated_at) - это index-only lookup по
+    ix_users_id_version, поэтому 304 отдаётся без загрузки ORM-объекта.
+    
     Ответы:
     - 200: Новые данные с полным телом
     - 304: Not Modified (если If-None-Match совпадает)
     - 401: Unauthorized
     """
-    # TODO: В будущем подставить реального current_user из JWT токена
-    # Пока это placeholder - нужно интегрировать с JWT middleware
+    # Пользователь определяется по claims токена; из БД читаем только версию строки
+    result = await db.execute(
+        select(User.id, User.updated_at).where(User.id == claims.user_id)
+    )
+    version = result.first()
+    
+    if not version:
+        raise HTTPException(status_code=401, detail="User not authenticated")
+    
+    current_etag = user_etag(version.id, version.updated_at)
+    
+    if etag_matches(if_none_match, current_etag):
+        # Данные не изменились - отправляем 304 без тела
+        return Response(
+            status_code=304,
+            headers={**ME_CACHE_HEADERS, "ETag": current_etag},
+        )
     
-    # Для локального тестирования - получить первого пользователя
-    user = db.query(User).first()
+    result = await db.execute(select(User).where(User.id == version.id))
+    user = result.scalars().first()
     
     if not user:
         raise HTTPException(status_code=401, detail="User not authenticated")
     
-    # Готовим данные пользователя
-    user_data = {
-        "id": str(user.id),
-        "telegram_id": user.telegram_id,
-        "username": user.username,
-        "avatar_url": user.avatar_url,
-        "up_coins": user.up_coins,
-        "clan_name": user.clan_name,
-        "referral_code": user.referral_code,
-        "role": user.role.value if hasattr(user.role, 'value') else str(user.role),
-        "is_active": user.is_active,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-        "last_login": user.last_login.isoformat() if user.last_login else None,
-    }
-    
-    # Генерируем ETag на основе данных пользователя
-    # Используем JSON для более точного хеша
-    etag_source = json.dumps(user_data, sort_keys=True).encode()
-    current_etag = hashlib.md5(etag_source).hexdigest()
-    
-    # Проверяем If-None-Match заголовок
-    if if_none_match:
-        # Удаляем кавычки из If-None-Match если они есть
-        client_etag = if_none_match.strip('"')
-        if client_etag == current_etag:
-            # Данные не изменились - отправляем 304
-            response.status_code = 304
-            response.headers["ETag"] = f'"{current_etag}"'
-            response.headers["Cache-Control"] = "private, max-age=300"
-            response.headers["Vary"] = "Authorization"
-            return None  # При 304 не отправляем тело
-    
-    # Добавляем кэширующие заголовки
-    response.headers["Cache-Control"] = "private, max-age=300"  # 5 минут
-    response.headers["ETag"] = f'"{current_etag}"'
-    response.headers["Vary"] = "Authorization"
-    
-    return user_data
+    # Кэширующие заголовки (ETag - по только что загруженной версии)
+    return ORJSONResponse(
+        user_private(user),
+        headers={**ME_CACHE_HEADERS, "ETag": user_etag(user.id, user.updated_at)},
+    )
 
 @router.post("/me/refresh")
-async def refresh_user_cache(response: Response, db: Session = Depends(get_db)):
+async def refresh_user_cache(
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Принудительно обновить кэш пользователя - игнорирует ETag.
     
@@ -85,112 +143,245 @@ async def refresh_user_cache(response: Response, db: Session = Depends(get_db)):
     
     Возвращает свежие данные без кэша
     """
-    # TODO: Подставить реального current_user из JWT
-    user = db.query(User).first()
+    result = await db.execute(select(User).where(User.id == claims.user_id))
+    user = result.scalars().first()
     
     if not user:
         raise HTTPException(status_code=401, detail="User not authenticated")
     
     # Явно отключаем кэширование для refresh endpoint
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    
-    return {
-        "id": str(user.id),
-        "telegram_id": user.telegram_id,
-        "username": user.username,
-        "avatar_url": user.avatar_url,
-        "up_coins": user.up_coins,
-        "clan_name": user.clan_name,
-        "referral_code": user.referral_code,
-        "role": user.role.value if hasattr(user.role, 'value') else str(user.role),
-        "is_active": user.is_active,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-        "last_login": user.last_login.isoformat() if user.last_login else None,
-    }
+    return ORJSONResponse(
+        user_private(user),
+        headers={
+            "Cache-Control": "no-cache, no-store, must-revalidate",
+            "Pragma": "no-cache",
+            "Expires": "0",
+        },
+    )
+
+@router.get("/me/ledger")
+async def get_my_ledger(
+    limit: int = Query(20, ge=1, le=settings.MAX_PAGE_SIZE),
+    before: Optional[int] = Query(None, ge=1),
+    claims: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Журнал UP Coins: баланс по журналу и записи, новые первыми.
+    
+    GET /api/users/me/ledger?limit=20&before=<id последней записи страницы>
+    """
+    balance = await ledger_balance(db, claims.user_id)
+    entries = await ledger_history(db, claims.user_id, limit, before)
+    return ORJSONResponse({
+        **balance,
+        "entries": [
+            {"id": e.id, "amount": e.amount, "reason": e.reason, "ref": e.ref, "created_at": e.created_at}
+            for e in entries
+        ],
+        "next_before": entries[-1].id if len(entries) == limit else None,
+    })
 
 
 
 @router.get("/profile/{user_id}")
-async def get_user_profile(user_id: str, db: Session = Depends(get_db)):
+async def get_user_profile(user_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Получить профиль пользователя
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    try:
+        user_uuid = uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    result = await db.execute(select(User).where(User.id == user_uuid))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return {
-        "id": str(user.id),
-        "username": user.username,
-        "coins": user.up_coins,
-        "clan_name": user.clan_name,
-        "avatar_url": user.avatar_url,
-        "ref_code": user.referral_code,
-        "role": user.role,
-        "created_at": user.created_at,
-    }
+    return ORJSONResponse(user_profile(user))
 
 @router.get("/u/{referral_code}")
-async def get_public_profile(referral_code: str, db: Session = Depends(get_db)):
+async def get_public_profile(referral_code: str, db: AsyncSession = Depends(get_async_db)):
     """
     Get public user profile by referral code.
     
     GET /api/users/u/{referral_code}
+    
+    Ответы (в т.ч. 404) кэшируются в памяти воркера: вирусная ссылка
+    и перебор кодов ботами не доходят до БД.
     """
+    found, cached = public_profile_cache.get(referral_code)
+    if found:
+        if cached is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"PROFILE NOT FOUND - CODE: {referral_code}"
+            )
+        return ORJSONResponse(cached)
+    
     try:
-        # Логируем запрос для диагностики
-        print(f"🔍 [PUBLIC PROFILE] Searching for referral_code: {referral_code}")
-        
-        user = db.query(User).filter(User.referral_code == referral_code).first()
+        result = await db.execute(
+            select(User).where(User.referral_code == referral_code, User.is_active == True)
+        )
+        user = result.scalars().first()
         
         if not user:
-            print(f"❌ [PUBLIC PROFILE] User not found - CODE: {referral_code}")
+            logger.debug("[PUBLIC PROFILE] User not found", extra={"referral_code": referral_code})
+            public_profile_cache.set_missing(referral_code)
             raise HTTPException(
                 status_code=404, 
                 detail=f"PROFILE NOT FOUND - CODE: {referral_code}"
             )
         
-        # Логируем успешный поиск
-        print(f"✅ [PUBLIC PROFILE] Found user: {user.username} ({user.referral_code})")
-        
         # Возвращаем только публичные данные
-        return {
-            "success": True,
-            "user": {
-                "id": str(user.id),
-                "full_name": user.username or "Member",
-                "role": user.role.value if hasattr(user.role, 'value') else str(user.role),
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-                "achievements_count": 0,  # Placeholder для расширения в будущем
-                "referral_code": user.referral_code,
-                "photo_url": user.avatar_url,
-                "telegram_id": user.telegram_id,
-            }
-        }
+        payload = {"success": True, "user": user_public_card(user)}
+        public_profile_cache.set(referral_code, payload)
+        return ORJSONResponse(payload)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ [PUBLIC PROFILE ERROR] {e}")
+        logger.error("[PUBLIC PROFILE] Error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+class ProfileBatchRequest(BaseModel):
+    referral_codes: List[str] = Field(default_factory=list, max_length=settings.PROFILE_BATCH_MAX)
+    ids: List[str] = Field(default_factory=list, max_length=settings.PROFILE_BATCH_MAX)
+
+
+@router.post("/batch")
+async def get_profiles_batch(body: ProfileBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Публичные профили пачкой (страницы сети и убежища).
+    
+    POST /api/users/batch  {"referral_codes": [...], "ids": [...]}
+    
+    Коды сначала ищутся в кэше публичных профилей воркера, остальные коды и
+    id разрешаются одним запросом (= ANY(array)). Только активные
+    пользователи, карточка без telegram_id. Ответ:
+    {"profiles": {идентификатор: карточка}, "missing": [ненайденные]}.
+    """
+    codes = list(dict.fromkeys(body.referral_codes))
+    raw_ids = list(dict.fromkeys(body.ids))
+    if len(codes) + len(raw_ids) > settings.PROFILE_BATCH_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.PROFILE_BATCH_MAX} identifiers per request",
+        )
+    
+    profiles: Dict[str, dict] = {}
+    missing: List[str] = []
+    
+    pending_codes = []
+    for code in codes:
+        found, cached = public_profile_cache.get(code)
+        if not found:
+            pending_codes.append(code)
+        elif cached is None:
+            missing.append(code)
+        else:
+            profiles[code] = batch_card(cached["user"])
+    
+    ids_by_uuid: Dict[uuid.UUID, str] = {}
+    for raw_id in raw_ids:
+        try:
+            ids_by_uuid[uuid.UUID(raw_id)] = raw_id
+        except ValueError:
+            missing.append(raw_id)
+    
+    if pending_codes or ids_by_uuid:
+        conditions = []
+        if pending_codes:
+            conditions.append(User.referral_code == any_(
+                bindparam("codes", pending_codes, type_=ARRAY(User.referral_code.type))
+            ))
+        if ids_by_uuid:
+            conditions.append(User.id == any_(
+                bindparam("ids", list(ids_by_uuid), type_=ARRAY(UUID(as_uuid=True)))
+            ))
+        result = await db.execute(
+            select(*PUBLIC_CARD_COLUMNS).where(or_(*conditions), User.is_active == True)
+        )
+        
+        pending = set(pending_codes)
+        for row in result.all():
+            public = user_public_card(row)
+            # Найденные по id тоже попадают в кэш по коду - его читает /users/u/{code}
+            public_profile_cache.set(row.referral_code, {"success": True, "user": public})
+            card = batch_card(public)
+            if row.referral_code in pending:
+                profiles[row.referral_code] = card
+                pending.discard(row.referral_code)
+            raw_id = ids_by_uuid.pop(row.id, None)
+            if raw_id is not None:
+                profiles[raw_id] = card
+        
+        for code in pending:
+            public_profile_cache.set_missing(code)
+        missing.extend(pending)
+        missing.extend(ids_by_uuid.values())
+    
+    return ORJSONResponse({"profiles": profiles, "missing": missing})
+
 @router.get("/leaderboard")
-async def get_leaderboard(limit: int = 10, db: Session = Depends(get_db)):
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=settings.MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Получить топ пользователей по UP Coins
+    
+    Читается из Redis sorted set (O(log n + limit)); если Redis недоступен
+    или лидерборд ещё строится - запрос к БД по индексу ix_users_active_coins.
     """
-    users = db.query(User).filter(User.is_active == True).order_by(User.up_coins.desc()).limit(limit).all()
-    
-    return {
-        "leaderboard": [
-            {
-                "rank": idx + 1,
-                "username": user.username,
-                "coins": user.up_coins,
-                "clan": user.clan_name,
-            }
-            for idx, user in enumerate(users)
-        ]
-    }
+    try:
+        entries = await leaderboard.top(limit, offset)
+        return ORJSONResponse({"leaderboard": [entry.to_dict() for entry in entries]})
+    except (RedisError, LeaderboardNotReady) as e:
+        logger.warning("Leaderboard unavailable, falling back to SQL: %r", e)
+    
+    result = await db.execute(
+        select(User.id, User.username, User.up_coins, User.clan_name)
+        .where(User.is_active == True)
+        .order_by(User.up_coins.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    
+    entries = [
+        LeaderboardEntry(
+            rank=offset + idx + 1,
+            user_id=str(user.id),
+            username=user.username,
+            coins=user.up_coins,
+            clan=user.clan_name,
+        )
+        for idx, user in enumerate(result.all())
+    ]
+    return ORJSONResponse({"leaderboard": [entry.to_dict() for entry in entries]})
 
+@router.get("/leaderboard/me")
+async def get_my_rank(
+    radius: int = Query(5, ge=0, le=50),
+    claims: TokenClaims = Depends(get_current_claims),
+):
+    """
+    Мой ранг и соседи по лидерборду (radius позиций сверху и снизу)
+    
+    Пока лидерборд не собран полностью, ранг из неполного ZSET был бы
+    неверным - 503, как и при недоступном Redis.
+    """
+    try:
+        position = await leaderboard.around(str(claims.user_id), radius)
+    except (RedisError, LeaderboardNotReady):
+        raise HTTPException(status_code=503, detail="Leaderboard temporarily unavailable")
+    
+    if position is None:
+        raise HTTPException(status_code=404, detail="User is not ranked")
+    
+    return ORJSONResponse({
+        "rank": position["rank"],
+        "total": position["total"],
+        "neighbours": [entry.to_dict() for entry in position["neighbours"]],
+    })
@@ -0,0 +1,122 @@
+"""
+Хранилища одноразовых кодов авторизации (бот -> /auth/callback).
+
+RedisAuthCodeStore - код живёт в Redis с нативным TTL и потребляется
+атомарно через GETDEL, без записи в Postgres на каждое нажатие "Войти".
+SqlAuthCodeStore - прежняя таблица auth_codes; используется как backend
+по настройке AUTH_CODE_BACKEND=db и как fallback при недоступности Redis.
+Код, не найденный в Redis, ищется и в таблице: он мог быть выдан туда во
+время сбоя Redis и должен работать весь TTL после восстановления.
+"""
+import json
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.models.models import AuthCode
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ConsumedCode:
+    """Данные погашенного кода"""
+    telegram_id: int
+    user_id: Optional[uuid.UUID]
+
+
+class SqlAuthCodeStore:
+    """Коды в таблице auth_codes"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    async def issue(self, db: AsyncSession, telegram_id: int, user_id: Optional[uuid.UUID]) -> str:
+        code = str(uuid.uuid4())
+        db.add(AuthCode(
+            code=code,
+            telegram_id=telegram_id,
+            user_id=user_id,
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+        ))
+        await db.commit()
+        return code
+
+    async def consume(self, db: AsyncSession, code: str) -> Optional[ConsumedCode]:
+        """
+        Погасить код одним UPDATE ... RETURNING.
+        
+        Commit остаётся за вызывающим: код считается использованным
+        только вместе с успешным созданием/обновлением пользователя.
+        """
+        result = await db.execute(
+            update(AuthCode)
+            .where(
+                AuthCode.code == code,
+                AuthCode.used == False,
+                AuthCode.expires_at > datetime.now(timezone.utc),
+            )
+            .values(used=True)
+            .returning(AuthCode.telegram_id, AuthCode.user_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        return ConsumedCode(telegram_id=row.telegram_id, user_id=row.user_id)
+
+
+class RedisAuthCodeStore:
+    """Коды в Redis: authcode:{code} -> {telegram_id, user_id} с TTL"""
+
+    PREFIX = "authcode:"
+
+    def __init__(self, ttl: int, fallback: SqlAuthCodeStore):
+        self.ttl = ttl
+        self.fallback = fallback
+
+    async def issue(self, db: AsyncSession, telegram_id: int, user_id: Optional[uuid.UUID]) -> str:
+        code = str(uuid.uuid4())
+        payload = json.dumps({
+            "telegram_id": telegram_id,
+            "user_id": str(user_id) if user_id else None,
+        })
+        try:
+            await get_redis().set(self.PREFIX + code, payload, ex=self.ttl)
+        except RedisError as e:
+            logger.warning("Redis unavailable, issuing auth code in DB: %s", e)
+            return await self.fallback.issue(db, telegram_id, user_id)
+        return code
+
+    async def consume(self, db: AsyncSession, code: str) -> Optional[ConsumedCode]:
+        try:
+            # GETDEL атомарен: из двух одновременных callback'ов код получит только один
+            payload = await get_redis().getdel(self.PREFIX + code)
+        except RedisError as e:
+            logger.warning("Redis unavailable, consuming auth code from DB: %s", e)
+            return await self.fallback.consume(db, code)
+        if payload is None:
+            # Код мог быть выдан в БД, пока Redis был недоступен (один индексный UPDATE)
+            return await self.fallback.consume(db, code)
+        data = json.loads(payload)
+        return ConsumedCode(
+            telegram_id=int(data["telegram_id"]),
+            user_id=uuid.UUID(data["user_id"]) if data.get("user_id") else None,
+        )
+
+
+def build_auth_code_store():
+    sql_store = SqlAuthCodeStore(settings.AUTH_CODE_TTL_SECONDS)
+    if settings.AUTH_CODE_BACKEND == "db":
+        return sql_store
+    return RedisAuthCodeStore(settings.AUTH_CODE_TTL_SECONDS, fallback=sql_store)
+
+
+auth_code_store = build_auth_code_store()
@@ -0,0 +1,562 @@
+"""
+Бронирование товаров с ограниченным остатком (дропы билетов).
+
+Остаток товара (Product.stock >= 0; -1 - без ограничения) на время продаж
+живёт в Redis-счётчике. Бронь - один Lua-скрипт: проверить остаток,
+DECR и записать бронь в ZSET holds (score - время истечения). Сотни
+одновременных покупателей не трогают строку products - выдачу остатка
+сериализует Redis, а не блокировка строки в Postgres.
+
+Заказы пишутся очередью (write-behind): брони всех запросов за
+ORDER_WRITE_INTERVAL собираются в одну транзакцию - INSERT заказов PENDING
+одной командой и по одному UPDATE products.stock на товар. Запрос ждёт
+commit своего батча (group commit), поэтому созданный заказ сразу виден в
+GET /orders/{id}.
+
+Гарантия "не продать больше остатка" двойная: счётчик в Redis не уходит
+ниже нуля, а батч списывает в products не больше, чем там осталось
+(LEAST(stock, n) под блокировкой строки), если счётчик разошёлся с БД
+(например, Redis потерял данные и счётчик был заново прочитан из БД при
+незаписанных бронях). Заказы принимаются в порядке очереди на списанное
+количество, остальным - "sold out"; счётчик удаляется и перечитывается из БД.
+
+Запись идёт фоновой задачей order-writer, запущенной в lifespan с пустым
+контекстом: SQL батчей не попадает в учёт запросов (QueryStats) и
+request_id того HTTP-запроса, который случайно запустил бы её.
+
+Просроченные брони освобождает BookingReleaser: отменяет заказы PENDING,
+возвращает остаток в products и счётчик. Возврат в Redis идемпотентен
+(ZREM брони + INCR только если бронь была удалена этим вызовом), поэтому
+падение между commit и Redis или параллельные воркеры не возвращают
+остаток дважды.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.orm import object_session
+
+from app.core.cache import LocalTTLCache, get_redis, invalidate_on_change
+from app.core.config import settings
+from app.db.hooks import after_commit
+from app.db.session import AsyncSessionLocal
+from app.models.models import Order, OrderStatus, Product
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] - счётчик товара, KEYS[2] - holds; ARGV[1] - член holds, ARGV[2] - истечение (unix)
+RESERVE_SCRIPT = """
+local stock = redis.call('GET', KEYS[1])
+if not stock then
+    return -2
+end
+if tonumber(stock) <= 0 then
+    return -1
+end
+local left = redis.call('DECR', KEYS[1])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return left
+"""
+
+# KEYS[1] - holds, KEYS[1 + i] - счётчик товара i-й брони;
+# ARGV[i] - член holds, ARGV[n + i] - '1' вернуть единицу остатка, '0' - только снять бронь
+RELEASE_SCRIPT = """
+local n = #ARGV / 2
+local restored = 0
+for i = 1, n do
+    if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 and ARGV[n + i] == '1' then
+        if redis.call('EXISTS', KEYS[i + 1]) == 1 then
+            redis.call('INCR', KEYS[i + 1])
+            restored = restored + 1
+        end
+    end
+end
+return restored
+"""
+
+
+class ReservationError(Exception):
+    """Бронь не создана"""
+
+
+class ProductUnavailable(ReservationError):
+    """Товара нет или он не продаётся"""
+
+
+class SoldOut(ReservationError):
+    """Остаток исчерпан"""
+
+
+class ReservationsUnavailable(ReservationError):
+    """Redis недоступен - выдавать ограниченный остаток нельзя"""
+
+
+@dataclass(frozen=True)
+class SaleProduct:
+    id: int
+    price: int
+    limited: bool  # stock >= 0
+
+
+@dataclass
+class _PendingOrder:
+    order_id: uuid.UUID
+    user_id: uuid.UUID
+    product: SaleProduct
+    created_at: datetime
+    future: asyncio.Future = field(repr=False)
+
+    @property
+    def hold(self) -> str:
+        return f"{self.product.id}:{self.order_id}"
+
+
+# Цена и признак ограниченного остатка - в памяти воркера, сброс после commit изменения Product
+sale_products = LocalTTLCache("sale_products", max_size=10_000, ttl=30, negative_ttl=10)
+invalidate_on_change(Product, sale_products, lambda p: (str(p.id),), fields=("price", "stock", "is_active"))
+
+
+class FlashSale:
+    """Брони в Redis и батчевая запись заказов"""
+
+    def __init__(
+        self,
+        reservation_ttl: int,
+        write_batch: int,
+        write_interval: float,
+        prefix: str = "flash",
+        client=None,
+    ):
+        self.reservation_ttl = reservation_ttl
+        self.write_batch = write_batch
+        self.write_interval = write_interval
+        self.prefix = prefix
+        self.holds_key = f"{prefix}:holds"
+        self._client = client
+        self._reserve_script = None
+        self._release_script = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Кэши с остатком товара (products), которые сбрасываются после записи батча
+        self.stock_caches: List = []
+        # Метрики
+        self.reserved = 0
+        self.sold_out = 0
+        self.batches = 0
+        self.orders_written = 0
+        self.guard_rejections = 0
+        self.write_errors = 0
+        self.restored = 0
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def stock_key(self, product_id: int) -> str:
+        return f"{self.prefix}:stock:{product_id}"
+
+    # -- бронь -------------------------------------------------------------------
+
+    async def product(self, db, product_id: int) -> Optional[SaleProduct]:
+        found, cached = sale_products.get(str(product_id))
+        if found:
+            return cached
+        row = (await db.execute(
+            select(Product.id, Product.price, Product.stock)
+            .where(Product.id == product_id, Product.is_active == True)
+        )).first()
+        if row is None:
+            sale_products.set_missing(str(product_id))
+            return None
+        product = SaleProduct(id=row.id, price=row.price, limited=row.stock is not None and row.stock >= 0)
+        sale_products.set(str(product_id), product)
+        return product
+
+    async def _load_counter(self, db, product_id: int) -> None:
+        """Счётчика нет (первая бронь или Redis сброшен) - взять остаток из БД"""
+        stock = (await db.execute(select(Product.stock).where(Product.id == product_id))).scalar()
+        await self.client.set(self.stock_key(product_id), max(stock or 0, 0), nx=True)
+
+    async def _take(self, db, product: SaleProduct, hold: str, expires: float) -> int:
+        client = self.client
+        if self._reserve_script is None:
+            self._reserve_script = client.register_script(RESERVE_SCRIPT)
+        keys = [self.stock_key(product.id), self.holds_key]
+        left = await self._reserve_script(keys=keys, args=[hold, expires], client=client)
+        if left == -2:
+            await self._load_counter(db, product.id)
+            left = await self._reserve_script(keys=keys, args=[hold, expires], client=client)
+        return int(left)
+
+    async def reserve(self, db, user_id, product_id: int) -> dict:
+        """
+        Забронировать товар и создать заказ PENDING.
+
+        Raises ProductUnavailable, SoldOut, ReservationsUnavailable.
+        """
+        product = await self.product(db, product_id)
+        if product is None:
+            raise ProductUnavailable()
+
+        pending = _PendingOrder(
+            order_id=uuid.uuid4(),
+            user_id=user_id,
+            product=product,
+            created_at=datetime.utcnow(),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        if product.limited:
+            try:
+                left = await self._take(db, product, pending.hold, time.time() + self.reservation_ttl)
+            except RedisError as e:
+                logger.warning("Reservation counter unavailable: %s", e)
+                raise ReservationsUnavailable()
+            if left == -2:
+                raise ReservationsUnavailable()
+            if left < 0:
+                self.sold_out += 1
+                raise SoldOut()
+
+        self._ensure_writer()
+        self._queue.put_nowait(pending)
+        # shield: отмена запроса не отменяет запись батча
+        await asyncio.shield(pending.future)
+        self.reserved += 1
+        return {
+            "id": pending.order_id,
+            "product_id": product.id,
+            "status": OrderStatus.PENDING,
+            "amount_rub": product.price,
+            "created_at": pending.created_at,
+            "expires_at": pending.created_at + timedelta(seconds=self.reservation_ttl) if product.limited else None,
+        }
+
+    # -- запись заказов ------------------------------------------------------------
+
+    def start(self) -> None:
+        self._ensure_writer()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue()
+            # Пустой контекст: не наследовать contextvars запроса (QueryStats, request_id)
+            self._writer = asyncio.create_task(
+                self._write_forever(), name="order-writer", context=contextvars.Context(),
+            )
+
+    async def _write_forever(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # Даём набраться батчу от одновременных запросов
+            await asyncio.sleep(self.write_interval)
+            while len(batch) < self.write_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self.write(batch)
+            except Exception as e:
+                # Запросы батча не должны ждать вечно
+                logger.error("Order writer failed: %s", e, exc_info=True)
+                for p in batch:
+                    if not p.future.done():
+                        p.future.set_exception(ReservationsUnavailable())
+
+    async def write(self, batch: List[_PendingOrder]) -> None:
+        """Одна транзакция на батч; результат - в future каждого запроса"""
+        limited = Counter(p.product.id for p in batch if p.product.limited)
+        taken: Dict[int, int] = {}
+        try:
+            async with AsyncSessionLocal() as db:
+                # Строки товаров - в порядке id: батчи разных воркеров не блокируют друг друга
+                for product_id, count in sorted(limited.items()):
+                    stock = (await db.execute(
+                        select(Product.stock).where(Product.id == product_id).with_for_update()
+                    )).scalar()
+                    if stock is None:
+                        taken[product_id] = 0
+                    elif stock < 0:
+                        taken[product_id] = count  # остаток снят - товар без ограничения
+                    else:
+                        taken[product_id] = min(stock, count)
+                        if taken[product_id]:
+                            await db.execute(
+                                update(Product)
+                                .where(Product.id == product_id)
+                                .values(stock=Product.stock - taken[product_id])
+                            )
+                # Списанное количество - первым в очереди
+                left = dict(taken)
+                accepted, rejected = [], []
+                for p in batch:
+                    if not p.product.limited:
+                        accepted.append(p)
+                    elif left[p.product.id] > 0:
+                        left[p.product.id] -= 1
+                        accepted.append(p)
+                    else:
+                        rejected.append(p)
+                if accepted:
+                    await db.execute(insert(Order), [
+                        {
+                            "id": p.order_id,
+                            "user_id": p.user_id,
+                            "product_id": p.product.id,
+                            "amount_rub": p.product.price,
+                            "coins_used": 0,
+                            "status": OrderStatus.PENDING,
+                            "created_at": p.created_at,
+                            "updated_at": p.created_at,
+                        }
+                        for p in accepted
+                    ])
+                await db.commit()
+        except Exception as e:
+            self.write_errors += 1
+            logger.error("Order batch write failed: %s", e, exc_info=True)
+            await self._release_holds([(p.hold, p.product.id, True) for p in batch if p.product.limited])
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(ReservationsUnavailable())
+            return
+
+        self.batches += 1
+        self.orders_written += len(accepted)
+        if rejected:
+            # Счётчик в Redis разошёлся с БД: лишние брони не выдаём, счётчик перечитается из БД
+            short = sorted({p.product.id for p in rejected})
+            self.guard_rejections += len(rejected)
+            logger.error("Stock guard rejected reservations", extra={"products": short, "rejected": len(rejected)})
+            try:
+                await self.client.delete(*(self.stock_key(product_id) for product_id in short))
+            except RedisError as e:
+                logger.warning("Stock counter reset failed: %s", e)
+            await self._release_holds([(p.hold, p.product.id, False) for p in rejected])
+        for p in rejected:
+            if not p.future.done():
+                p.future.set_exception(SoldOut())
+        for p in accepted:
+            if not p.future.done():
+                p.future.set_result(p.order_id)
+        await self._stock_changed(limited)
+
+    async def _stock_changed(self, product_ids) -> None:
+        keys = [str(product_id) for product_id in product_ids]
+        if keys:
+            for cache in self.stock_caches:
+                await cache.invalidate(*keys)
+
+    async def _release_holds(self, holds: List[Tuple[str, int, bool]]) -> int:
+        """holds: (член holds, product_id, вернуть остаток в счётчик)"""
+        if not holds:
+            return 0
+        client = self.client
+        if self._release_script is None:
+            self._release_script = client.register_script(RELEASE_SCRIPT)
+        try:
+            restored = await self._release_script(
+                keys=[self.holds_key] + [self.stock_key(product_id) for _, product_id, _ in holds],
+                args=[hold for hold, _, _ in holds] + ["1" if restore else "0" for _, _, restore in holds],
+                client=client,
+            )
+        except RedisError as e:
+            logger.warning("Hold release failed, will retry: %s", e)
+            return 0
+        self.restored += int(restored)
+        return int(restored)
+
+    async def stop(self) -> None:
+        """Дописать очередь и остановить запись"""
+        if self._writer is None:
+            return
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self.write(batch)
+
+    def stats(self) -> dict:
+        return {
+            "reserved": self.reserved,
+            "sold_out": self.sold_out,
+            "batches": self.batches,
+            "orders_written": self.orders_written,
+            "avg_batch": round(self.orders_written / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "guard_rejections": self.guard_rejections,
+            "write_errors": self.write_errors,
+            "restored": self.restored,
+        }
+
+
+class BookingReleaser:
+    """Периодическое освобождение просроченных броней"""
+
+    def __init__(self, sale: FlashSale, interval: float, batch_size: int, grace: int):
+        self.sale = sale
+        self.interval = interval
+        self.batch_size = batch_size
+        self.grace = grace
+        self._task: Optional[asyncio.Task] = None
+        # Метрики
+        self.passes = 0
+        self.canceled_total = 0
+        self.errors = 0
+
+    async def _cancel(self, db, condition) -> Counter:
+        """Отменить PENDING-заказы по условию, вернуть остаток в products"""
+        canceled = (await db.execute(
+            update(Order)
+            .where(condition, Order.status == OrderStatus.PENDING)
+            .values(status=OrderStatus.CANCELED, updated_at=datetime.utcnow())
+            .returning(Order.product_id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        restored = Counter(canceled)
+        for product_id, count in restored.items():
+            await db.execute(
+                update(Product)
+                .where(Product.id == product_id, Product.stock >= 0)
+                .values(stock=Product.stock + count)
+            )
+        return restored
+
+    async def release_expired_holds(self) -> int:
+        """Брони из Redis с истёкшим сроком"""
+        now = time.time()
+        expired = await self.sale.client.zrangebyscore(
+            self.sale.holds_key, "-inf", now, start=0, num=self.batch_size, withscores=True,
+        )
+        if not expired:
+            return 0
+        holds: Dict[uuid.UUID, Tuple[str, int, float]] = {}
+        for member, score in expired:
+            product_id, order_id = member.split(":", 1)
+            holds[uuid.UUID(order_id)] = (member, int(product_id), score)
+
+        async with AsyncSessionLocal() as db:
+            restored = await self._cancel(db, Order.id.in_(list(holds)))
+            statuses = dict((await db.execute(
+                select(Order.id, Order.status).where(Order.id.in_(list(holds)))
+            )).all())
+            await db.commit()
+
+        release = []
+        for order_id, (member, product_id, score) in holds.items():
+            status = statuses.get(order_id)
+            if status is None:
+                # Заказ не записан: батч ещё в очереди или потерян - ждём grace
+                if score < now - self.grace:
+                    release.append((member, product_id, True))
+            elif status == OrderStatus.CANCELED:
+                release.append((member, product_id, True))
+            elif status != OrderStatus.PENDING:
+                release.append((member, product_id, False))  # оплачивается - остаток не возвращаем
+        await self.sale._release_holds(release)
+        await self.sale._stock_changed(restored)
+        return sum(restored.values())
+
+    async def release_stale_orders(self) -> int:
+        """PENDING-заказы без брони в Redis (Redis потерял данные, товар без лимита)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.sale.reservation_ttl + self.grace)
+        stale = (
+            select(Order.id)
+            .where(Order.status == OrderStatus.PENDING, Order.created_at < cutoff)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            restored = await self._cancel(db, Order.id.in_(stale))
+            await db.commit()
+        await self.sale._stock_changed(restored)
+        return sum(restored.values())
+
+    async def run_pass(self) -> int:
+        canceled = 0
+        try:
+            canceled += await self.release_expired_holds()
+        except RedisError as e:
+            logger.warning("Hold release skipped, Redis unavailable: %s", e)
+        canceled += await self.release_stale_orders()
+        self.passes += 1
+        self.canceled_total += canceled
+        if canceled:
+            logger.info("Released %d expired reservations", canceled)
+        return canceled
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Reservation release failed: %s", e, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever(), name="booking-releaser")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "passes": self.passes,
+            "canceled_total": self.canceled_total,
+            "errors": self.errors,
+        }
+
+
+flash_sale = FlashSale(
+    reservation_ttl=settings.ORDER_RESERVATION_TTL,
+    write_batch=settings.ORDER_WRITE_BATCH,
+    write_interval=settings.ORDER_WRITE_INTERVAL,
+)
+booking_releaser = BookingReleaser(
+    flash_sale,
+    interval=settings.ORDER_RELEASE_INTERVAL,
+    batch_size=settings.ORDER_RELEASE_BATCH,
+    grace=settings.ORDER_RELEASE_GRACE,
+)
+
+
+def _on_stock_change(mapper, connection, target):
+    """Остаток изменён через ORM (админка) - счётчик перечитается из БД"""
+    if not inspect(target).attrs.stock.history.has_changes():
+        return
+    session = object_session(target)
+    if session is None:
+        return
+    key = flash_sale.stock_key(target.id)
+
+    async def apply():
+        try:
+            await flash_sale.client.delete(key)
+        except RedisError as e:
+            logger.warning("Stock counter reset failed: %s", e)
+
+    after_commit(session, apply)
+
+
+event.listen(Product, "after_update", _on_stock_change)
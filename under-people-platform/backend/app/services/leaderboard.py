@@ -0,0 +1,466 @@
+"""
+Лидерборд по UP Coins на Redis sorted set.
+
+Счёт хранится в ZSET (score = up_coins, member = user id), отображаемые
+поля - в HASH рядом. Топ-N и "мой ранг с соседями" - ZREVRANGE/ZREVRANK,
+т.е. O(log n + k) вместо сортировки всей таблицы users на каждый запрос.
+
+Структура поддерживается инкрементально: изменения User через ORM
+и проводки журнала применяются после commit (app.db.hooks). Задачи после
+commit не упорядочены между собой (и между воркерами), поэтому каждая
+запись несёт users.leaderboard_revision - счётчик, который растёт под
+блокировкой строки в той же транзакции. Lua-скрипт применяет запись, только
+если ревизия больше сохранённой в HASH revisions, - опоздавшая запись со
+старым балансом отбрасывается. Удаление оставляет ревизию (tombstone).
+
+При старте воркера ZSET перестраивается из БД, если нет маркера полной
+сборки (ключ version): инкрементальное обновление после потери данных
+Redis создаёт ZSET заново, но в нём только изменившиеся с тех пор
+пользователи. Пока маркера нет, чтение отвечает LeaderboardNotReady и
+запускает пересборку в фоне.
+
+Пересборка пишет во временные ключи и подменяет ими текущие; пока она
+идёт (ключ rebuilding), инкрементальные записи применяются и к временным
+ключам, так что изменения во время пересборки не теряются. Сверка
+(start/stop) периодически повторяет пересборку - запись, потерянная из-за
+ошибки Redis, исправляется не позже чем через LEADERBOARD_RECONCILE_INTERVAL.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import object_session
+
+from app.core.cache import get_redis
+from app.core.config import settings
+from app.db.hooks import after_commit
+from app.db.session import AsyncSessionLocal
+from app.models.models import User
+
+logger = logging.getLogger(__name__)
+
+TRACKED_FIELDS = ("up_coins", "username", "clan_name", "is_active")
+
+# Версия формата ZSET/HASH; rebuild записывает её в ключ version последним
+# шагом, смена версии при деплое вызывает пересборку
+LEADERBOARD_VERSION = "2"
+
+# Ревизия удалённого пользователя: больше любой будущей, запись не вернётся
+DELETED_REVISION = 2 ** 53
+
+# KEYS: scores, meta, revisions [, tmp scores, tmp meta, tmp revisions, rebuilding]
+# ARGV: по пять на пользователя - user_id, ревизия, удалить (1/0), монеты, meta JSON
+# Записи с ревизией не больше сохранённой пропускаются; пока есть ключ
+# rebuilding, те же записи применяются к временным ключам пересборки.
+# Возвращает число применённых к основным ключам записей.
+APPLY_SCRIPT = """
+local function apply(scores, meta, revisions, user_id, revision, remove, coins, info)
+    local current = redis.call('HGET', revisions, user_id)
+    if current and tonumber(current) >= revision then
+        return 0
+    end
+    redis.call('HSET', revisions, user_id, revision)
+    if remove == '1' then
+        redis.call('ZREM', scores, user_id)
+        redis.call('HDEL', meta, user_id)
+    else
+        redis.call('ZADD', scores, coins, user_id)
+        redis.call('HSET', meta, user_id, info)
+    end
+    return 1
+end
+
+local mirror = #KEYS > 3 and redis.call('EXISTS', KEYS[7]) == 1
+local applied = 0
+for i = 1, #ARGV, 5 do
+    local user_id, revision = ARGV[i], tonumber(ARGV[i + 1])
+    applied = applied + apply(KEYS[1], KEYS[2], KEYS[3], user_id, revision, ARGV[i + 2], ARGV[i + 3], ARGV[i + 4])
+    if mirror then
+        apply(KEYS[4], KEYS[5], KEYS[6], user_id, revision, ARGV[i + 2], ARGV[i + 3], ARGV[i + 4])
+    end
+end
+return applied
+"""
+
+# KEYS: пары (временный, основной) и ключ rebuilding последним.
+# Подменить основные ключи временными; пустой временный (ни одного
+# пользователя) - удалить основной.
+SWAP_SCRIPT = """
+for i = 1, #KEYS - 1, 2 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 1])
+    else
+        redis.call('DEL', KEYS[i + 1])
+    end
+end
+redis.call('DEL', KEYS[#KEYS])
+return 1
+"""
+
+BUMP_REVISION_SQL = text("""
+    UPDATE users SET leaderboard_revision = leaderboard_revision + 1
+    WHERE id = :user_id
+    RETURNING leaderboard_revision
+""")
+
+
+class LeaderboardNotReady(Exception):
+    """ZSET ещё не построен полностью (идёт загрузка из БД)"""
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    rank: int
+    user_id: str
+    username: Optional[str]
+    coins: int
+    clan: Optional[str]
+
+    def to_dict(self) -> dict:
+        return {
+            "rank": self.rank,
+            "user_id": self.user_id,
+            "username": self.username,
+            "coins": self.coins,
+            "clan": self.clan,
+        }
+
+
+class Leaderboard:
+    """Ранжирование пользователей по up_coins"""
+
+    def __init__(
+        self,
+        prefix: str = "leaderboard",
+        rebuild_chunk: int = 5000,
+        rebuild_timeout: int = 900,
+        reconcile_interval: float = 3600,
+        client=None,
+    ):
+        self.scores_key = f"{prefix}:coins"
+        self.meta_key = f"{prefix}:meta"
+        self.revisions_key = f"{prefix}:revisions"
+        self.version_key = f"{prefix}:version"
+        self.lock_key = f"{prefix}:rebuild-lock"
+        self.rebuilding_key = f"{prefix}:rebuilding"
+        self.reconciled_key = f"{prefix}:reconciled"
+        self.rebuild_chunk = rebuild_chunk
+        self.rebuild_timeout = rebuild_timeout
+        self.reconcile_interval = reconcile_interval
+        self._client = client
+        self._apply_script = None
+        self._swap_script = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        # Метрики
+        self.updates_applied = 0
+        self.updates_stale = 0
+        self.rebuilds = 0
+        self.last_rebuild_users = 0
+        self.errors = 0
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    # -- запись ---------------------------------------------------------------
+
+    def _tmp(self, key: str) -> str:
+        return f"{key}:rebuild"
+
+    async def _apply(self, keys: List[str], updates: List[tuple]) -> int:
+        """updates: (user_id, ревизия, удалить, монеты, username, clan)"""
+        client = self.client
+        if self._apply_script is None:
+            self._apply_script = client.register_script(APPLY_SCRIPT)
+        args = []
+        for user_id, revision, remove, coins, username, clan in updates:
+            args += [
+                user_id, revision, int(remove), coins or 0,
+                "" if remove else json.dumps({"username": username, "clan": clan}),
+            ]
+        return int(await self._apply_script(keys=keys, args=args, client=client))
+
+    async def update(
+        self,
+        user_id: str,
+        revision: int,
+        coins: int,
+        username: Optional[str],
+        clan: Optional[str],
+        remove: bool = False,
+    ) -> bool:
+        """Применить изменение, если revision новее сохранённой (False - запись устарела)"""
+        keys = [self.scores_key, self.meta_key, self.revisions_key]
+        keys += [self._tmp(key) for key in keys] + [self.rebuilding_key]
+        applied = await self._apply(keys, [(user_id, revision, remove, coins, username, clan)])
+        if applied:
+            self.updates_applied += 1
+        else:
+            self.updates_stale += 1
+        return bool(applied)
+
+    def mark_complete(self, pipe) -> None:
+        """Добавить в pipeline запись маркера полной сборки"""
+        pipe.set(self.version_key, LEADERBOARD_VERSION)
+
+    async def rebuild(self) -> int:
+        """
+        Перестроить лидерборд из БД и атомарно подменить текущий.
+        
+        Неактивные пользователи попадают только в revisions (tombstone), чтобы
+        опоздавшая запись с меньшей ревизией их не вернула.
+        """
+        keys = [self.scores_key, self.meta_key, self.revisions_key]
+        tmp_keys = [self._tmp(key) for key in keys]
+        # Сначала очистить временные ключи, затем включить зеркалирование
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*tmp_keys)
+        pipe.set(self.rebuilding_key, "1", ex=self.rebuild_timeout)
+        await pipe.execute()
+
+        total = 0
+        query = (
+            select(
+                User.id, User.up_coins, User.username, User.clan_name,
+                User.is_active, User.leaderboard_revision,
+            )
+            .execution_options(yield_per=self.rebuild_chunk)
+        )
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.stream(query)
+                async for rows in result.partitions():
+                    await self._apply(tmp_keys, [
+                        (str(r.id), r.leaderboard_revision, not r.is_active, r.up_coins, r.username, r.clan_name)
+                        for r in rows
+                    ])
+                    total += sum(1 for r in rows if r.is_active)
+        except Exception:
+            await self.client.delete(self.rebuilding_key, *tmp_keys)
+            raise
+
+        client = self.client
+        if self._swap_script is None:
+            self._swap_script = client.register_script(SWAP_SCRIPT)
+        swap_keys = [key for pair in zip(tmp_keys, keys) for key in pair] + [self.rebuilding_key]
+        pipe = client.pipeline(transaction=True)
+        await self._swap_script(keys=swap_keys, client=pipe)
+        self.mark_complete(pipe)
+        await pipe.execute()
+        self.rebuilds += 1
+        self.last_rebuild_users = total
+        logger.info("Leaderboard rebuilt with %d users", total)
+        return total
+
+    async def is_complete(self) -> bool:
+        return await self.client.get(self.version_key) == LEADERBOARD_VERSION
+
+    async def _rebuild_once(self) -> Optional[int]:
+        """Пересборка под lock (между воркерами); None - её уже выполняет другой"""
+        if not await self.client.set(self.lock_key, "1", nx=True, ex=self.rebuild_timeout):
+            return None
+        try:
+            return await self.rebuild()
+        finally:
+            await self.client.delete(self.lock_key)
+
+    async def ensure_loaded(self) -> None:
+        """Построить лидерборд, если нет маркера полной сборки (один воркер строит)"""
+        if await self.is_complete():
+            return
+        await self._rebuild_once()
+
+    def request_rebuild(self) -> None:
+        """Запустить ensure_loaded в фоне (не больше одной задачи на процесс)"""
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return
+        # Свой контекст: задача не наследует contextvars запроса, который её запустил
+        self._rebuild_task = asyncio.get_running_loop().create_task(
+            self._rebuild_quietly(), context=contextvars.Context()
+        )
+
+    async def _rebuild_quietly(self) -> None:
+        try:
+            await self.ensure_loaded()
+        except Exception as e:
+            logger.warning("Leaderboard rebuild failed: %s", e)
+
+    def _not_ready(self) -> LeaderboardNotReady:
+        self.request_rebuild()
+        return LeaderboardNotReady()
+
+    # -- сверка ---------------------------------------------------------------
+
+    async def run_pass(self) -> Optional[int]:
+        """
+        Пересобрать лидерборд из БД - исправляет записи, потерянные из-за
+        ошибок Redis. Интервал общий для воркеров: проход выполняет тот, кто
+        первым поставил ключ reconciled (живёт reconcile_interval).
+        """
+        if not await self.client.set(self.reconciled_key, "1", nx=True, ex=max(1, int(self.reconcile_interval))):
+            return None
+        return await self._rebuild_once()
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Leaderboard reconcile failed: %s", e, exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever(), name="leaderboard-reconcile")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "updates_applied": self.updates_applied,
+            "updates_stale": self.updates_stale,
+            "rebuilds": self.rebuilds,
+            "last_rebuild_users": self.last_rebuild_users,
+            "errors": self.errors,
+        }
+
+    # -- чтение ---------------------------------------------------------------
+
+    async def _entries(self, start: int, stop: int) -> List[LeaderboardEntry]:
+        # Маркер читается в том же round trip, что и диапазон
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self.version_key)
+        pipe.zrevrange(self.scores_key, start, stop, withscores=True)
+        version, members = await pipe.execute()
+        if version != LEADERBOARD_VERSION:
+            raise self._not_ready()
+        if not members:
+            return []
+        metas = await self.client.hmget(self.meta_key, [m for m, _ in members])
+        entries = []
+        for offset, ((member, score), meta) in enumerate(zip(members, metas)):
+            info = json.loads(meta) if meta else {}
+            entries.append(LeaderboardEntry(
+                rank=start + offset + 1,
+                user_id=member,
+                username=info.get("username"),
+                coins=int(score),
+                clan=info.get("clan"),
+            ))
+        return entries
+
+    async def top(self, limit: int, offset: int = 0) -> List[LeaderboardEntry]:
+        """
+        Raises:
+            LeaderboardNotReady: лидерборд не собран полностью (FAST_BOOT,
+                потеря данных Redis) - ответ нужно брать из БД
+        """
+        return await self._entries(offset, offset + limit - 1)
+
+    async def _position(self, user_id: str) -> Tuple[Optional[int], int]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self.version_key)
+        pipe.zrevrank(self.scores_key, user_id)
+        pipe.zcard(self.scores_key)
+        version, rank, total = await pipe.execute()
+        if version != LEADERBOARD_VERSION:
+            raise self._not_ready()
+        return rank, total
+
+    async def rank(self, user_id: str) -> Optional[int]:
+        rank, _ = await self._position(user_id)
+        return None if rank is None else rank + 1
+
+    async def around(self, user_id: str, radius: int) -> Optional[dict]:
+        """
+        Ранг пользователя и radius соседей сверху и снизу (None - не в рейтинге)
+
+        Raises:
+            LeaderboardNotReady: лидерборд не собран полностью
+        """
+        rank, total = await self._position(user_id)
+        if rank is None:
+            return None
+        start = max(0, rank - radius)
+        return {
+            "rank": rank + 1,
+            "total": total,
+            "neighbours": await self._entries(start, rank + radius),
+        }
+
+
+leaderboard = Leaderboard(
+    rebuild_timeout=settings.LEADERBOARD_REBUILD_TIMEOUT,
+    reconcile_interval=settings.LEADERBOARD_RECONCILE_INTERVAL,
+)
+
+
+def schedule_update(
+    session,
+    user_id: str,
+    revision: int,
+    coins: int,
+    username: Optional[str],
+    clan: Optional[str],
+    remove: bool = False,
+) -> None:
+    """
+    Обновить лидерборд после commit сессии.
+    
+    Для изменений up_coins через Core UPDATE (списания/зачисления одним
+    запросом), которые не проходят через mapper events. revision -
+    users.leaderboard_revision, увеличенная тем же UPDATE.
+    """
+    async def apply():
+        try:
+            await leaderboard.update(user_id, revision, coins, username, clan, remove=remove)
+        except RedisError as e:
+            leaderboard.errors += 1
+            logger.warning("Leaderboard update failed (fixed by the next reconcile): %s", e)
+
+    after_commit(session, apply)
+
+
+def _schedule(target: User, revision: int, remove: bool) -> None:
+    session = object_session(target)
+    if session is None:
+        return
+    schedule_update(
+        session, str(target.id), revision, target.up_coins or 0, target.username, target.clan_name,
+        remove=remove,
+    )
+
+
+@event.listens_for(User, "after_insert")
+def _on_user_insert(mapper, connection, target):
+    _schedule(target, target.leaderboard_revision or 0, remove=target.is_active is False)
+
+
+@event.listens_for(User, "after_update")
+def _on_user_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in TRACKED_FIELDS):
+        # Строка уже заблокирована этим UPDATE - ревизия растёт в порядке commit
+        revision = connection.execute(BUMP_REVISION_SQL, {"user_id": target.id}).scalar()
+        _schedule(target, revision, remove=target.is_active is False)
+
+
+@event.listens_for(User, "after_delete")
+def _on_user_delete(mapper, connection, target):
+    _schedule(target, DELETED_REVISION, remove=True)
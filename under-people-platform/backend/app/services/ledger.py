@@ -0,0 +1,298 @@
+"""
+Журнал UP Coins.
+
+Каждое изменение баланса - запись в coin_ledger (только INSERT) с ключом
+идемпотентности entry_id. users.up_coins - проекция журнала: её меняет та
+же команда, что пишет записи, поэтому проекция и журнал расходятся только
+при изменении up_coins в обход post_entries (проверяет reconcile_ledger.py).
+
+post_entries - одна SQL-команда на любую пачку записей: INSERT ... ON
+CONFLICT (entry_id) DO NOTHING в CTE, затем UPDATE users на сумму реально
+вставленных записей по каждому пользователю. Повтор с тем же entry_id
+ничего не меняет. Списание, уводящее баланс в минус, отклоняется
+(InsufficientCoins, вызывающий откатывает транзакцию). Пачки с несколькими
+пользователями сначала блокируют их строки в порядке id - встречные
+проводки не дают взаимной блокировки.
+
+Баланс по журналу = последний снимок (coin_balance_snapshots) + сумма
+записей после него; LedgerSnapshotter периодически сворачивает новые
+записи в снимки, так что "хвост" остаётся коротким. Записи моложе
+LEDGER_SNAPSHOT_LAG не сворачиваются: их транзакции могли ещё не
+закоммититься, и запись с меньшим id появилась бы ниже границы снимка.
+
+Изменения up_coins через ORM (создание пользователя, правка в админке)
+записываются в журнал mapper events.
+"""
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.models import CoinLedgerEntry, CoinReason, User
+from app.services.leaderboard import schedule_update
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_LOCK_ID = 7_310_024_001
+
+
+class InsufficientCoins(Exception):
+    """Списание больше баланса (или со счёта неактивного пользователя)"""
+
+    def __init__(self, user_id):
+        super().__init__(f"Insufficient UP coins: {user_id}")
+        self.user_id = user_id
+
+
+@dataclass(frozen=True)
+class LedgerEntry:
+    entry_id: str
+    user_id: uuid.UUID
+    amount: int
+    reason: CoinReason
+    ref: Optional[str] = None
+
+
+LOCK_USERS_SQL = text("""
+    SELECT id FROM users
+    WHERE id = ANY(CAST(:user_ids AS uuid[]))
+    ORDER BY id
+    FOR UPDATE
+""")
+
+POST_SQL = text("""
+    WITH entry AS (
+        INSERT INTO coin_ledger (entry_id, user_id, amount, reason, ref, created_at)
+        SELECT e.entry_id, e.user_id, e.amount, e.reason, e.ref, now()
+        FROM unnest(
+            CAST(:entry_ids AS varchar[]),
+            CAST(:user_ids AS uuid[]),
+            CAST(:amounts AS bigint[]),
+            CAST(:reasons AS varchar[]),
+            CAST(:refs AS varchar[])
+        ) AS e(entry_id, user_id, amount, reason, ref)
+        ON CONFLICT (entry_id) DO NOTHING
+        RETURNING user_id, amount
+    ), delta AS (
+        SELECT user_id, sum(amount)::bigint AS amount, count(*) AS entries
+        FROM entry
+        GROUP BY user_id
+    )
+    UPDATE users u
+    SET up_coins = COALESCE(u.up_coins, 0) + d.amount,
+        leaderboard_revision = u.leaderboard_revision + 1,
+        updated_at = now()
+    FROM delta d
+    WHERE u.id = d.user_id
+    RETURNING u.id, u.up_coins, u.is_active, u.username, u.clan_name, u.leaderboard_revision, d.entries
+""")
+
+BALANCE_SQL = text("""
+    SELECT COALESCE(s.balance, 0) + COALESCE((
+               SELECT sum(l.amount) FROM coin_ledger l
+               WHERE l.user_id = u.user_id AND l.id > COALESCE(s.last_entry_id, 0)
+           ), 0) AS balance,
+           s.last_entry_id,
+           s.taken_at
+    FROM (SELECT CAST(:user_id AS uuid) AS user_id) u
+    LEFT JOIN coin_balance_snapshots s ON s.user_id = u.user_id
+""")
+
+SNAPSHOT_SQL = text("""
+    INSERT INTO coin_balance_snapshots (user_id, balance, last_entry_id, taken_at)
+    SELECT l.user_id, COALESCE(s.balance, 0) + sum(l.amount), max(l.id), now()
+    FROM coin_ledger l
+    LEFT JOIN coin_balance_snapshots s ON s.user_id = l.user_id
+    WHERE l.id > :low AND l.id <= :high AND l.id > COALESCE(s.last_entry_id, 0)
+    GROUP BY l.user_id, s.balance
+    ON CONFLICT (user_id) DO UPDATE
+    SET balance = EXCLUDED.balance, last_entry_id = EXCLUDED.last_entry_id, taken_at = EXCLUDED.taken_at
+""")
+
+
+async def post_entries(db: AsyncSession, entries: Sequence[LedgerEntry]) -> Dict[uuid.UUID, Any]:
+    """
+    Провести записи в текущей транзакции (commit - за вызывающим).
+
+    Возвращает {user_id: строка (id, up_coins, is_active, username,
+    clan_name, leaderboard_revision, entries)} для пользователей, чей баланс изменился; записи с
+    уже существующим entry_id пропускаются. Лидерборд обновляется после commit.
+
+    Raises:
+        InsufficientCoins: списание увело баланс в минус или пользователь
+            неактивен - транзакцию нужно откатить
+    """
+    if not entries:
+        return {}
+    user_ids = {entry.user_id for entry in entries}
+    if len(user_ids) > 1:
+        await db.execute(LOCK_USERS_SQL, {"user_ids": list(user_ids)})
+
+    result = await db.execute(POST_SQL, {
+        "entry_ids": [entry.entry_id for entry in entries],
+        "user_ids": [entry.user_id for entry in entries],
+        "amounts": [entry.amount for entry in entries],
+        "reasons": [CoinReason(entry.reason).value for entry in entries],
+        "refs": [entry.ref for entry in entries],
+    })
+    balances = {row.id: row for row in result.all()}
+
+    debited = {entry.user_id for entry in entries if entry.amount < 0}
+    for user_id, row in balances.items():
+        if user_id in debited and (row.up_coins < 0 or not row.is_active):
+            raise InsufficientCoins(user_id)
+
+    # Неактивные не возвращаются в лидерборд зачислением (продажа на рынке и т.п.)
+    for row in balances.values():
+        schedule_update(
+            db.sync_session, str(row.id), row.leaderboard_revision, row.up_coins, row.username, row.clan_name,
+            remove=not row.is_active,
+        )
+    return balances
+
+
+async def ledger_balance(db: AsyncSession, user_id) -> dict:
+    """Баланс по журналу: снимок + записи после него"""
+    row = (await db.execute(BALANCE_SQL, {"user_id": user_id})).one()
+    return {"balance": int(row.balance), "snapshot_entry_id": row.last_entry_id, "snapshot_at": row.taken_at}
+
+
+async def ledger_history(db: AsyncSession, user_id, limit: int, before: Optional[int] = None) -> list:
+    """Записи пользователя, новые первыми (keyset по id)"""
+    stmt = (
+        select(CoinLedgerEntry.id, CoinLedgerEntry.amount, CoinLedgerEntry.reason,
+               CoinLedgerEntry.ref, CoinLedgerEntry.created_at)
+        .where(CoinLedgerEntry.user_id == user_id)
+        .order_by(CoinLedgerEntry.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        stmt = stmt.where(CoinLedgerEntry.id < before)
+    return (await db.execute(stmt)).all()
+
+
+class LedgerSnapshotter:
+    """Периодическое сворачивание новых записей журнала в снимки балансов"""
+
+    def __init__(self, interval: float, lag: float, chunk: int):
+        self.interval = interval
+        self.lag = lag
+        self.chunk = chunk
+        self._task: Optional[asyncio.Task] = None
+        # Метрики
+        self.passes = 0
+        self.snapshots_written = 0
+        self.last_entry_id = 0
+        self.errors = 0
+
+    async def run_pass(self) -> int:
+        """Один проход; в нескольких воркерах работает только владелец advisory lock"""
+        async with AsyncSessionLocal() as db:
+            locked = (await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:lock_id)"), {"lock_id": SNAPSHOT_LOCK_ID}
+            )).scalar()
+            if not locked:
+                return 0
+            low = (await db.execute(
+                text("SELECT COALESCE(max(last_entry_id), 0) FROM coin_balance_snapshots")
+            )).scalar()
+            high = (await db.execute(
+                text("""
+                    SELECT max(id) FROM coin_ledger
+                    WHERE id > :low AND created_at < now() - make_interval(secs => :lag)
+                """),
+                {"low": low, "lag": self.lag},
+            )).scalar()
+            written = 0
+            if high is not None:
+                for chunk_low in range(low, high, self.chunk):
+                    result = await db.execute(
+                        SNAPSHOT_SQL, {"low": chunk_low, "high": min(chunk_low + self.chunk, high)}
+                    )
+                    written += result.rowcount or 0
+                self.last_entry_id = high
+            await db.commit()
+
+        self.passes += 1
+        self.snapshots_written += written
+        if written:
+            logger.info("Ledger snapshots updated", extra={"users": written, "last_entry_id": high})
+        return written
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Ledger snapshot failed: %s", e, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever(), name="ledger-snapshotter")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "passes": self.passes,
+            "snapshots_written": self.snapshots_written,
+            "last_entry_id": self.last_entry_id,
+            "errors": self.errors,
+        }
+
+
+ledger_snapshotter = LedgerSnapshotter(
+    interval=settings.LEDGER_SNAPSHOT_INTERVAL,
+    lag=settings.LEDGER_SNAPSHOT_LAG,
+    chunk=settings.LEDGER_SNAPSHOT_CHUNK,
+)
+
+
+def _insert_entry(connection, entry_id: str, user_id, amount: int, reason: CoinReason) -> None:
+    connection.execute(CoinLedgerEntry.__table__.insert().values(
+        entry_id=entry_id,
+        user_id=user_id,
+        amount=amount,
+        reason=reason.value,
+        created_at=datetime.now(timezone.utc),
+    ))
+
+
+@event.listens_for(User, "after_insert")
+def _record_opening_balance(mapper, connection, target):
+    """Стартовый баланс нового пользователя - первая запись журнала"""
+    if target.up_coins:
+        _insert_entry(connection, f"opening:{target.id}", target.id, target.up_coins, CoinReason.OPENING_BALANCE)
+
+
+@event.listens_for(User, "before_update")
+def _record_adjustment(mapper, connection, target):
+    """up_coins изменён через ORM - разница записывается корректировкой"""
+    if not inspect(target).attrs.up_coins.history.has_changes():
+        return
+    if not isinstance(target.up_coins, int):
+        logger.warning("up_coins set to an SQL expression via ORM - not recorded in the ledger")
+        return
+    current = connection.execute(select(User.up_coins).where(User.id == target.id)).scalar() or 0
+    if target.up_coins != current:
+        _insert_entry(
+            connection, f"adjustment:{uuid.uuid4()}", target.id, target.up_coins - current, CoinReason.ADJUSTMENT,
+        )
@@ -0,0 +1,118 @@
+"""
+Фоновые задачи обслуживания, работающие в жизненном цикле приложения.
+
+AuthCodeSweeper удаляет истёкшие и использованные auth_codes небольшими
+батчами (DELETE ... LIMIT через FOR UPDATE SKIP LOCKED), чтобы очистка
+не держала долгих блокировок и не попадала в latency пользовательских запросов.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import delete, func, or_, select
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.models import AuthCode
+
+logger = logging.getLogger(__name__)
+
+
+class AuthCodeSweeper:
+    """Периодическая батчевая очистка таблицы auth_codes"""
+
+    def __init__(self, interval: float, batch_size: int, max_batches: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._task: Optional[asyncio.Task] = None
+        # Метрики
+        self.passes = 0
+        self.rows_removed_total = 0
+        self.last_pass_rows = 0
+        self.last_pass_seconds = 0.0
+        self.last_pass_at: Optional[float] = None
+        self.errors = 0
+
+    async def sweep_batch(self) -> int:
+        """Удалить один батч, вернуть число удалённых строк"""
+        doomed = (
+            select(AuthCode.id)
+            .where(or_(AuthCode.used == True, AuthCode.expires_at < func.now()))
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(AuthCode)
+                .where(AuthCode.id.in_(doomed))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return result.rowcount or 0
+
+    async def run_pass(self) -> int:
+        """Один проход: батчи до исчерпания или до max_batches"""
+        started = time.perf_counter()
+        removed = 0
+        for _ in range(self.max_batches):
+            batch_removed = await self.sweep_batch()
+            removed += batch_removed
+            if batch_removed < self.batch_size:
+                break
+            # Отдаём event loop пользовательским запросам между батчами
+            await asyncio.sleep(0)
+
+        self.passes += 1
+        self.rows_removed_total += removed
+        self.last_pass_rows = removed
+        self.last_pass_seconds = time.perf_counter() - started
+        self.last_pass_at = time.time()
+        if removed:
+            logger.info(
+                "Auth code sweep removed %d rows in %.3fs",
+                removed, self.last_pass_seconds,
+            )
+        return removed
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Auth code sweep failed: %s", e, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever(), name="auth-code-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "passes": self.passes,
+            "rows_removed_total": self.rows_removed_total,
+            "last_pass_rows": self.last_pass_rows,
+            "last_pass_seconds": round(self.last_pass_seconds, 4),
+            "last_pass_at": self.last_pass_at,
+            "errors": self.errors,
+        }
+
+
+auth_code_sweeper = AuthCodeSweeper(
+    interval=settings.AUTH_CODE_SWEEP_INTERVAL_SECONDS,
+    batch_size=settings.AUTH_CODE_SWEEP_BATCH_SIZE,
+    max_batches=settings.AUTH_CODE_SWEEP_MAX_BATCHES,
+)
@@ -0,0 +1,302 @@
+"""
+Витрина маркетплейса: выборка лотов с фильтрами и keyset-пагинацией.
+
+rarity и clan карты денормализованы в market_listings (заполняются при
+вставке лота, синхронизируются при изменении Card), поэтому фильтр не
+требует JOIN с user_cards/cards. Для каждой комбинации фильтров и
+сортировки есть составной индекс (см. MarketListing.__table_args__):
+равенство по rarity/clan, затем колонка сортировки и id.
+
+Страницы - keyset: курсор хранит (значение сортировки, id) последнего
+лота, следующая страница - условие (col, id) > / < (value, id) по тому же
+индексу. Стоимость страницы не зависит от её глубины, в отличие от OFFSET.
+Общее число лотов не считается (COUNT по миллиону строк на каждый запрос).
+
+Данные карты берутся из снимка каталога воркера (app.services.packs),
+продавец - JOIN users только для строк страницы.
+
+Покупка (purchase_listing) - одна транзакция из условных команд без
+чтения-изменения-записи в Python:
+
+1. DELETE лота ... RETURNING - блокировка строки лота. Из одновременных
+   покупателей одного лота его получает первый, остальные ждут только
+   этот DELETE и после commit победителя получают 0 строк.
+2. Списание у покупателя и зачисление продавцу - две записи журнала
+   (app.services.ledger.post_entries): блокировка пользователей в порядке
+   id, поэтому встречные сделки (A покупает у B, B у A) не дают взаимной
+   блокировки; списание сверх баланса отклоняется.
+3. Передача UserCard владельцу-покупателю.
+
+Любой отказ - rollback, лот возвращается на витрину.
+"""
+import base64
+import binascii
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, inspect, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import MARKET_PURCHASES
+from app.models.models import Card, CoinReason, MarketListing, Rarity, User, UserCard
+from app.services.ledger import InsufficientCoins, LedgerEntry, post_entries
+from app.services.packs import pack_engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLAN = "Outcasts"
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или выдан для другой сортировки"""
+
+
+class PurchaseError(Exception):
+    """Покупка отклонена; транзакция откатана"""
+
+    outcome = "error"
+
+
+class ListingUnavailable(PurchaseError):
+    """Лота нет: не существовал или уже куплен"""
+
+    outcome = "unavailable"
+
+
+class OwnListing(PurchaseError):
+    """Покупатель - продавец этого лота"""
+
+    outcome = "own_listing"
+
+
+class InsufficientFunds(PurchaseError):
+    """Не хватает UP Coins (или покупатель неактивен)"""
+
+    outcome = "insufficient_funds"
+
+
+@dataclass(frozen=True)
+class ListingSort:
+    name: str
+    column: object
+    descending: bool
+
+    def encode_value(self, value) -> str:
+        return value.isoformat() if isinstance(value, datetime) else str(value)
+
+    def decode_value(self, raw: str):
+        return datetime.fromisoformat(raw) if self.column is MarketListing.created_at else int(raw)
+
+
+SORTS: Dict[str, ListingSort] = {
+    "newest": ListingSort("newest", MarketListing.created_at, descending=True),
+    "price_asc": ListingSort("price_asc", MarketListing.price, descending=False),
+    "price_desc": ListingSort("price_desc", MarketListing.price, descending=True),
+}
+DEFAULT_SORT = "newest"
+
+
+@dataclass(frozen=True)
+class ListingFilters:
+    rarity: Optional[Rarity] = None
+    clan: Optional[str] = None
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+
+
+def encode_cursor(sort: ListingSort, value, listing_id: int) -> str:
+    raw = f"{sort.name}|{sort.encode_value(value)}|{listing_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(sort: ListingSort, cursor: str) -> Tuple[object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        name, value, listing_id = raw.split("|")
+        if name != sort.name:
+            raise InvalidCursor(f"Cursor was issued for sort '{name}'")
+        return sort.decode_value(value), int(listing_id)
+    except InvalidCursor:
+        raise
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+
+
+def listings_query(filters: ListingFilters, sort: ListingSort, after: Optional[Tuple[object, int]], limit: int):
+    """SELECT одной страницы (limit строк) - range scan по индексу фильтра/сортировки"""
+    stmt = (
+        select(
+            MarketListing.id,
+            MarketListing.price,
+            MarketListing.created_at,
+            MarketListing.card_id,
+            MarketListing.seller_id,
+            User.username.label("seller_username"),
+        )
+        .outerjoin(User, User.id == MarketListing.seller_id)
+    )
+    if filters.rarity is not None:
+        stmt = stmt.where(MarketListing.rarity == filters.rarity)
+    if filters.clan is not None:
+        stmt = stmt.where(MarketListing.clan == filters.clan)
+    if filters.min_price is not None:
+        stmt = stmt.where(MarketListing.price >= filters.min_price)
+    if filters.max_price is not None:
+        stmt = stmt.where(MarketListing.price <= filters.max_price)
+
+    key = tuple_(sort.column, MarketListing.id)
+    if after is not None:
+        stmt = stmt.where(key < tuple_(*after) if sort.descending else key > tuple_(*after))
+
+    if sort.descending:
+        stmt = stmt.order_by(sort.column.desc(), MarketListing.id.desc())
+    else:
+        stmt = stmt.order_by(sort.column.asc(), MarketListing.id.asc())
+    return stmt.limit(limit)
+
+
+async def browse_listings(
+    db: AsyncSession,
+    filters: ListingFilters,
+    sort_name: str = DEFAULT_SORT,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> dict:
+    """
+    Страница витрины: {"listings": [...], "next_cursor": str | None}.
+
+    Raises:
+        InvalidCursor: курсор не разбирается или выдан для другой сортировки
+    """
+    sort = SORTS[sort_name]
+    after = decode_cursor(sort, cursor) if cursor else None
+
+    # Лишняя строка показывает, есть ли следующая страница
+    result = await db.execute(listings_query(filters, sort, after, limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    catalog = await pack_engine.catalog(db)
+    if any(row.card_id not in catalog.by_id for row in rows):
+        # Карта добавлена после снимка каталога в этом воркере
+        pack_engine.mark_stale()
+        catalog = await pack_engine.catalog(db)
+
+    listings: List[dict] = []
+    for row in rows:
+        card = catalog.by_id.get(row.card_id)
+        listings.append({
+            "id": row.id,
+            "price": row.price,
+            "created_at": row.created_at,
+            "card": card.payload if card is not None else {"id": row.card_id},
+            "seller": {"id": row.seller_id, "username": row.seller_username},
+        })
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, sort.column.key), last.id)
+    return {"listings": listings, "next_cursor": next_cursor}
+
+
+async def purchase_listing(db: AsyncSession, listing_id: int, buyer_id) -> dict:
+    """
+    Купить лот: списать цену у покупателя, зачислить продавцу, передать карту.
+
+    Коммитит сессию. Raises PurchaseError (ListingUnavailable, OwnListing,
+    InsufficientFunds) после rollback.
+    """
+    try:
+        listing = (await db.execute(
+            delete(MarketListing)
+            .where(MarketListing.id == listing_id, MarketListing.seller_id.is_distinct_from(buyer_id))
+            .returning(MarketListing.seller_id, MarketListing.user_card_id, MarketListing.card_id, MarketListing.price)
+        )).first()
+        if listing is None:
+            own = (await db.execute(
+                select(MarketListing.id).where(MarketListing.id == listing_id, MarketListing.seller_id == buyer_id)
+            )).first()
+            raise OwnListing() if own is not None else ListingUnavailable()
+
+        purchase = f"market:{listing_id}:{uuid.uuid4()}"
+        entries = [LedgerEntry(f"{purchase}:debit", buyer_id, -listing.price, CoinReason.MARKET_PURCHASE, str(listing_id))]
+        if listing.seller_id is not None:
+            entries.append(LedgerEntry(
+                f"{purchase}:credit", listing.seller_id, listing.price, CoinReason.MARKET_SALE, str(listing_id),
+            ))
+        try:
+            balances = await post_entries(db, entries)
+        except InsufficientCoins:
+            raise InsufficientFunds()
+        buyer = balances.get(buyer_id)
+        if buyer is None:
+            raise InsufficientFunds()
+
+        transferred = (await db.execute(
+            update(UserCard)
+            .where(UserCard.id == listing.user_card_id, UserCard.user_id.is_not_distinct_from(listing.seller_id))
+            .values(user_id=buyer_id, is_locked=False)
+            .returning(UserCard.id)
+        )).first()
+        if transferred is None:
+            # Карта лота уже не у продавца - лот недействителен
+            raise ListingUnavailable()
+
+        await db.commit()
+    except PurchaseError as e:
+        await db.rollback()
+        MARKET_PURCHASES.labels(e.outcome).inc()
+        raise
+    except Exception:
+        await db.rollback()
+        MARKET_PURCHASES.labels("error").inc()
+        raise
+
+    MARKET_PURCHASES.labels("completed").inc()
+    return {
+        "listing_id": listing_id,
+        "user_card_id": listing.user_card_id,
+        "card_id": listing.card_id,
+        "price": listing.price,
+        "seller_id": listing.seller_id,
+        "balance": buyer.up_coins,
+    }
+
+
+@event.listens_for(MarketListing, "before_insert")
+def _fill_card_attributes(mapper, connection, target):
+    """card_id/rarity/clan лота - из выставленной карты, если не заданы явно"""
+    if target.card_id is not None and target.rarity is not None and target.clan is not None:
+        return
+    row = connection.execute(
+        select(UserCard.card_id, Card.rarity, Card.clan)
+        .join(Card, Card.id == UserCard.card_id)
+        .where(UserCard.id == target.user_card_id)
+    ).first()
+    if row is None:
+        return  # NOT NULL отклонит вставку
+    if target.card_id is None:
+        target.card_id = row.card_id
+    if target.rarity is None:
+        target.rarity = row.rarity
+    if target.clan is None:
+        target.clan = row.clan or DEFAULT_CLAN
+
+
+@event.listens_for(Card, "after_update")
+def _sync_listings(mapper, connection, target):
+    """Смена редкости/клана карты переносится в её лоты в той же транзакции"""
+    state = inspect(target)
+    if not (state.attrs.rarity.history.has_changes() or state.attrs.clan.history.has_changes()):
+        return
+    listings = MarketListing.__table__
+    connection.execute(
+        update(listings)
+        .where(listings.c.card_id == target.id)
+        .values(rarity=target.rarity, clan=target.clan or DEFAULT_CLAN)
+    )
@@ -0,0 +1,224 @@
+"""
+Открытие паков карт.
+
+Вероятность карты = вес её редкости в паке / число карт этой редкости.
+Для каждого типа пака по всему каталогу строится alias-таблица (метод
+Vose), поэтому выбор карты - O(1): одно случайное число даёт и ячейку,
+и исход "своя карта / alias". Пак из N карт - N таких шагов, без поиска
+по кумулятивным весам.
+
+Таблицы перестраиваются при изменении каталога: изменение Card через ORM
+помечает каталог устаревшим после commit (в этом воркере сразу, в
+остальных - по истечении PACK_CATALOG_TTL).
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+
+from app.core.config import settings
+from app.core.serializers import card_item
+from app.db.hooks import after_commit
+from app.models.models import Card, Rarity
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PackType:
+    name: str
+    price: int  # UP Coins
+    size: int
+    weights: Dict[Rarity, float]
+
+
+PACK_TYPES: Dict[str, PackType] = {
+    "standard": PackType(
+        "standard", price=100, size=5,
+        weights={Rarity.COMMON: 70, Rarity.RARE: 20, Rarity.EPIC: 8, Rarity.LEGENDARY: 2},
+    ),
+    "premium": PackType(
+        "premium", price=450, size=5,
+        weights={Rarity.COMMON: 40, Rarity.RARE: 35, Rarity.EPIC: 20, Rarity.LEGENDARY: 5},
+    ),
+}
+
+
+class AliasTable:
+    """Выборка из дискретного распределения за O(1) (Vose's alias method)"""
+
+    __slots__ = ("items", "prob", "alias", "size")
+
+    def __init__(self, items: Sequence, weights: Sequence[float]):
+        if not items or len(items) != len(weights):
+            raise ValueError("AliasTable needs one positive weight per item")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("AliasTable weights must sum to a positive value")
+
+        n = len(items)
+        scaled = [w * n / total for w in weights]
+        prob = [0.0] * n
+        alias = [0] * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Остатки - 1.0 с точностью до ошибок округления
+        for i in large + small:
+            prob[i] = 1.0
+            alias[i] = i
+
+        self.items = list(items)
+        self.prob = prob
+        self.alias = alias
+        self.size = n
+
+    def sample(self, random_fn: Callable[[], float] = random.random):
+        u = random_fn() * self.size
+        i = int(u)
+        return self.items[i] if u - i < self.prob[i] else self.items[self.alias[i]]
+
+    def sample_many(self, k: int, random_fn: Callable[[], float] = random.random) -> list:
+        items, prob, alias, n = self.items, self.prob, self.alias, self.size
+        result = []
+        for _ in range(k):
+            u = random_fn() * n
+            i = int(u)
+            result.append(items[i] if u - i < prob[i] else items[alias[i]])
+        return result
+
+
+@dataclass(frozen=True)
+class CatalogCard:
+    id: int
+    rarity: Rarity
+    payload: dict  # готовое тело ответа (card_item), собирается при загрузке каталога
+
+
+class PackCatalog:
+    """Снимок каталога карт и alias-таблицы для всех типов паков"""
+
+    def __init__(self, cards: Sequence[CatalogCard], pack_types: Dict[str, PackType]):
+        self.cards = list(cards)
+        self.by_id: Dict[int, CatalogCard] = {card.id: card for card in self.cards}
+        self.tables: Dict[str, AliasTable] = {}
+        by_rarity: Dict[Rarity, List[CatalogCard]] = {}
+        for card in self.cards:
+            by_rarity.setdefault(card.rarity, []).append(card)
+
+        for name, pack in pack_types.items():
+            # Редкости без карт в каталоге выпадают, остальные веса нормируются
+            weights = []
+            items = []
+            for rarity, pool in by_rarity.items():
+                weight = pack.weights.get(rarity, 0)
+                if weight > 0:
+                    items.extend(pool)
+                    weights.extend([weight / len(pool)] * len(pool))
+            if items:
+                self.tables[name] = AliasTable(items, weights)
+
+    @classmethod
+    def from_rows(cls, rows, pack_types: Dict[str, PackType]) -> "PackCatalog":
+        return cls(
+            [CatalogCard(id=row.id, rarity=Rarity(row.rarity), payload=card_item(row)) for row in rows],
+            pack_types,
+        )
+
+    def drop_rates(self, pack_name: str) -> Dict[str, float]:
+        """Итоговые вероятности редкостей пака (с учётом пустых редкостей)"""
+        table = self.tables[pack_name]
+        rates: Dict[str, float] = {}
+        share = 1.0 / table.size
+        for i, card in enumerate(table.items):
+            rates[card.rarity.value] = rates.get(card.rarity.value, 0.0) + share * table.prob[i]
+            alias = table.items[table.alias[i]]
+            rates[alias.rarity.value] = rates.get(alias.rarity.value, 0.0) + share * (1.0 - table.prob[i])
+        return rates
+
+
+class PackEngine:
+    """Каталог воркера с ленивой перезагрузкой"""
+
+    def __init__(self, pack_types: Dict[str, PackType], ttl: float):
+        self.pack_types = pack_types
+        self.ttl = ttl
+        self._catalog: Optional[PackCatalog] = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self.rebuilds = 0
+        self.packs_opened = 0
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def _fresh(self) -> bool:
+        return (
+            self._catalog is not None
+            and not self._stale
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    async def catalog(self, db) -> PackCatalog:
+        if self._fresh():
+            return self._catalog
+        async with self._lock:
+            if not self._fresh():
+                # Сбрасываем флаг до чтения: изменение во время загрузки пометит снова
+                self._stale = False
+                result = await db.execute(
+                    select(Card.id, Card.name, Card.description, Card.image_url,
+                           Card.rarity, Card.power, Card.clan).order_by(Card.id)
+                )
+                self._catalog = PackCatalog.from_rows(result.all(), self.pack_types)
+                self._loaded_at = time.monotonic()
+                self.rebuilds += 1
+                logger.info(
+                    "Pack catalog rebuilt",
+                    extra={"cards": len(self._catalog.cards), "pack_types": list(self._catalog.tables)},
+                )
+        return self._catalog
+
+    def draw(self, catalog: PackCatalog, pack: PackType, random_fn: Callable[[], float] = random.random):
+        table = catalog.tables.get(pack.name)
+        if table is None:
+            return []
+        self.packs_opened += 1
+        return table.sample_many(pack.size, random_fn)
+
+    def stats(self) -> dict:
+        return {
+            "cards": len(self._catalog.cards) if self._catalog else 0,
+            "rebuilds": self.rebuilds,
+            "packs_opened": self.packs_opened,
+        }
+
+
+pack_engine = PackEngine(PACK_TYPES, ttl=settings.PACK_CATALOG_TTL)
+
+
+def _on_card_change(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        pack_engine.mark_stale()
+        return
+
+    async def apply():
+        pack_engine.mark_stale()
+
+    after_commit(session, apply, pack_engine.mark_stale)
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Card, _event_name, _on_card_change)
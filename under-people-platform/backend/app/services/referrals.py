@@ -0,0 +1,89 @@
+"""
+Реферальное дерево: closure table + счётчики по уровням.
+
+users.invited_by_code задаёт дерево (приглашённый -> пригласивший), но
+вопрос "сколько людей я привёл на всех уровнях" по нему - рекурсивный
+обход. Вместо этого:
+
+- referral_closure хранит все пары (предок, потомок, depth). Новый
+  пользователь получает строки "все предки родителя + 1" и (родитель, 1) -
+  одна INSERT ... SELECT по индексу потомка, глубина дерева строк.
+- referral_level_counts - число потомков каждого предка на каждом уровне;
+  та же команда увеличивает счётчики (строки в порядке ключа - встречные
+  регистрации не дают взаимной блокировки).
+
+Статистика пользователя - чтение его строк referral_level_counts по
+первичному ключу (по строке на уровень): прямые приглашённые = depth 1,
+всего = сумма уровней; от размера дерева не зависит.
+
+Пригласивший фиксируется при регистрации (после неё invited_by_code не
+меняется). Пользователи, вставленные в обход ORM (seed, импорт), попадают
+в дерево через backfill_referrals.py.
+"""
+import logging
+from typing import Optional
+
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import ReferralLevelCount, User
+
+logger = logging.getLogger(__name__)
+
+LINK_SQL = text("""
+    WITH links AS (
+        INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+        SELECT CAST(:parent_id AS uuid), CAST(:user_id AS uuid), 1
+        UNION ALL
+        SELECT ancestor_id, CAST(:user_id AS uuid), depth + 1
+        FROM referral_closure
+        WHERE descendant_id = CAST(:parent_id AS uuid)
+        ON CONFLICT DO NOTHING
+        RETURNING ancestor_id, depth
+    )
+    INSERT INTO referral_level_counts (user_id, depth, count)
+    SELECT ancestor_id, depth, 1 FROM links
+    ORDER BY ancestor_id, depth
+    ON CONFLICT (user_id, depth) DO UPDATE SET count = referral_level_counts.count + 1
+""")
+
+
+def link_referral(connection, user_id, parent_id) -> None:
+    """Добавить пользователя в дерево под parent_id (в транзакции connection)"""
+    connection.execute(LINK_SQL, {"user_id": user_id, "parent_id": parent_id})
+
+
+async def referral_stats(db: AsyncSession, user_id) -> dict:
+    """{"direct": N, "total": N, "levels": [{"depth": 1, "count": N}, ...]}"""
+    result = await db.execute(
+        select(ReferralLevelCount.depth, ReferralLevelCount.count)
+        .where(ReferralLevelCount.user_id == user_id)
+        .order_by(ReferralLevelCount.depth)
+    )
+    levels = [{"depth": row.depth, "count": row.count} for row in result.all()]
+    return {
+        "direct": next((level["count"] for level in levels if level["depth"] == 1), 0),
+        "total": sum(level["count"] for level in levels),
+        "levels": levels,
+    }
+
+
+async def find_inviter(db: AsyncSession, referral_code: Optional[str]):
+    """id активного пользователя с этим referral_code или None"""
+    if not referral_code:
+        return None
+    return (await db.execute(
+        select(User.id).where(User.referral_code == referral_code, User.is_active == True)
+    )).scalar()
+
+
+@event.listens_for(User, "after_insert")
+def _link_new_user(mapper, connection, target):
+    """Новый пользователь с пригласившим - строки closure и счётчики предков"""
+    if not target.invited_by_code:
+        return
+    parent_id = connection.execute(
+        select(User.id).where(User.referral_code == target.invited_by_code)
+    ).scalar()
+    if parent_id is not None:
+        link_referral(connection, target.id, parent_id)
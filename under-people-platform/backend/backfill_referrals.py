@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Referral tree backfill - rebuild referral_closure and referral_level_counts
+
+New users are linked into the tree on registration (app.services.referrals).
+This tool rebuilds both tables from users.invited_by_code for users that
+were inserted bypassing the ORM (seed data, imports) or created before the
+tables existed. The rebuild is set-based, one INSERT ... SELECT per tree
+level:
+
+    depth 1      (inviter, invitee) pairs from invited_by_code
+    depth N      ancestors at depth N-1 of every invitee's inviter
+    counters     GROUP BY (ancestor, depth) over the closure
+
+It runs in a single transaction: TRUNCATE locks both tables, so concurrent
+registrations and stats reads wait until the rebuild commits and then see
+a complete tree. Cycles in invited_by_code (possible only through manual
+data edits) stop the level loop as soon as no new pairs appear.
+
+Usage:
+    python backfill_referrals.py
+    python backfill_referrals.py --max-depth 100
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("backfill_referrals")
+
+DIRECT_SQL = text("""
+    INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+    SELECT inviter.id, invitee.id, 1
+    FROM users invitee
+    JOIN users inviter ON inviter.referral_code = invitee.invited_by_code
+    WHERE inviter.id <> invitee.id
+""")
+
+LEVEL_SQL = text("""
+    INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+    SELECT upper.ancestor_id, direct.descendant_id, :depth
+    FROM referral_closure direct
+    JOIN referral_closure upper
+      ON upper.descendant_id = direct.ancestor_id AND upper.depth = :depth - 1
+    WHERE direct.depth = 1 AND upper.ancestor_id <> direct.descendant_id
+    ON CONFLICT DO NOTHING
+""")
+
+COUNTS_SQL = text("""
+    INSERT INTO referral_level_counts (user_id, depth, count)
+    SELECT ancestor_id, depth, count(*)
+    FROM referral_closure
+    GROUP BY ancestor_id, depth
+""")
+
+
+def rebuild_referral_tree(conn, max_depth: int = 1000) -> dict:
+    """Пересобрать дерево в транзакции conn; {"links": N, "depth": N, "counters": N}"""
+    conn.execute(text("TRUNCATE referral_closure, referral_level_counts"))
+    links = conn.execute(DIRECT_SQL).rowcount
+    conn.execute(text("ANALYZE referral_closure"))
+    depth = 1 if links else 0
+    while links and depth < max_depth:
+        added = conn.execute(LEVEL_SQL, {"depth": depth + 1}).rowcount
+        if not added:
+            break
+        depth += 1
+        links += added
+        logger.info("✅ depth %d: %d links", depth, added)
+    else:
+        if links and depth >= max_depth:
+            logger.warning("⚠️ Stopped at --max-depth %d - deeper levels are not linked", max_depth)
+    counters = conn.execute(COUNTS_SQL).rowcount
+    conn.execute(text("ANALYZE referral_closure, referral_level_counts"))
+    return {"links": links, "depth": depth, "counters": counters}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-depth", type=int, default=1000, help="stop after this many levels")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        result = rebuild_referral_tree(conn, args.max_depth)
+    logger.info(
+        "✅ Referral tree rebuilt: %d links, %d levels, %d counters in %.1fs",
+        result["links"], result["depth"], result["counters"], time.perf_counter() - started,
+    )
+
+
+if __name__ == "__main__":
+    main()
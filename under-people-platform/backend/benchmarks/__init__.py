@@ -0,0 +1 @@
+# Benchmarks Init
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sync Session vs AsyncSession under gunicorn + UvicornWorker
+
+Starts the same worker setup as render.yaml (gunicorn, 2 UvicornWorker
+processes) around a tiny app exposing two routes that run an identical
+query against Postgres:
+
+    /bench/sync   - async def handler using the blocking SessionLocal (old path)
+    /bench/async  - async def handler using AsyncSession (new path)
+
+Each route is hammered with N concurrent clients for a fixed duration and
+throughput plus latency percentiles are reported for both.
+
+Usage:
+    cd backend
+    python -m benchmarks.async_db_throughput
+    python -m benchmarks.async_db_throughput --concurrency 200 --duration 20 --query-ms 20
+    python -m benchmarks.async_db_throughput --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import SessionLocal, get_async_db
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Длительность "медленного" запроса задаётся через env, чтобы воркеры gunicorn её видели
+QUERY_SECONDS = float(os.getenv("BENCH_QUERY_MS", "10")) / 1000
+
+app = FastAPI()
+
+
+@app.get("/bench/sync")
+async def bench_sync():
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT pg_sleep(:s)"), {"s": QUERY_SECONDS})
+    finally:
+        db.close()
+    return {"ok": True}
+
+
+@app.get("/bench/async")
+async def bench_async(db: AsyncSession = Depends(get_async_db)):
+    await db.execute(text("SELECT pg_sleep(:s)"), {"s": QUERY_SECONDS})
+    return {"ok": True}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def drive(url: str, concurrency: int, duration: float) -> dict:
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def wait_until_ready(base_url: str, timeout: float = 30.0):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/bench/async", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError("gunicorn did not become ready in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (render.yaml uses 2)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--query-ms", type=float, default=10.0, help="simulated query latency")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    args = parser.parse_args()
+
+    env = {**os.environ, "BENCH_QUERY_MS": str(args.query_ms)}
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "benchmarks.async_db_throughput:app",
+            "--workers", str(args.workers),
+            "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--bind", f"127.0.0.1:{args.port}",
+            "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        wait_until_ready(base_url)
+        results = {
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "query_ms": args.query_ms,
+            "scenarios": {},
+        }
+        for name in ("sync", "async"):
+            stats = asyncio.run(drive(f"{base_url}/bench/{name}", args.concurrency, args.duration))
+            results["scenarios"][name] = stats
+            print(
+                f"{name:>6}: {stats['rps']:>8} req/s  "
+                f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms  "
+                f"errors={stats['errors']}"
+            )
+
+        sync_rps = results["scenarios"]["sync"]["rps"] or 1
+        print(f"speedup: x{results['scenarios']['async']['rps'] / sync_rps:.2f}")
+
+        if args.json_path:
+            Path(args.json_path).write_text(json.dumps(results, indent=2))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
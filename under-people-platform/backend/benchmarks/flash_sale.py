@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Load test: flash-sale ticket drop (app.services.flash_sale)
+
+Creates a ticket product with --stock units and --buyers users in the
+DATABASE_URL Postgres / REDIS_URL Redis, then every buyer tries to reserve
+the ticket at the same moment from --workers processes (separate event
+loops and connection pools, like gunicorn workers) through
+flash_sale.reserve - Redis counter, batched order writes.
+
+Checks (exit 1 with --check if any fails):
+    sale     reservations == min(stock, buyers), the rest got "sold out";
+             PENDING orders in the DB == reservations; products.stock and
+             the Redis counter are stock - reservations, never negative
+    expiry   after --ttl seconds one releaser pass cancels every order and
+             returns stock and counter to --stock (run twice - the second
+             pass must not return anything again)
+
+Reported: reservations/s, p50/p99 latency of reserve, average order batch.
+
+Usage:
+    cd backend
+    python -m benchmarks.flash_sale
+    python -m benchmarks.flash_sale --stock 500 --buyers 5000 --workers 4 --check
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import insert, select, text
+
+from app.core.cache import get_redis, set_redis
+from app.db.session import AsyncSessionLocal, async_engine, engine
+from app.models.models import OrderStatus, Product, ProductType, User, UserRole
+from app.services.flash_sale import ReservationError, booking_releaser, flash_sale, sale_products
+from run_migrations import run_migrations
+
+TELEGRAM_BASE = 40_000_000
+PRODUCT_NAME = "Flash sale benchmark ticket"
+REDIS_PREFIX = "flashbench"  # свои ключи: releaser не трогает брони настоящих товаров
+
+
+# ---------------------------------------------------------------------------
+# Setup
+# ---------------------------------------------------------------------------
+
+def setup(stock: int, buyers: int) -> tuple:
+    run_migrations()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        bench_users = "SELECT id FROM users WHERE telegram_id >= :base AND telegram_id < :base + 10000000"
+        params = {"base": TELEGRAM_BASE}
+        conn.execute(text(f"DELETE FROM orders WHERE user_id IN ({bench_users})"), params)
+        conn.execute(text(f"DELETE FROM users WHERE id IN ({bench_users})"), params)
+        conn.execute(text("DELETE FROM products WHERE name = :name"), {"name": PRODUCT_NAME})
+
+        product_id = conn.execute(
+            insert(Product.__table__).returning(Product.__table__.c.id),
+            {
+                "name": PRODUCT_NAME, "description": "Benchmark ticket drop", "price": 1500,
+                "product_type": ProductType.TICKET, "stock": stock, "is_active": True,
+            },
+        ).scalar()
+        user_ids = [uuid.uuid4() for _ in range(buyers)]
+        conn.execute(insert(User.__table__), [
+            {
+                "id": user_id,
+                "telegram_id": TELEGRAM_BASE + i,
+                "username": f"flash_{i}",
+                "up_coins": 0,
+                "clan_name": "Outcasts",
+                "referral_code": f"FS-{i:06d}",
+                "role": UserRole.RANGER,
+                "is_active": True,
+                "is_verified": True,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i, user_id in enumerate(user_ids)
+        ])
+    return product_id, user_ids
+
+
+# ---------------------------------------------------------------------------
+# Sale
+# ---------------------------------------------------------------------------
+
+async def buy_all(product_id: int, user_ids: List[uuid.UUID], start_at: float) -> dict:
+    outcomes = Counter()
+    latencies = []
+
+    async def buy(user_id):
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            try:
+                await flash_sale.reserve(db, user_id, product_id)
+                outcomes["reserved"] += 1
+            except ReservationError as e:
+                outcomes[type(e).__name__] += 1
+            except Exception:
+                outcomes["error"] += 1
+            latencies.append(time.perf_counter() - started)
+
+    # Все процессы стартуют в один момент
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    await asyncio.gather(*(buy(user_id) for user_id in user_ids))
+    stats = flash_sale.stats()
+    await flash_sale.stop()
+    await async_engine.dispose()
+    return {"outcomes": dict(outcomes), "latencies": latencies, "batches": stats["batches"]}
+
+
+def worker(product_id: int, user_ids: List[uuid.UUID], start_at: float, results) -> None:
+    results.put(asyncio.run(buy_all(product_id, user_ids, start_at)))
+
+
+def run(coro):
+    """Отдельный event loop: пул БД и Redis-клиент создаются заново"""
+    async def wrapped():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+
+    set_redis(None)
+    return asyncio.run(wrapped())
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def state(product_id: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        stock = (await db.execute(select(Product.stock).where(Product.id == product_id))).scalar()
+        statuses = Counter(dict((await db.execute(
+            text("SELECT status, count(*) FROM orders WHERE product_id = :p GROUP BY status"), {"p": product_id}
+        )).all()))
+    counter = await get_redis().get(flash_sale.stock_key(product_id))
+    holds = await get_redis().zcount(flash_sale.holds_key, "-inf", "+inf")
+    return {
+        "stock": stock,
+        "counter": int(counter) if counter is not None else None,
+        "pending": statuses.get(OrderStatus.PENDING.name, 0),
+        "canceled": statuses.get(OrderStatus.CANCELED.name, 0),
+        "holds": holds,
+    }
+
+
+async def expire(product_id: int, ttl: float) -> tuple:
+    await asyncio.sleep(ttl + 0.5)
+    first = await booking_releaser.release_expired_holds()
+    second = await booking_releaser.release_expired_holds()
+    return first, second, await state(product_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stock", type=int, default=200, help="tickets on sale")
+    parser.add_argument("--buyers", type=int, default=2000, help="concurrent buyers (one attempt each)")
+    parser.add_argument("--workers", type=int, default=4, help="processes, like gunicorn workers")
+    parser.add_argument("--ttl", type=float, default=3.0, help="reservation TTL for the expiry check, seconds")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a check fails")
+    args = parser.parse_args()
+
+    product_id, user_ids = setup(args.stock, args.buyers)
+    # Настройки до fork - их унаследуют процессы покупателей
+    flash_sale.reservation_ttl = args.ttl
+    flash_sale.prefix = REDIS_PREFIX
+    flash_sale.holds_key = f"{REDIS_PREFIX}:holds"
+    booking_releaser.grace = 0
+    sale_products.invalidate_sync(str(product_id))
+
+    async def reset_redis():
+        await get_redis().delete(flash_sale.holds_key, flash_sale.stock_key(product_id))
+
+    run(reset_redis())
+
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0
+    processes = [
+        multiprocessing.Process(target=worker, args=(product_id, user_ids[n::args.workers], start_at, results))
+        for n in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    parts = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start_at
+
+    outcomes = Counter()
+    latencies = []
+    batches = 0
+    for part in parts:
+        outcomes.update(part["outcomes"])
+        latencies.extend(part["latencies"])
+        batches += part["batches"]
+
+    reserved = outcomes["reserved"]
+    expected = min(args.stock, args.buyers)
+    print(f"\nstock={args.stock} buyers={args.buyers} workers={args.workers}")
+    print(f"outcomes: {dict(outcomes)}")
+    print(
+        f"reservations/s={reserved / elapsed:,.0f} attempts/s={args.buyers / elapsed:,.0f} "
+        f"p50={percentile(latencies, 50) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms "
+        f"avg batch={reserved / batches if batches else 0:.1f} orders"
+    )
+
+    after_sale = run(state(product_id))
+    print(f"after sale:   {after_sale}")
+    failures = []
+    if reserved != expected:
+        failures.append(f"{reserved} reservations for {args.stock} tickets and {args.buyers} buyers")
+    if after_sale["pending"] != reserved:
+        failures.append(f"{after_sale['pending']} PENDING orders, {reserved} reservations")
+    if after_sale["stock"] != args.stock - reserved or after_sale["stock"] < 0:
+        failures.append(f"products.stock={after_sale['stock']}, expected {args.stock - reserved}")
+    if after_sale["counter"] != args.stock - reserved:
+        failures.append(f"Redis counter={after_sale['counter']}, expected {args.stock - reserved}")
+    if outcomes["error"]:
+        failures.append(f"{outcomes['error']} errors")
+
+    first, second, after_expiry = run(expire(product_id, args.ttl))
+    print(f"after expiry: {after_expiry} (released {first}, second pass {second})")
+    if first != reserved or second != 0:
+        failures.append(f"releaser returned {first} then {second}, expected {reserved} then 0")
+    if after_expiry["stock"] != args.stock or after_expiry["counter"] != args.stock:
+        failures.append(f"stock not restored: {after_expiry}")
+    if after_expiry["pending"] or after_expiry["holds"]:
+        failures.append(f"pending orders or holds left: {after_expiry}")
+
+    if failures:
+        print("\nFailed:")
+        for failure in failures:
+            print(f"  {failure}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("\nNo oversell: exactly min(stock, buyers) reservations, stock restored after expiry")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+In-process HTTP benchmark suite for every API route
+
+Drives the FastAPI `app` from app/main.py through httpx.ASGITransport (no
+sockets, no server process), so numbers reflect the application stack:
+routing, middleware, dependencies, serialization and the database.
+
+Steps:
+    1. Seed the local Postgres from DATABASE_URL with --users/--products/--events rows
+       (skipped with --no-seed; --reset truncates the benchmark tables first)
+    2. Run every route scenario for --duration seconds at --concurrency
+    3. Run weighted concurrent mixes (read-heavy, auth-heavy)
+    4. Write a machine-readable report (--out) and optionally compare it with a
+       previous report (--compare), failing on p95/throughput regressions
+
+Usage:
+    cd backend
+    python -m benchmarks.http_suite --reset --users 50000 --out bench.json
+    python -m benchmarks.http_suite --no-seed --only users.me,products.list
+    python -m benchmarks.http_suite --no-seed --compare baseline.json --threshold 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import insert, select, text
+
+from app.core.rate_limit import rate_limiter
+from app.core.security import create_access_token
+from app.db.session import engine
+from app.main import app
+from app.models.event import Event
+from app.models.models import Card, Product, ProductType, Rarity, User, UserRole
+from run_migrations import run_migrations
+
+SEED_CHUNK = 5000
+BASE_URL = "http://bench"
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------------------
+
+def referral_code(n: int) -> str:
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    code = ""
+    for _ in range(6):
+        n, rem = divmod(n, 36)
+        code = digits[rem] + code
+    return f"UP-{code}"
+
+
+def seed(users: int, products: int, events: int, cards: int, reset: bool, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    run_migrations()
+    with engine.begin() as conn:
+        if reset:
+            conn.execute(text(
+                "TRUNCATE users, auth_codes, products, events, cards, user_cards RESTART IDENTITY CASCADE"
+            ))
+        now = datetime.now(timezone.utc)
+        # Повторный seed без --reset дописывает пользователей после уже созданных
+        first = conn.execute(text(
+            "SELECT COALESCE(MAX(telegram_id) - 10000000 + 1, 0) FROM users WHERE telegram_id >= 10000000"
+        )).scalar()
+
+        for start in range(first, first + users, SEED_CHUNK):
+            conn.execute(insert(User.__table__), [
+                {
+                    "id": uuid.UUID(int=rng.getrandbits(128), version=4),
+                    "telegram_id": 10_000_000 + i,
+                    "username": f"bench_{i}",
+                    "up_coins": int(rng.paretovariate(1.2) * 50),
+                    "clan_name": rng.choice(("Outcasts", "Diggers", "Wardens", "Ghosts")),
+                    "referral_code": referral_code(i),
+                    "role": UserRole.RANGER,
+                    "is_active": True,
+                    "is_verified": True,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for i in range(start, min(start + SEED_CHUNK, first + users))
+            ])
+        # Стартовые записи журнала UP Coins (app.services.ledger)
+        conn.execute(text("""
+            INSERT INTO coin_ledger (entry_id, user_id, amount, reason, created_at)
+            SELECT 'opening:' || id, id, up_coins, 'opening_balance', created_at
+            FROM users
+            WHERE telegram_id >= 10000000 + :first AND COALESCE(up_coins, 0) <> 0
+            ON CONFLICT (entry_id) DO NOTHING
+        """), {"first": first})
+
+        conn.execute(insert(Product.__table__), [
+            {
+                "name": f"Product {i}",
+                "description": "Benchmark product",
+                "price": rng.randint(100, 5000),
+                "product_type": rng.choice(list(ProductType)),
+                "stock": -1,
+                "is_active": True,
+            }
+            for i in range(products)
+        ])
+
+        conn.execute(insert(Event.__table__), [
+            {
+                "title": f"Event {i}",
+                "description": "Benchmark event",
+                "start_date": datetime.utcnow() + timedelta(hours=rng.randint(1, 24 * 365)),
+                "location": "Bunker",
+                "price": float(rng.randint(0, 3000)),
+                "capacity": rng.randint(20, 500),
+                "is_active": 1,
+            }
+            for i in range(events)
+        ])
+
+        # Каталог карт нужен один раз (пакеты открываются по нему)
+        if not conn.execute(select(Card.id).limit(1)).first():
+            rarities = list(Rarity)
+            conn.execute(insert(Card.__table__), [
+                {
+                    "name": f"Card {i}",
+                    "description": "Benchmark card",
+                    "image_url": f"/img/cards/{i}.png",
+                    "rarity": rng.choices(rarities, weights=(55, 25, 14, 6))[0],
+                    "power": rng.randint(10, 200),
+                    "clan": "Outcasts",
+                }
+                for i in range(cards)
+            ])
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Fixtures:
+    users: list  # Row(id, telegram_id, referral_code)
+    product_ids: List[int]
+    event_ids: List[int]
+    tokens: List[str]
+    etags: Dict[str, str]
+
+
+def load_fixtures(sample: int) -> Fixtures:
+    with engine.connect() as conn:
+        users = conn.execute(
+            select(User.id, User.telegram_id, User.referral_code).order_by(User.telegram_id).limit(sample)
+        ).all()
+        product_ids = conn.execute(select(Product.id).where(Product.is_active == True).limit(sample)).scalars().all()
+        event_ids = conn.execute(select(Event.id).where(Event.is_active == 1).limit(sample)).scalars().all()
+    if not users:
+        sys.exit("No users in the database - run with seeding enabled")
+    tokens = [create_access_token(u) for u in users]
+    return Fixtures(users=users, product_ids=product_ids, event_ids=event_ids, tokens=tokens, etags={})
+
+
+Request = Callable[[httpx.AsyncClient, random.Random, Fixtures], Awaitable[httpx.Response]]
+
+
+def auth_header(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def users_me(client, rng, fx):
+    token = rng.choice(fx.tokens)
+    return await client.get("/api/users/me", headers=auth_header(token))
+
+
+async def users_me_304(client, rng, fx):
+    token = rng.choice(fx.tokens)
+    headers = auth_header(token)
+    if token in fx.etags:
+        headers["If-None-Match"] = fx.etags[token]
+    response = await client.get("/api/users/me", headers=headers)
+    if "etag" in response.headers:
+        fx.etags[token] = response.headers["etag"]
+    return response
+
+
+async def users_refresh(client, rng, fx):
+    return await client.post("/api/users/me/refresh", headers=auth_header(rng.choice(fx.tokens)))
+
+
+async def users_profile(client, rng, fx):
+    return await client.get(f"/api/users/profile/{rng.choice(fx.users).id}")
+
+
+async def users_public(client, rng, fx):
+    return await client.get(f"/api/users/u/{rng.choice(fx.users).referral_code}")
+
+
+async def users_public_missing(client, rng, fx):
+    return await client.get(f"/api/users/u/UP-{rng.getrandbits(30):08X}")
+
+
+async def users_batch(client, rng, fx):
+    members = rng.sample(fx.users, min(100, len(fx.users)))
+    return await client.post("/api/users/batch", json={
+        "referral_codes": [u.referral_code for u in members[:50]] + [f"UP-{rng.getrandbits(30):08X}"],
+        "ids": [str(u.id) for u in members[50:]],
+    })
+
+
+async def users_leaderboard(client, rng, fx):
+    return await client.get("/api/users/leaderboard", params={"limit": 20, "offset": rng.randrange(0, 500)})
+
+
+async def users_leaderboard_me(client, rng, fx):
+    return await client.get("/api/users/leaderboard/me", headers=auth_header(rng.choice(fx.tokens)))
+
+
+async def products_list(client, rng, fx):
+    return await client.get("/api/products/")
+
+
+async def products_item(client, rng, fx):
+    return await client.get(f"/api/products/{rng.choice(fx.product_ids)}")
+
+
+async def events_upcoming(client, rng, fx):
+    return await client.get("/api/v1/events/upcoming", params={"limit": 20})
+
+
+async def events_deep_page(client, rng, fx):
+    # Листаем до случайной страницы по cursor - проверка, что глубина не дорожает
+    response = await client.get("/api/v1/events/upcoming", params={"limit": 20})
+    for _ in range(rng.randrange(1, 10)):
+        cursor = response.json().get("next_cursor")
+        if not cursor:
+            break
+        response = await client.get("/api/v1/events/upcoming", params={"limit": 20, "cursor": cursor})
+    return response
+
+
+async def events_item(client, rng, fx):
+    return await client.get(f"/api/v1/events/{rng.choice(fx.event_ids)}")
+
+
+async def cards_list(client, rng, fx):
+    return await client.get("/api/cards/")
+
+
+async def cards_open_pack(client, rng, fx):
+    # 402 (не хватает монет) - штатный ответ, не ошибка
+    return await client.post(
+        "/api/cards/open-pack", json={"pack_type": "standard"}, headers=auth_header(rng.choice(fx.tokens)),
+    )
+
+
+async def auth_generate_code(client, rng, fx):
+    return await client.post("/api/auth/generate-code", params={"telegram_id": rng.choice(fx.users).telegram_id})
+
+
+async def auth_login(client, rng, fx):
+    user = rng.choice(fx.users)
+    response = await client.post("/api/auth/generate-code", params={"telegram_id": user.telegram_id})
+    code = response.json()["code"]
+    return await client.post("/api/auth/callback", params={"code": code})
+
+
+async def auth_logout(client, rng, fx):
+    user = rng.choice(fx.users)
+    return await client.post("/api/auth/logout", headers=auth_header(create_access_token(user)))
+
+
+SCENARIOS: Dict[str, Request] = {
+    "auth.generate_code": auth_generate_code,
+    "auth.login": auth_login,
+    "auth.logout": auth_logout,
+    "users.me": users_me,
+    "users.me_304": users_me_304,
+    "users.me_refresh": users_refresh,
+    "users.profile": users_profile,
+    "users.public_profile": users_public,
+    "users.public_profile_missing": users_public_missing,
+    "users.batch": users_batch,
+    "users.leaderboard": users_leaderboard,
+    "users.leaderboard_me": users_leaderboard_me,
+    "products.list": products_list,
+    "products.item": products_item,
+    "events.upcoming": events_upcoming,
+    "events.deep_page": events_deep_page,
+    "events.item": events_item,
+    "cards.list": cards_list,
+    "cards.open_pack": cards_open_pack,
+}
+
+MIXES: Dict[str, Dict[str, int]] = {
+    "read_heavy": {
+        "users.me_304": 40, "users.public_profile": 15, "products.list": 15,
+        "products.item": 10, "events.upcoming": 10, "users.leaderboard": 10,
+    },
+    "auth_heavy": {
+        "auth.login": 30, "users.me": 40, "auth.generate_code": 20, "auth.logout": 10,
+    },
+}
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_load(client, fixtures: Fixtures, pick: Callable[[random.Random], Request],
+                   concurrency: int, duration: float, seed_value: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        nonlocal errors
+        rng = random.Random(seed_value + n)
+        while time.perf_counter() < deadline:
+            request = pick(rng)
+            started = time.perf_counter()
+            try:
+                response = await request(client, rng, fixtures)
+                ok = response.status_code < 500 and response.status_code != 429
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def run_suite(args, fixtures: Fixtures) -> dict:
+    only = set(args.only.split(",")) if args.only else None
+    results = {"routes": {}, "mixes": {}}
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL, timeout=60) as client:
+            for name, request in SCENARIOS.items():
+                if only and name not in only:
+                    continue
+                # Прогрев: кэши, пулы соединений, JIT-подобные эффекты импорта
+                await run_load(client, fixtures, lambda rng, r=request: r, args.concurrency, args.warmup, args.seed)
+                stats = await run_load(client, fixtures, lambda rng, r=request: r,
+                                       args.concurrency, args.duration, args.seed)
+                results["routes"][name] = stats
+                print(f"{name:<32} {stats['rps']:>9} req/s  p50={stats['p50_ms']:>8}ms "
+                      f"p95={stats['p95_ms']:>8}ms p99={stats['p99_ms']:>8}ms err={stats['errors']}")
+
+            for mix_name, weights in MIXES.items():
+                if only and mix_name not in only:
+                    continue
+                names = list(weights)
+                population = [SCENARIOS[n] for n in names]
+                cum_weights = [weights[n] for n in names]
+
+                def pick(rng, population=population, cum_weights=cum_weights):
+                    return rng.choices(population, weights=cum_weights)[0]
+
+                stats = await run_load(client, fixtures, pick, args.mix_concurrency, args.duration, args.seed)
+                results["mixes"][mix_name] = stats
+                print(f"mix:{mix_name:<28} {stats['rps']:>9} req/s  p50={stats['p50_ms']:>8}ms "
+                      f"p95={stats['p95_ms']:>8}ms p99={stats['p99_ms']:>8}ms err={stats['errors']}")
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Список регрессий: p95 выросла или throughput упал больше чем на threshold"""
+    regressions = []
+    for section in ("routes", "mixes"):
+        for name, stats in current.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                continue
+            if old["p95_ms"] and stats["p95_ms"] > old["p95_ms"] * (1 + threshold):
+                regressions.append(f"{section}.{name}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if old["rps"] and stats["rps"] < old["rps"] * (1 - threshold):
+                regressions.append(f"{section}.{name}: rps {old['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--events", type=int, default=2_000)
+    parser.add_argument("--cards", type=int, default=200, help="card catalog size (seeded once)")
+    parser.add_argument("--no-seed", action="store_true", help="use the data already in the database")
+    parser.add_argument("--reset", action="store_true", help="TRUNCATE benchmark tables before seeding")
+    parser.add_argument("--sample", type=int, default=1_000, help="users/products/events sampled for requests")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix-concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="warmup seconds per scenario")
+    parser.add_argument("--only", help="comma-separated scenario/mix names")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="previous report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument(
+        "--rate-limit", action="store_true",
+        help="keep the rate limiter on (all bench traffic shares one client IP, so most calls get 429)",
+    )
+    args = parser.parse_args()
+    rate_limiter.enabled = args.rate_limit
+
+    if not args.no_seed:
+        started = time.perf_counter()
+        seed(args.users, args.products, args.events, args.cards, args.reset, args.seed)
+        print(f"seeded in {time.perf_counter() - started:.1f}s")
+
+    fixtures = load_fixtures(args.sample)
+    results = asyncio.run(run_suite(args, fixtures))
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "mix_concurrency": args.mix_concurrency,
+            "duration_s": args.duration,
+            "volumes": None if args.no_seed else {
+                "users": args.users, "products": args.products, "events": args.events,
+            },
+        },
+        **results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"report written to {args.out}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
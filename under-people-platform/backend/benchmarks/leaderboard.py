@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Redis leaderboard vs SQL sort over users
+
+Seeds N synthetic users (skewed coin balances) into an UNLOGGED Postgres
+table and a Redis sorted set with identical data, then compares:
+
+    top-N page          ORDER BY up_coins DESC LIMIT/OFFSET   vs  ZREVRANGE
+    my rank + neighbours COUNT(*) WHERE up_coins > mine + page vs  ZREVRANK + ZREVRANGE
+
+The SQL side runs without an (is_active, up_coins) index by default to
+reproduce the old behaviour; pass --sql-index to compare against the
+indexed fallback as well.
+
+Usage:
+    cd backend
+    python -m benchmarks.leaderboard --users 1000000
+    python -m benchmarks.leaderboard --users 200000 --iterations 500 --sql-index
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import text
+
+from app.db.session import engine
+from app.services.leaderboard import Leaderboard
+
+TABLE = "bench_leaderboard_users"
+PREFIX = "bench:leaderboard"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies):
+    return {
+        "ops": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def generate_users(count: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        # Лог-нормальное распределение: много мелких балансов, длинный хвост
+        coins = int(math.exp(rng.gauss(5.0, 1.6)))
+        yield uuid.UUID(int=rng.getrandbits(128), version=4), coins, f"user_{rng.getrandbits(32):08x}"
+
+
+def seed_postgres(users, with_index: bool):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(
+            f"CREATE UNLOGGED TABLE {TABLE} ("
+            f"id UUID PRIMARY KEY, username VARCHAR, up_coins INTEGER, is_active BOOLEAN)"
+        ))
+
+    raw = engine.raw_connection()
+    try:
+        buffer = io.StringIO()
+        for user_id, coins, username in users:
+            buffer.write(f"{user_id}\t{username}\t{coins}\tt\n")
+        buffer.seek(0)
+        with raw.cursor() as cursor:
+            cursor.copy_expert(f"COPY {TABLE} (id, username, up_coins, is_active) FROM STDIN", buffer)
+        raw.commit()
+    finally:
+        raw.close()
+
+    with engine.begin() as conn:
+        if with_index:
+            conn.execute(text(f"CREATE INDEX ON {TABLE} (is_active, up_coins)"))
+        conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+async def seed_redis(board: Leaderboard, users, chunk: int = 10000):
+    await board.client.delete(board.scores_key, board.meta_key, board.version_key)
+    for start in range(0, len(users), chunk):
+        part = users[start:start + chunk]
+        pipe = board.client.pipeline(transaction=False)
+        pipe.zadd(board.scores_key, {str(u): c for u, c, _ in part})
+        pipe.hset(board.meta_key, mapping={
+            str(u): json.dumps({"username": name, "clan": "Outcasts"}) for u, _, name in part
+        })
+        await pipe.execute()
+    pipe = board.client.pipeline(transaction=False)
+    board.mark_complete(pipe)
+    await pipe.execute()
+
+
+def bench_sql(users, iterations: int, page: int, radius: int, rng: random.Random):
+    top, around = [], []
+    with engine.connect() as conn:
+        for _ in range(iterations):
+            offset = rng.randrange(0, 1000)
+            started = time.perf_counter()
+            conn.execute(text(
+                f"SELECT id, username, up_coins FROM {TABLE} WHERE is_active "
+                f"ORDER BY up_coins DESC LIMIT :limit OFFSET :offset"
+            ), {"limit": page, "offset": offset}).all()
+            top.append(time.perf_counter() - started)
+
+            user_id = users[rng.randrange(len(users))][0]
+            started = time.perf_counter()
+            rank = conn.execute(text(
+                f"SELECT COUNT(*) FROM {TABLE} WHERE is_active AND up_coins > "
+                f"(SELECT up_coins FROM {TABLE} WHERE id = :id)"
+            ), {"id": user_id}).scalar()
+            conn.execute(text(
+                f"SELECT id, username, up_coins FROM {TABLE} WHERE is_active "
+                f"ORDER BY up_coins DESC LIMIT :limit OFFSET :offset"
+            ), {"limit": radius * 2 + 1, "offset": max(0, rank - radius)}).all()
+            around.append(time.perf_counter() - started)
+    return {"top": summarize(top), "around": summarize(around)}
+
+
+async def bench_redis(board: Leaderboard, users, iterations: int, page: int, radius: int, rng: random.Random):
+    top, around = [], []
+    for _ in range(iterations):
+        offset = rng.randrange(0, 1000)
+        started = time.perf_counter()
+        await board.top(page, offset)
+        top.append(time.perf_counter() - started)
+
+        user_id = str(users[rng.randrange(len(users))][0])
+        started = time.perf_counter()
+        await board.around(user_id, radius)
+        around.append(time.perf_counter() - started)
+    return {"top": summarize(top), "around": summarize(around)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--page", type=int, default=10)
+    parser.add_argument("--radius", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sql-index", action="store_true", help="add (is_active, up_coins) index on the SQL side")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded table and Redis keys")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    users = list(generate_users(args.users, args.seed))
+    board = Leaderboard(prefix=PREFIX)
+
+    started = time.perf_counter()
+    seed_postgres(users, args.sql_index)
+    asyncio.run(seed_redis(board, users))
+    print(f"seeded {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    results = {
+        "users": args.users,
+        "sql_index": args.sql_index,
+        "sql": bench_sql(users, args.iterations, args.page, args.radius, random.Random(args.seed)),
+        "redis": asyncio.run(bench_redis(board, users, args.iterations, args.page, args.radius, random.Random(args.seed))),
+    }
+
+    for op in ("top", "around"):
+        sql, redis_ = results["sql"][op], results["redis"][op]
+        print(
+            f"{op:>7}: sql p50={sql['p50_ms']}ms p99={sql['p99_ms']}ms | "
+            f"redis p50={redis_['p50_ms']}ms p99={redis_['p99_ms']}ms"
+        )
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        asyncio.run(board.client.delete(board.scores_key, board.meta_key, board.version_key))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-request logging overhead on the calling (event loop) thread
+
+Scenarios, each emitting the same "auth callback" style record:
+
+    print            print(f"...") straight to the sink (old users.get_public_profile)
+    sync_fstring     logger.info(f"...") with a StreamHandler on the sink (old auth.py)
+    queue_json       lazy logger.info("...", extra=...) through QueueHandler + JSON listener
+    queue_sampled    same as queue_json with LOG_SAMPLING rate 0.1 for the logger
+    disabled_debug   lazy logger.debug(...) below the configured level
+
+Only the time spent in the caller is measured; the background listener
+drains the queue afterwards (its total time is reported separately).
+
+Usage:
+    cd backend
+    python -m benchmarks.logging_overhead
+    python -m benchmarks.logging_overhead --iterations 200000 --sink stdout
+"""
+
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from app.core.logging_config import (
+    JsonFormatter,
+    RequestIdFilter,
+    SamplingFilter,
+    _DeferredQueueHandler,
+    disable_costly_record_fields,
+    request_id_var,
+)
+
+
+def open_sink(kind: str):
+    if kind == "stdout":
+        return sys.stdout, None
+    if kind == "devnull":
+        return open(os.devnull, "w"), None
+    handle = tempfile.NamedTemporaryFile("w", delete=False, suffix=".log")
+    return handle, handle.name
+
+
+def isolated_logger(name: str, handler: logging.Handler, level=logging.INFO) -> logging.Logger:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def run(iterations: int, emit) -> float:
+    user_id = uuid.uuid4()
+    started = time.perf_counter()
+    for i in range(iterations):
+        emit(i, user_id)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--sink", choices=("file", "stdout", "devnull"), default="file")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    sink, sink_path = open_sink(args.sink)
+    request_id_var.set(uuid.uuid4().hex)
+    results = {}
+
+    def emit_print(i, user_id):
+        print(f"✅ [AUTH CALLBACK] Authentication successful for user {user_id} #{i}", file=sink)
+
+    results["print"] = run(args.iterations, emit_print)
+
+    stream = logging.StreamHandler(sink)
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    sync_logger = isolated_logger("sync", stream)
+
+    def emit_sync(i, user_id):
+        sync_logger.info(f"✅ [AUTH CALLBACK] Authentication successful for user {user_id} #{i}")
+
+    results["sync_fstring"] = run(args.iterations, emit_sync)
+
+    # Дальше - конфигурация как в setup_logging()
+    disable_costly_record_fields()
+
+    def queued(name, rates=None):
+        log_queue = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        if rates:
+            handler.addFilter(SamplingFilter({f"bench.{name}": rates}))
+        json_stream = logging.StreamHandler(sink)
+        json_stream.setFormatter(JsonFormatter())
+        listener = logging.handlers.QueueListener(log_queue, json_stream)
+        return isolated_logger(name, handler), listener
+
+    drain = {}
+    for name, rate in (("queue_json", None), ("queue_sampled", 0.1)):
+        logger, listener = queued(name, rate)
+
+        def emit_lazy(i, user_id, logger=logger):
+            logger.info("[AUTH CALLBACK] Authentication successful", extra={"user_id": user_id, "n": i})
+
+        # Слушатель запускается после замера: считаем только стоимость в вызывающем потоке
+        results[name] = run(args.iterations, emit_lazy)
+        started = time.perf_counter()
+        listener.start()
+        listener.stop()
+        drain[name] = round(time.perf_counter() - started, 3)
+
+    debug_logger, _ = queued("disabled_debug")
+
+    def emit_debug(i, user_id):
+        debug_logger.debug("[AUTH CALLBACK] Auth callback received", extra={"user_id": user_id})
+
+    results["disabled_debug"] = run(args.iterations, emit_debug)
+
+    sink.flush()
+    if sink_path:
+        sink.close()
+        os.unlink(sink_path)
+
+    report = {
+        "iterations": args.iterations,
+        "sink": args.sink,
+        "ns_per_call": {k: round(v) for k, v in results.items()},
+        "listener_drain_seconds": drain,
+    }
+    print(json.dumps(report, indent=2), file=sys.stderr)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
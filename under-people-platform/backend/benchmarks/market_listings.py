@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /api/market/listings query engine at production scale
+
+Calls app.services.market.browse_listings directly (AsyncSession, no HTTP)
+for every supported filter x sort combination at several cursor depths and
+reports p50/p99 per page. Keyset pagination should make the cost of a page
+independent of its depth, so p99 at the deepest cursor is compared with p99
+of the first page.
+
+Every measured point is also EXPLAINed: the plan must be an index range
+scan, without Sort or Seq Scan nodes.
+
+Data: market_listings is topped up to --listings rows server-side
+(INSERT ... SELECT generate_series over existing users and cards), so seed
+users and cards first:
+    python seed_data.py --users 100000 --truncate
+
+Usage:
+    cd backend
+    python -m benchmarks.market_listings --listings 1000000
+    python -m benchmarks.market_listings --depths 0,1000,100000,500000 --repeat 300 --check
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.db.session import AsyncSessionLocal, async_engine, engine
+from app.models.models import MarketListing, Rarity
+from app.services.market import SORTS, ListingFilters, browse_listings, encode_cursor, listings_query
+from app.services.packs import pack_engine
+from run_migrations import run_migrations
+
+PAGE_SIZE = 20
+SEED_CHUNK = 250_000
+
+# Цена лота по редкости (имена enum в Postgres), разброс - log-normal
+RARITY_PRICE = {"COMMON": 40, "RARE": 150, "EPIC": 600, "LEGENDARY": 3000}
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) <statement> с обычной обработкой параметров"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------------------
+
+def seed(target: int, reset: bool) -> int:
+    run_migrations()
+    with engine.begin() as conn:
+        if reset:
+            conn.execute(text("""
+                UPDATE user_cards SET is_locked = FALSE
+                WHERE id IN (SELECT user_card_id FROM market_listings)
+            """))
+            conn.execute(text("TRUNCATE market_listings RESTART IDENTITY"))
+        existing = conn.execute(text("SELECT count(*) FROM market_listings")).scalar()
+        missing = target - existing
+        if missing <= 0:
+            return existing
+
+        sellers = conn.execute(text("SELECT count(*) FROM users")).scalar()
+        cards = conn.execute(text("SELECT count(*) FROM cards")).scalar()
+        if not sellers or not cards:
+            sys.exit("No users or cards to list: run seed_data.py (or benchmarks.http_suite) first")
+
+        base_price = " ".join(f"WHEN '{rarity}' THEN {price}" for rarity, price in RARITY_PRICE.items())
+        conn.execute(text("CREATE TEMP TABLE bench_sellers AS SELECT row_number() OVER () AS n, id FROM users LIMIT 20000"))
+        conn.execute(text("CREATE TEMP TABLE bench_cards AS SELECT row_number() OVER () AS n, id, rarity, clan FROM cards"))
+        seller_count = conn.execute(text("SELECT count(*) FROM bench_sellers")).scalar()
+
+        for start in range(0, missing, SEED_CHUNK):
+            size = min(SEED_CHUNK, missing - start)
+            # Новые карты владельцев (заблокированы - выставлены на продажу) и их лоты
+            conn.execute(text(f"""
+                WITH new_cards AS (
+                    INSERT INTO user_cards (user_id, card_id, is_locked)
+                    SELECT s.id, c.id, TRUE
+                    FROM generate_series(1, :size) g
+                    JOIN bench_sellers s ON s.n = 1 + (hashint4(g + :start) & 2147483647) % :sellers
+                    JOIN bench_cards c ON c.n = 1 + (hashint4(g + :start + 7919) & 2147483647) % :cards
+                    RETURNING id, user_id, card_id
+                )
+                INSERT INTO market_listings (seller_id, user_card_id, price, card_id, rarity, clan, created_at)
+                SELECT nc.user_id, nc.id,
+                       GREATEST(1, (CASE c.rarity::text {base_price} END * exp(0.5 * sqrt(-2 * ln(1 - random())) * cos(2 * pi() * random())))::int),
+                       c.id, c.rarity, COALESCE(c.clan, 'Outcasts'),
+                       now() - random() * interval '60 days'
+                FROM new_cards nc
+                JOIN bench_cards c ON c.id = nc.card_id
+            """), {"size": size, "start": start, "sellers": seller_count, "cards": cards})
+            print(f"  seeded {start + size:,}/{missing:,} listings")
+        conn.execute(text("ANALYZE market_listings"))
+        conn.execute(text("ANALYZE user_cards"))
+        return existing + missing
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+def make_filters() -> Dict[str, ListingFilters]:
+    """Самые частые rarity/clan в данных и ценовой диапазон вокруг медианы"""
+    with engine.connect() as conn:
+        clan = conn.execute(text(
+            "SELECT clan FROM market_listings GROUP BY clan ORDER BY count(*) DESC LIMIT 1"
+        )).scalar()
+        low, high = conn.execute(text(
+            "SELECT percentile_disc(0.25) WITHIN GROUP (ORDER BY price),"
+            "       percentile_disc(0.75) WITHIN GROUP (ORDER BY price)"
+            " FROM market_listings WHERE rarity = 'COMMON'"
+        )).one()
+    return {
+        "all": ListingFilters(),
+        "rarity": ListingFilters(rarity=Rarity.EPIC),
+        "clan": ListingFilters(clan=clan),
+        "rarity+clan": ListingFilters(rarity=Rarity.COMMON, clan=clan),
+        "rarity+price": ListingFilters(rarity=Rarity.COMMON, min_price=low, max_price=high),
+    }
+
+
+def cursor_at(filters: ListingFilters, sort_name: str, depth: int) -> Optional[Tuple[str, Tuple]]:
+    """Курсор после depth лотов (OFFSET только при подготовке сценария)"""
+    sort = SORTS[sort_name]
+    with engine.connect() as conn:
+        row = conn.execute(listings_query(filters, sort, None, 1).offset(depth - 1)).first()
+    if row is None:
+        return None
+    value = getattr(row, sort.column.key)
+    return encode_cursor(sort, value, row.id), (value, row.id)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def plan_problems(plan: dict) -> List[str]:
+    problems = []
+    node = plan.get("Node Type", "")
+    if node in ("Sort", "Incremental Sort"):
+        problems.append(node)
+    if node == "Seq Scan":
+        problems.append(f"Seq Scan on {plan.get('Relation Name')}")
+    for child in plan.get("Plans", ()):
+        problems.extend(plan_problems(child))
+    return problems
+
+
+def plan_indexes(plan: dict) -> List[str]:
+    names = [plan["Index Name"]] if "Index Name" in plan and plan.get("Relation Name") == "market_listings" else []
+    for child in plan.get("Plans", ()):
+        names.extend(plan_indexes(child))
+    return names
+
+
+async def explain(db, filters: ListingFilters, sort_name: str, after) -> dict:
+    result = await db.execute(Explain(listings_query(filters, SORTS[sort_name], after, PAGE_SIZE + 1)))
+    return result.scalar()[0]["Plan"]
+
+
+async def measure(db, filters: ListingFilters, sort_name: str, cursor: Optional[str], repeat: int) -> Tuple[float, float]:
+    await browse_listings(db, filters, sort_name, PAGE_SIZE, cursor)  # warmup
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await browse_listings(db, filters, sort_name, PAGE_SIZE, cursor)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+async def run(args) -> List[str]:
+    depths = sorted({int(d) for d in args.depths.split(",")})
+    filters_by_name = make_filters()
+    failures = []
+
+    async with AsyncSessionLocal() as db:
+        await pack_engine.catalog(db)
+        total = (await db.execute(select(func.count()).select_from(MarketListing))).scalar()
+        print(f"\nmarket_listings: {total:,} rows, page size {PAGE_SIZE}, {args.repeat} requests per point")
+        header = " ".join(f"{'d=' + format(d, ','):>18}" for d in depths)
+        print(f"{'filter':14} {'sort':10} {header}   (p50/p99 ms)")
+
+        for filter_name, filters in filters_by_name.items():
+            for sort_name in SORTS:
+                cells = []
+                p99_by_depth = {}
+                for depth in depths:
+                    cursor, after = (None, None)
+                    if depth > 0:
+                        found = cursor_at(filters, sort_name, depth)
+                        if found is None:
+                            cells.append(f"{'-':>18}")
+                            continue
+                        cursor, after = found
+                    p50, p99 = await measure(db, filters, sort_name, cursor, args.repeat)
+                    p99_by_depth[depth] = p99
+                    cells.append(f"{p50:8.2f}/{p99:<9.2f}")
+
+                    plan = await explain(db, filters, sort_name, after)
+                    problems = plan_problems(plan)
+                    if problems:
+                        failures.append(f"{filter_name}/{sort_name}@{depth}: {', '.join(problems)}")
+                    if args.verbose:
+                        print(f"    plan {filter_name}/{sort_name}@{depth}: {plan_indexes(plan)} {problems or ''}")
+
+                print(f"{filter_name:14} {sort_name:10} {' '.join(cells)}")
+
+                first, deepest = p99_by_depth.get(depths[0]), p99_by_depth[max(p99_by_depth)]
+                if first is not None and deepest > max(first * args.max_ratio, first + args.slack_ms):
+                    failures.append(
+                        f"{filter_name}/{sort_name}: p99 {first:.2f}ms -> {deepest:.2f}ms at depth {max(p99_by_depth):,}"
+                    )
+
+    await async_engine.dispose()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=1_000_000, help="top market_listings up to this many rows")
+    parser.add_argument("--no-seed", action="store_true", help="use market_listings as is")
+    parser.add_argument("--reset", action="store_true", help="TRUNCATE market_listings before seeding")
+    parser.add_argument("--depths", default="0,1000,10000,100000", help="cursor depths (listings skipped)")
+    parser.add_argument("--repeat", type=int, default=200, help="requests per filter/sort/depth point")
+    parser.add_argument("--max-ratio", type=float, default=2.0, help="allowed deep/first page p99 ratio")
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="absolute p99 growth always allowed")
+    parser.add_argument("--verbose", action="store_true", help="print the index used by every plan")
+    parser.add_argument("--check", action="store_true", help="exit 1 on a non-flat p99 or a Sort/Seq Scan plan")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        started = time.perf_counter()
+        rows = seed(args.listings, args.reset)
+        print(f"market_listings ready: {rows:,} rows ({time.perf_counter() - started:.1f}s)")
+
+    failures = asyncio.run(run(args))
+    if failures:
+        print("\nFailed:")
+        for failure in failures:
+            print(f"  {failure}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("\nAll plans are index range scans, p99 is flat across cursor depths")
+
+
+if __name__ == "__main__":
+    main()
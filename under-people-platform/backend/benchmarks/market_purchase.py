@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent marketplace purchases (app.services.market.purchase_listing)
+
+Creates its own buyers, sellers and listings in the DATABASE_URL Postgres
+(telegram_id range 30_000_000+, removed again on the next run) and runs
+three scenarios, each attempt in its own AsyncSession:
+
+    hot     --buyers concurrent buyers race for the same listing, --rounds times;
+            exactly one must win every round
+    spread  --buyers concurrent buyers pick random listings out of --listings
+            for --duration seconds (purchases/sec under mixed contention)
+    cross   pairs of users buy each other's listings at the same moment -
+            opposite lock orders if users were locked buyer-first
+
+Reported per scenario: purchases/sec, attempts/sec, conflict rate (lost the
+race: listing already sold), p50/p99 latency, errors and deadlocks. After the
+run the invariants are checked: coins are conserved, the coin ledger sums
+to every user's up_coins, every sold card has
+exactly one owner and is unlocked, no listing was sold twice. With --check
+the script exits non-zero on a violated invariant, an error or a deadlock.
+
+Usage:
+    cd backend
+    python -m benchmarks.market_purchase
+    python -m benchmarks.market_purchase --buyers 200 --rounds 50 --listings 2000 --duration 10 --check
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import insert, select, text
+
+from app.db.session import AsyncSessionLocal, async_engine, engine
+from app.models.models import Card, CoinLedgerEntry, CoinReason, MarketListing, Rarity, User, UserCard, UserRole
+from app.services.market import PurchaseError, purchase_listing
+from run_migrations import run_migrations
+
+TELEGRAM_BASE = 30_000_000
+START_COINS = 10_000_000
+PRICE = 100
+
+
+@dataclass
+class Fixtures:
+    buyers: List[uuid.UUID]
+    sellers: List[uuid.UUID]
+    card_id: int
+    next_telegram_id: int = TELEGRAM_BASE
+    listing_ids: List[int] = field(default_factory=list)
+
+
+# ---------------------------------------------------------------------------
+# Setup
+# ---------------------------------------------------------------------------
+
+def cleanup() -> None:
+    with engine.begin() as conn:
+        bench_users = "SELECT id FROM users WHERE telegram_id >= :base AND telegram_id < :base + 1000000"
+        params = {"base": TELEGRAM_BASE}
+        conn.execute(text(f"DELETE FROM market_listings WHERE seller_id IN ({bench_users})"), params)
+        conn.execute(text(f"DELETE FROM coin_balance_snapshots WHERE user_id IN ({bench_users})"), params)
+        conn.execute(text(f"DELETE FROM coin_ledger WHERE user_id IN ({bench_users})"), params)
+        conn.execute(text(f"DELETE FROM user_cards WHERE user_id IN ({bench_users})"), params)
+        conn.execute(text(f"DELETE FROM users WHERE id IN ({bench_users})"), params)
+
+
+def create_users(count: int, fixtures: Fixtures) -> List[uuid.UUID]:
+    now = datetime.utcnow()
+    rows = []
+    for _ in range(count):
+        n = fixtures.next_telegram_id
+        fixtures.next_telegram_id += 1
+        rows.append({
+            "id": uuid.uuid4(),
+            "telegram_id": n,
+            "username": f"market_{n}",
+            "up_coins": START_COINS,
+            "clan_name": "Outcasts",
+            "referral_code": f"MP-{n - TELEGRAM_BASE:06d}",
+            "role": UserRole.RANGER,
+            "is_active": True,
+            "is_verified": True,
+            "created_at": now,
+            "updated_at": now,
+        })
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), rows)
+        conn.execute(insert(CoinLedgerEntry.__table__), [
+            {
+                "entry_id": f"opening:{row['id']}",
+                "user_id": row["id"],
+                "amount": START_COINS,
+                "reason": CoinReason.OPENING_BALANCE.value,
+                "created_at": now,
+            }
+            for row in rows
+        ])
+    return [row["id"] for row in rows]
+
+
+def create_listings(sellers: List[uuid.UUID], count: int, card_id: int) -> List[int]:
+    """count лотов по PRICE, продавцы по кругу"""
+    with engine.begin() as conn:
+        user_card_ids = conn.execute(
+            insert(UserCard.__table__).returning(UserCard.__table__.c.id, sort_by_parameter_order=True),
+            [{"user_id": sellers[i % len(sellers)], "card_id": card_id, "is_locked": True} for i in range(count)],
+        ).scalars().all()
+        return conn.execute(
+            insert(MarketListing.__table__).returning(MarketListing.__table__.c.id, sort_by_parameter_order=True),
+            [
+                {
+                    "seller_id": sellers[i % len(sellers)],
+                    "user_card_id": user_card_id,
+                    "price": PRICE,
+                    "card_id": card_id,
+                    "rarity": Rarity.COMMON,
+                    "clan": "Outcasts",
+                    "created_at": datetime.utcnow(),
+                }
+                for i, user_card_id in enumerate(user_card_ids)
+            ],
+        ).scalars().all()
+
+
+def setup(buyers: int, sellers: int) -> Fixtures:
+    run_migrations()
+    cleanup()
+    with engine.begin() as conn:
+        card_id = conn.execute(select(Card.id).order_by(Card.id).limit(1)).scalar()
+        if card_id is None:
+            card_id = conn.execute(
+                insert(Card.__table__).returning(Card.__table__.c.id),
+                {"name": "Market bench card", "rarity": Rarity.COMMON, "power": 10, "clan": "Outcasts"},
+            ).scalar()
+    fixtures = Fixtures(buyers=[], sellers=[], card_id=card_id)
+    fixtures.buyers = create_users(buyers, fixtures)
+    fixtures.sellers = create_users(sellers, fixtures)
+    return fixtures
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.outcomes = Counter()
+        self.latencies: List[float] = []
+        self.sold: Counter = Counter()  # listing_id -> успешных покупок
+
+    async def attempt(self, listing_id: int, buyer_id) -> None:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                await purchase_listing(db, listing_id, buyer_id)
+            self.outcomes["completed"] += 1
+            self.sold[listing_id] += 1
+        except PurchaseError as e:
+            self.outcomes[e.outcome] += 1
+        except Exception as e:
+            self.outcomes["deadlock" if "deadlock" in str(e).lower() else "error"] += 1
+        self.latencies.append(time.perf_counter() - started)
+
+    def report(self, name: str, elapsed: float) -> None:
+        attempts = sum(self.outcomes.values())
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000 if ordered else 0.0
+
+        print(
+            f"{name:7} purchases/s={self.outcomes['completed'] / elapsed:9.1f} "
+            f"attempts/s={attempts / elapsed:9.1f} "
+            f"conflicts={self.outcomes['unavailable'] / attempts if attempts else 0:7.2%} "
+            f"p50={pct(50):7.2f}ms p99={pct(99):7.2f}ms "
+            f"errors={self.outcomes['error']} deadlocks={self.outcomes['deadlock']}"
+        )
+
+
+async def run_hot(fixtures: Fixtures, rounds: int) -> Recorder:
+    recorder = Recorder()
+    listings = create_listings(fixtures.sellers, rounds, fixtures.card_id)
+    fixtures.listing_ids.extend(listings)
+    started = time.perf_counter()
+    for listing_id in listings:
+        await asyncio.gather(*(recorder.attempt(listing_id, buyer) for buyer in fixtures.buyers))
+    recorder.report("hot", time.perf_counter() - started)
+    return recorder
+
+
+async def run_spread(fixtures: Fixtures, listings_count: int, duration: float, seed: int) -> Recorder:
+    recorder = Recorder()
+    listings = create_listings(fixtures.sellers, listings_count, fixtures.card_id)
+    fixtures.listing_ids.extend(listings)
+    deadline = time.perf_counter() + duration
+
+    async def buyer_loop(n: int, buyer_id):
+        rng = random.Random(seed + n)
+        while time.perf_counter() < deadline:
+            await recorder.attempt(rng.choice(listings), buyer_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(buyer_loop(n, buyer) for n, buyer in enumerate(fixtures.buyers)))
+    recorder.report("spread", time.perf_counter() - started)
+    return recorder
+
+
+async def run_cross(fixtures: Fixtures, pairs: int, rounds: int) -> Recorder:
+    """Пары (a, b): a покупает лот b, b - лот a, одновременно"""
+    recorder = Recorder()
+    users = create_users(pairs * 2, fixtures)
+    a_side, b_side = users[:pairs], users[pairs:]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        a_listings = create_listings(a_side, pairs, fixtures.card_id)
+        b_listings = create_listings(b_side, pairs, fixtures.card_id)
+        fixtures.listing_ids.extend(a_listings + b_listings)
+        await asyncio.gather(*(
+            attempt
+            for i in range(pairs)
+            for attempt in (recorder.attempt(b_listings[i], a_side[i]), recorder.attempt(a_listings[i], b_side[i]))
+        ))
+    recorder.report("cross", time.perf_counter() - started)
+    return recorder
+
+
+# ---------------------------------------------------------------------------
+# Invariants
+# ---------------------------------------------------------------------------
+
+def check_invariants(fixtures: Fixtures, recorders: List[Recorder]) -> List[str]:
+    problems = []
+    sold = Counter()
+    for recorder in recorders:
+        sold.update(recorder.sold)
+    double = [listing_id for listing_id, n in sold.items() if n > 1]
+    if double:
+        problems.append(f"{len(double)} listings sold more than once")
+
+    with engine.connect() as conn:
+        bench_users = "SELECT id FROM users WHERE telegram_id >= :base AND telegram_id < :base + 1000000"
+        params = {"base": TELEGRAM_BASE}
+        users, coins = conn.execute(
+            text(f"SELECT count(*), sum(up_coins) FROM users WHERE id IN ({bench_users})"), params
+        ).one()
+        if coins != users * START_COINS:
+            problems.append(f"coins not conserved: {coins} != {users * START_COINS}")
+
+        drifted = conn.execute(text(f"""
+            SELECT count(*) FROM users u
+            WHERE u.id IN ({bench_users})
+              AND u.up_coins <> (SELECT COALESCE(sum(amount), 0) FROM coin_ledger l WHERE l.user_id = u.id)
+        """), params).scalar()
+        if drifted:
+            problems.append(f"{drifted} users' up_coins differ from their ledger sum")
+
+        remaining = conn.execute(
+            text("SELECT count(*) FROM market_listings WHERE id = ANY(:ids)"), {"ids": fixtures.listing_ids}
+        ).scalar()
+        if remaining != len(fixtures.listing_ids) - len(sold):
+            problems.append(f"{len(fixtures.listing_ids) - remaining} listings gone, {len(sold)} purchases recorded")
+
+        moved = conn.execute(text(f"""
+            SELECT count(*) FILTER (WHERE is_locked), count(*)
+            FROM user_cards
+            WHERE user_id IN ({bench_users})
+              AND id NOT IN (SELECT user_card_id FROM market_listings WHERE user_card_id IS NOT NULL)
+        """), params).one()
+        if moved[0]:
+            problems.append(f"{moved[0]} sold cards are still locked")
+        if moved[1] != len(sold):
+            problems.append(f"{moved[1]} cards changed hands, {len(sold)} purchases recorded")
+    return problems
+
+
+async def run(args, fixtures: Fixtures) -> List[Recorder]:
+    print(f"\n{len(fixtures.buyers)} buyers, {len(fixtures.sellers)} sellers, price {PRICE}")
+    try:
+        return [
+            await run_hot(fixtures, args.rounds),
+            await run_spread(fixtures, args.listings, args.duration, args.seed),
+            await run_cross(fixtures, args.pairs, args.rounds),
+        ]
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=100, help="concurrent buyers")
+    parser.add_argument("--sellers", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20, help="hot listings / cross rounds")
+    parser.add_argument("--listings", type=int, default=1000, help="listings in the spread scenario")
+    parser.add_argument("--pairs", type=int, default=50, help="user pairs in the cross scenario")
+    parser.add_argument("--duration", type=float, default=5.0, help="spread scenario seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", action="store_true", help="exit 1 on a violated invariant, error or deadlock")
+    args = parser.parse_args()
+
+    fixtures = setup(args.buyers, args.sellers)
+    recorders = asyncio.run(run(args, fixtures))
+
+    problems = check_invariants(fixtures, recorders)
+    hot = recorders[0]
+    if hot.outcomes["completed"] != args.rounds:
+        problems.append(f"hot: {hot.outcomes['completed']} winners for {args.rounds} listings")
+    for name, recorder in zip(("hot", "spread", "cross"), recorders):
+        if recorder.outcomes["error"] or recorder.outcomes["deadlock"]:
+            problems.append(f"{name}: {recorder.outcomes['error']} errors, {recorder.outcomes['deadlock']} deadlocks")
+
+    if problems:
+        print("\nFailed:")
+        for problem in problems:
+            print(f"  {problem}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("\nOne winner per listing, no deadlocks, coins conserved")
+
+
+if __name__ == "__main__":
+    main()
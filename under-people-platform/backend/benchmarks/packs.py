@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Pack opening engine: sampling throughput and drop-rate check
+
+Throughput (packs/s for one worker, no database) of three ways to draw a pack:
+
+    naive       random.choices(cards, weights) per pack - O(n) prefix sums every call
+    cum_weights random.choices with precomputed cum_weights - O(log n) bisect per card
+    alias       AliasTable.sample_many (app.services.packs) - O(1) per card
+
+Drop rates: draws --draws cards from every pack type and runs Pearson
+chi-square tests of the observed counts against the configured weights,
+per rarity and per card. With --check the script exits non-zero when any
+p-value is below --alpha, so it can gate CI.
+
+Usage:
+    cd backend
+    python -m benchmarks.packs
+    python -m benchmarks.packs --cards 2000 --draws 2000000 --check
+"""
+
+import argparse
+import itertools
+import math
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from app.models.models import Rarity
+from app.services.packs import PACK_TYPES, CatalogCard, PackCatalog
+
+CATALOG_RARITY_WEIGHTS = {Rarity.COMMON: 55, Rarity.RARE: 25, Rarity.EPIC: 14, Rarity.LEGENDARY: 6}
+
+
+def make_catalog(size: int, rng: random.Random) -> PackCatalog:
+    rarities = list(CATALOG_RARITY_WEIGHTS)
+    weights = list(CATALOG_RARITY_WEIGHTS.values())
+    cards = [
+        CatalogCard(id=i + 1, rarity=rng.choices(rarities, weights)[0], payload={"id": i + 1})
+        for i in range(size)
+    ]
+    return PackCatalog(cards, PACK_TYPES)
+
+
+def expected_card_probabilities(catalog: PackCatalog, pack_name: str) -> Dict[int, float]:
+    """Independent of the alias table: rarity weight split evenly inside the rarity"""
+    pack = PACK_TYPES[pack_name]
+    by_rarity: Dict[Rarity, List[CatalogCard]] = {}
+    for card in catalog.cards:
+        by_rarity.setdefault(card.rarity, []).append(card)
+    total = sum(pack.weights.get(r, 0) for r in by_rarity)
+    return {
+        card.id: pack.weights.get(rarity, 0) / total / len(pool)
+        for rarity, pool in by_rarity.items()
+        for card in pool
+    }
+
+
+def chi_square_p_value(statistic: float, dof: int) -> float:
+    """Upper tail of chi-square (Wilson-Hilferty normal approximation)"""
+    if dof <= 0:
+        return 1.0
+    z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def chi_square(observed: Counter, expected: Dict, draws: int) -> Tuple[float, int]:
+    statistic = 0.0
+    cells = 0
+    for key, probability in expected.items():
+        if probability <= 0:
+            continue
+        e = probability * draws
+        statistic += (observed.get(key, 0) - e) ** 2 / e
+        cells += 1
+    return statistic, cells - 1
+
+
+def bench_throughput(catalog: PackCatalog, pack_name: str, seconds: float) -> Dict[str, float]:
+    pack = PACK_TYPES[pack_name]
+    table = catalog.tables[pack_name]
+    probabilities = expected_card_probabilities(catalog, pack_name)
+    cards = [card for card in catalog.cards if probabilities[card.id] > 0]
+    weights = [probabilities[card.id] for card in cards]
+    cum_weights = list(itertools.accumulate(weights))
+    rng = random.Random(1)
+
+    candidates = {
+        "naive": lambda: rng.choices(cards, weights=weights, k=pack.size),
+        "cum_weights": lambda: rng.choices(cards, cum_weights=cum_weights, k=pack.size),
+        "alias": lambda: table.sample_many(pack.size, rng.random),
+    }
+    results = {}
+    for name, draw in candidates.items():
+        packs = 0
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        while time.perf_counter() < deadline:
+            for _ in range(1000):
+                draw()
+            packs += 1000
+        results[name] = packs / (time.perf_counter() - started)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=500, help="synthetic catalog size")
+    parser.add_argument("--draws", type=int, default=1_000_000, help="cards drawn per pack type for the chi-square test")
+    parser.add_argument("--seconds", type=float, default=2.0, help="throughput run per method")
+    parser.add_argument("--alpha", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", action="store_true", help="exit 1 if a drop-rate test fails")
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.cards, random.Random(args.seed))
+    failures = []
+
+    for pack_name, pack in PACK_TYPES.items():
+        print(f"\n== pack '{pack_name}' ({pack.size} cards, catalog {args.cards}) ==")
+        throughput = bench_throughput(catalog, pack_name, args.seconds)
+        for method, rate in throughput.items():
+            print(f"  {method:12} {rate:12,.0f} packs/s  ({rate / throughput['naive']:.1f}x naive)")
+
+        rng = random.Random(args.seed)
+        drawn = catalog.tables[pack_name].sample_many(args.draws, rng.random)
+        card_counts = Counter(card.id for card in drawn)
+        rarity_counts = Counter(card.rarity for card in drawn)
+
+        card_expected = expected_card_probabilities(catalog, pack_name)
+        rarity_expected: Dict[Rarity, float] = {}
+        rarity_of = {card.id: card.rarity for card in catalog.cards}
+        for card_id, probability in card_expected.items():
+            rarity_expected[rarity_of[card_id]] = rarity_expected.get(rarity_of[card_id], 0.0) + probability
+
+        for label, observed, expected in (
+            ("rarity", rarity_counts, rarity_expected),
+            ("card", card_counts, card_expected),
+        ):
+            statistic, dof = chi_square(observed, expected, args.draws)
+            p_value = chi_square_p_value(statistic, dof)
+            verdict = "ok" if p_value >= args.alpha else "FAIL"
+            print(f"  chi-square per {label:6} stat={statistic:10.1f} dof={dof:5d} p={p_value:.4f} {verdict}")
+            if p_value < args.alpha:
+                failures.append(f"{pack_name}/{label}")
+
+        for rarity, probability in sorted(rarity_expected.items(), key=lambda kv: -kv[1]):
+            observed = rarity_counts.get(rarity, 0) / args.draws
+            print(f"    {rarity.value:10} expected {probability:.4%}  observed {observed:.4%}")
+
+    if failures:
+        print(f"\nDrop-rate check failed: {', '.join(failures)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: response encoding cost per list item
+
+For users, products and events it encodes a list of --items ORM objects
+(transient instances, no database) and reports ns per item:
+
+    before      hand-built dicts (the pre-serializer router code) returned as a
+                plain dict: jsonable_encoder + JSONResponse (stdlib json)
+    dict_orjson compiled serializers, but still returned as a dict:
+                jsonable_encoder + ORJSONResponse (default_response_class only)
+    after       compiled serializers returned as ORJSONResponse directly
+                (what the routers do now: no jsonable_encoder)
+
+Bodies of "before" and "after" are decoded and compared so the benchmark
+also checks that the wire format did not change (apart from fields that
+were added on purpose).
+
+Usage:
+    cd backend
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --items 500 --repeat 200
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.serializers import ORJSONResponse, event_item, product_item, user_private
+from app.models.event import Event
+from app.models.models import Product, ProductType, User, UserRole
+
+
+# -- pre-serializer code, kept verbatim for comparison -------------------------
+
+def old_user(user):
+    return {
+        "id": str(user.id),
+        "telegram_id": user.telegram_id,
+        "username": user.username,
+        "avatar_url": user.avatar_url,
+        "up_coins": user.up_coins,
+        "clan_name": user.clan_name,
+        "referral_code": user.referral_code,
+        "role": user.role.value if hasattr(user.role, 'value') else str(user.role),
+        "is_active": user.is_active,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "last_login": user.last_login.isoformat() if user.last_login else None,
+    }
+
+
+def old_product(p):
+    return {
+        "id": p.id,
+        "name": p.name,
+        "description": p.description,
+        "price": p.price,
+        "image_url": p.image_url,
+        "type": p.product_type,
+    }
+
+
+def old_event(event):
+    return {
+        "id": event.id,
+        "title": event.title,
+        "description": event.description,
+        "start_date": event.start_date.isoformat(),
+        "end_date": event.end_date.isoformat() if event.end_date else None,
+        "location": event.location,
+        "price": event.price,
+        "image_url": event.image_url,
+        "capacity": event.capacity,
+    }
+
+
+# -- fixtures ------------------------------------------------------------------
+
+def make_objects(n: int):
+    now = datetime(2026, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    users = [
+        User(
+            id=uuid.UUID(int=i + 1),
+            telegram_id=100_000_000 + i,
+            username=f"member_{i}",
+            up_coins=i * 7,
+            clan_name="Outcasts",
+            role=UserRole.RANGER,
+            is_active=True,
+            is_verified=True,
+            created_at=now - timedelta(days=i),
+            last_login=now,
+        )
+        for i in range(n)
+    ]
+    products = [
+        Product(
+            id=i + 1, name=f"Product {i}", description="Synthetic product " * 4,
+            price=1000 + i, image_url=f"/img/products/{i}.png", product_type=ProductType.GEAR,
+        )
+        for i in range(n)
+    ]
+    naive = now.replace(tzinfo=None)
+    events = [
+        Event(
+            id=i + 1, title=f"Gathering {i}", description="Synthetic event " * 4,
+            start_date=naive + timedelta(days=i), end_date=naive + timedelta(days=i, hours=4),
+            location="Bunker", price=1500.0, image_url=None, capacity=200,
+        )
+        for i in range(n)
+    ]
+    return {"users": users, "products": products, "events": events}
+
+
+def encode_before(items, old):
+    return JSONResponse(jsonable_encoder({"items": [old(o) for o in items]})).body
+
+
+def encode_dict_orjson(items, new):
+    return ORJSONResponse(jsonable_encoder({"items": [new(o) for o in items]})).body
+
+
+def encode_after(items, new):
+    return ORJSONResponse({"items": [new(o) for o in items]}).body
+
+
+def measure(fn, items, serializer, repeat: int) -> float:
+    """Median ns per item over `repeat` encodings of the whole list"""
+    fn(items, serializer)  # warmup
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        fn(items, serializer)
+        samples.append((time.perf_counter_ns() - started) / len(items))
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100, help="list length per response")
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+
+    objects = make_objects(args.items)
+    cases = {
+        "users": (old_user, user_private),
+        "products": (old_product, product_item),
+        "events": (old_event, event_item),
+    }
+
+    print(f"{'model':10} {'before':>12} {'dict_orjson':>12} {'after':>12} {'speedup':>8}   (ns/item, {args.items} items)")
+    for name, (old, new) in cases.items():
+        items = objects[name]
+
+        before_body = json.loads(encode_before(items, old))["items"]
+        after_body = json.loads(encode_after(items, new))["items"]
+        for old_row, new_row in zip(before_body, after_body):
+            changed = {k for k in old_row if old_row[k] != new_row.get(k)}
+            assert not changed, f"{name}: fields changed on the wire: {sorted(changed)}"
+
+        before = measure(encode_before, items, old, args.repeat)
+        dict_orjson = measure(encode_dict_orjson, items, new, args.repeat)
+        after = measure(encode_after, items, new, args.repeat)
+        print(f"{name:10} {before:12.0f} {dict_orjson:12.0f} {after:12.0f} {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Referral bonuses - credit inviters through the UP Coins ledger
+
+Every active invitee (users.invited_by_code) earns its active inviter
+REFERRAL_BONUS_COINS once: entry "referral:<invitee id>". Invitees are read
+in keyset chunks by id; each chunk is posted as a single ledger batch (one
+INSERT ... ON CONFLICT + one UPDATE of the inviters' balances) and
+committed on its own. Already credited invitees are skipped, so an
+interrupted or repeated run is safe.
+
+Usage:
+    python grant_referral_bonuses.py
+    python grant_referral_bonuses.py --chunk 5000 --amount 50 --dry-run
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, async_engine
+from app.models.models import CoinReason
+from app.services.ledger import LedgerEntry, post_entries
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("grant_referral_bonuses")
+
+PENDING_SQL = text("""
+    SELECT invitee.id AS invitee_id, inviter.id AS inviter_id
+    FROM users invitee
+    JOIN users inviter ON inviter.referral_code = invitee.invited_by_code
+    WHERE (CAST(:after AS uuid) IS NULL OR invitee.id > CAST(:after AS uuid))
+      AND invitee.is_active AND inviter.is_active
+      AND NOT EXISTS (
+          SELECT 1 FROM coin_ledger l WHERE l.entry_id = 'referral:' || invitee.id
+      )
+    ORDER BY invitee.id
+    LIMIT :chunk
+""")
+
+
+async def grant(chunk: int, amount: int, dry_run: bool) -> tuple:
+    granted = inviters = 0
+    after = None
+    try:
+        while True:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(PENDING_SQL, {"after": after, "chunk": chunk})).all()
+                if not rows:
+                    break
+                after = str(rows[-1].invitee_id)
+                if dry_run:
+                    granted += len(rows)
+                    inviters += len({row.inviter_id for row in rows})
+                    continue
+                balances = await post_entries(db, [
+                    LedgerEntry(
+                        f"referral:{row.invitee_id}", row.inviter_id, amount,
+                        CoinReason.REFERRAL_BONUS, str(row.invitee_id),
+                    )
+                    for row in rows
+                ])
+                await db.commit()
+            granted += sum(row.entries for row in balances.values())
+            inviters += len(balances)
+            logger.info("✅ %d bonuses so far (last invitee %s)", granted, after)
+    finally:
+        await async_engine.dispose()
+    return granted, inviters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=2000, help="invitees per ledger batch")
+    parser.add_argument("--amount", type=int, default=settings.REFERRAL_BONUS_COINS, help="UP coins per invitee")
+    parser.add_argument("--dry-run", action="store_true", help="count pending bonuses, post nothing")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    granted, inviters = asyncio.run(grant(args.chunk, args.amount, args.dry_run))
+    logger.info(
+        "✅ %s %d referral bonuses to %d inviters in %.1fs",
+        "Pending" if args.dry_run else "Granted", granted, inviters, time.perf_counter() - started,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Gunicorn config (gunicorn app.main:app -c gunicorn.conf.py)
+
+preload_app: приложение импортируется один раз в мастере, воркеры получают
+его через fork (copy-on-write) - старт воркера не платит за импорты и сборку
+FastAPI. Соединения БД/Redis и поток логирования пересоздаются в дочернем
+процессе через os.register_at_fork (app.db.session, app.core.cache,
+app.core.logging_config). Прогрев пула - в lifespan каждого воркера.
+
+Переменные окружения: PORT, WEB_CONCURRENCY, GUNICORN_PRELOAD, GUNICORN_TIMEOUT.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def child_exit(server, worker):
+    # Prometheus multiprocess: файлы gauge завершившегося воркера больше не учитываются
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Ledger reconciliation - verify users.up_coins against the UP Coins ledger
+
+Users are checked in keyset chunks by id. For each user the ledger balance
+(snapshot + entries after it) must equal the up_coins projection; both are
+read by one statement, so postings committed meanwhile cannot produce a
+false mismatch. With --verify-snapshots every snapshot is also compared
+with the full sum of the entries it covers (reads the whole ledger).
+
+Repairs (the ledger is the source of truth):
+    --repair-snapshots   recompute mismatched snapshots from the entries
+    --repair-projection  set up_coins to the ledger balance (rows locked
+                         first, so concurrent postings are not lost); the
+                         Redis leaderboard picks the change up on its next
+                         reconcile (LEADERBOARD_RECONCILE_INTERVAL)
+
+Exits 1 if a mismatch was found (also when it was repaired).
+
+Usage:
+    python reconcile_ledger.py
+    python reconcile_ledger.py --verify-snapshots --repair-snapshots
+    python reconcile_ledger.py --chunk 20000 --repair-projection
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("reconcile_ledger")
+
+REPORT_LIMIT = 20
+
+CHECK_SQL = """
+    WITH batch AS (
+        SELECT id, up_coins FROM users
+        WHERE CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid)
+        ORDER BY id
+        LIMIT :chunk
+    )
+    SELECT b.id,
+           COALESCE(b.up_coins, 0) AS projection,
+           COALESCE(s.balance, 0) + COALESCE((
+               SELECT sum(l.amount) FROM coin_ledger l
+               WHERE l.user_id = b.id AND l.id > COALESCE(s.last_entry_id, 0)
+           ), 0) AS ledger,
+           s.balance AS snapshot,
+           {covered} AS covered
+    FROM batch b
+    LEFT JOIN coin_balance_snapshots s ON s.user_id = b.id
+    ORDER BY b.id
+"""
+
+COVERED_SQL = """(
+    SELECT COALESCE(sum(l.amount), 0) FROM coin_ledger l
+    WHERE l.user_id = b.id AND l.id <= s.last_entry_id
+)"""
+
+REPAIR_SNAPSHOTS_SQL = text("""
+    UPDATE coin_balance_snapshots s
+    SET balance = (
+            SELECT COALESCE(sum(l.amount), 0) FROM coin_ledger l
+            WHERE l.user_id = s.user_id AND l.id <= s.last_entry_id
+        ),
+        taken_at = now()
+    WHERE s.user_id = ANY(CAST(:user_ids AS uuid[]))
+""")
+
+LOCK_USERS_SQL = text("""
+    SELECT id FROM users WHERE id = ANY(CAST(:user_ids AS uuid[])) ORDER BY id FOR UPDATE
+""")
+
+REPAIR_PROJECTION_SQL = text("""
+    UPDATE users u
+    SET up_coins = (SELECT COALESCE(sum(l.amount), 0) FROM coin_ledger l WHERE l.user_id = u.id),
+        leaderboard_revision = u.leaderboard_revision + 1,
+        updated_at = now()
+    WHERE u.id = ANY(CAST(:user_ids AS uuid[]))
+""")
+
+
+def reconcile(args) -> dict:
+    check = text(CHECK_SQL.format(covered=COVERED_SQL if args.verify_snapshots else "NULL"))
+    counts = {"users": 0, "projection": 0, "snapshots": 0}
+    after = None
+    while True:
+        params = {"after": after, "chunk": args.chunk}
+        with engine.begin() as conn:
+            rows = conn.execute(check, params).all()
+        if not rows:
+            break
+        after = str(rows[-1].id)
+        counts["users"] += len(rows)
+
+        bad_snapshots = [
+            row for row in rows
+            if row.snapshot is not None and row.covered is not None and row.snapshot != row.covered
+        ]
+        # Неверный снимок искажает и баланс по журналу - сначала снимки
+        if bad_snapshots and args.repair_snapshots:
+            with engine.begin() as conn:
+                conn.execute(REPAIR_SNAPSHOTS_SQL, {"user_ids": [row.id for row in bad_snapshots]})
+            logger.info("🔧 %d snapshots recomputed from the entries", len(bad_snapshots))
+            with engine.begin() as conn:
+                rows = conn.execute(check, params).all()
+
+        drifted = [row for row in rows if row.projection != row.ledger]
+        for row in (bad_snapshots + drifted)[:max(0, REPORT_LIMIT - counts["snapshots"] - counts["projection"])]:
+            logger.warning(
+                "❌ user %s: up_coins=%s ledger=%s snapshot=%s covered=%s",
+                row.id, row.projection, row.ledger, row.snapshot, row.covered,
+            )
+        counts["snapshots"] += len(bad_snapshots)
+        counts["projection"] += len(drifted)
+
+        if drifted and args.repair_projection:
+            user_ids = [row.id for row in drifted]
+            with engine.begin() as conn:
+                conn.execute(LOCK_USERS_SQL, {"user_ids": user_ids})
+                conn.execute(REPAIR_PROJECTION_SQL, {"user_ids": user_ids})
+            logger.info("🔧 up_coins set from the ledger for %d users", len(drifted))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=10_000, help="users per statement")
+    parser.add_argument("--verify-snapshots", action="store_true", help="compare snapshots with the full entry sums")
+    parser.add_argument("--repair-snapshots", action="store_true", help="recompute mismatched snapshots")
+    parser.add_argument("--repair-projection", action="store_true", help="set up_coins to the ledger balance")
+    args = parser.parse_args()
+    if args.repair_snapshots:
+        args.verify_snapshots = True
+
+    started = time.perf_counter()
+    counts = reconcile(args)
+    mismatches = counts["projection"] + counts["snapshots"]
+    logger.info(
+        "%s %d users in %.1fs: %d up_coins mismatches, %d snapshot mismatches",
+        "❌" if mismatches else "✅",
+        counts["users"], time.perf_counter() - started, counts["projection"], counts["snapshots"],
+    )
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
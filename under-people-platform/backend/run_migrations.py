@@ -2,22 +2,34 @@
 """
 Migration Runner - Execute database migrations
 
+Applied versions are recorded in the schema_migrations table, so each run
+only executes pending migrations. A Postgres advisory lock guarantees that
+a single process migrates at a time (parallel deploys / workers wait for
+it and then find nothing to do). Every migration runs in its own
+transaction together with its ledger row: either both are committed or
+neither is. A migration may also define backfill(session) for long data
+fills: it runs after the schema change is committed, commits in batches,
+and the ledger row is written once it completes.
+
 Usage:
     python run_migrations.py              # Run all pending migrations
-    python run_migrations.py --downgrade  # Revert last migration
+    python run_migrations.py --downgrade  # Revert last applied migration
+    python run_migrations.py --status     # Show applied / pending versions
 """
 
-import os
+import importlib.util
+import logging
 import sys
+import time
 from pathlib import Path
 
-# Add project root to path
-PROJECT_ROOT = Path(__file__).parent.parent
+# Add project root (backend/) to path
+PROJECT_ROOT = Path(__file__).parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from app.models.db_pool import get_session
-import logging
+from app.db.session import engine
 
 # Setup logging
 logging.basicConfig(
@@ -26,85 +38,181 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+MIGRATIONS_DIR = PROJECT_ROOT / "app" / "models" / "migrations"
+
+# Произвольный, но постоянный ключ pg_advisory_lock для миграций
+MIGRATION_LOCK_ID = 7_310_015_001
+
 
 def get_migration_files():
-    """Get list of migration files in order"""
-    migrations_dir = Path(__file__).parent / "app" / "models" / "migrations"
-    
-    if not migrations_dir.exists():
-        logger.error(f"❌ Migrations directory not found: {migrations_dir}")
+    """Get list of migration files in order (NNN_name.py)"""
+    if not MIGRATIONS_DIR.exists():
+        logger.error(f"❌ Migrations directory not found: {MIGRATIONS_DIR}")
         return []
-    
-    migration_files = sorted([
-        f for f in migrations_dir.glob("*.py") 
-        if f.name.startswith(("00", "01", "02", "03", "04", "05", "06", "07", "08", "09"))
-        and not f.name.startswith("__")
-    ])
-    
-    return migration_files
 
+    return sorted(
+        f for f in MIGRATIONS_DIR.glob("*.py")
+        if f.name[:3].isdigit()
+    )
 
-def run_migrations(downgrade: bool = False):
-    """Run all pending migrations"""
-    
-    session = next(get_session())
-    
+
+def migration_version(migration_file: Path) -> str:
+    return migration_file.name.split("_", 1)[0]
+
+
+def load_migration(migration_file: Path):
+    spec = importlib.util.spec_from_file_location(f"migration_{migration_file.stem}", migration_file)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def ensure_ledger(conn):
+    with conn.begin():
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(16) PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                duration_ms INTEGER NOT NULL
+            );
+        """))
+
+
+def applied_versions(conn) -> dict:
+    with conn.begin():
+        rows = conn.execute(text(
+            "SELECT version, name, applied_at, duration_ms FROM schema_migrations ORDER BY version"
+        )).all()
+    return {row.version: row for row in rows}
+
+
+def record_version(conn, migration_file: Path, step: str, duration_ms: int):
+    if step == "upgrade":
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (:v, :n, :d)"),
+            {"v": migration_version(migration_file), "n": migration_file.stem, "d": duration_ms},
+        )
+    else:
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = :v"), {"v": migration_version(migration_file)})
+
+
+def run_in_transaction(conn, migration_file: Path, step: str):
+    """
+    Миграции сами вызывают session.commit()/rollback(). Сессия привязана к
+    внешней транзакции соединения в режиме savepoint, поэтому их commit лишь
+    освобождает savepoint, а запись в ledger фиксируется одной транзакцией.
+
+    Долгое заполнение данных миграция выносит в backfill(session): он
+    выполняется после коммита upgrade вне общей транзакции (каждый
+    session.commit() - настоящий COMMIT пачки, блокировки не копятся), а
+    запись в ledger делается только после него. Прерванный backfill
+    повторяется при следующем запуске вместе с upgrade - оба обязаны быть
+    идемпотентными.
+    """
+    migration = load_migration(migration_file)
+    if not hasattr(migration, step):
+        raise RuntimeError(f"No {step} function in {migration_file.name}")
+
+    backfill = getattr(migration, "backfill", None) if step == "upgrade" else None
+    started = time.perf_counter()
+    with conn.begin():
+        session = Session(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            getattr(migration, step)(session)
+        finally:
+            session.close()
+        if backfill is None:
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            record_version(conn, migration_file, step, duration_ms)
+            return duration_ms
+
+    logger.info(f"🔄 Backfill for {migration_file.name}...")
+    session = Session(bind=conn)
     try:
-        migration_files = get_migration_files()
-        
-        if not migration_files:
-            logger.warning("⚠️ No migration files found")
-            return
-        
-        logger.info(f"Found {len(migration_files)} migration file(s)")
-        
-        for migration_file in migration_files:
-            logger.info(f"\n{'='*60}")
-            logger.info(f"Processing: {migration_file.name}")
-            logger.info(f"{'='*60}")
-            
-            try:
-                # Import migration module
-                import importlib.util
-                spec = importlib.util.spec_from_file_location("migration", migration_file)
-                migration = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(migration)
-                
-                # Run migration
-                if downgrade:
-                    if hasattr(migration, 'downgrade'):
-                        logger.info(f"⬇️  Running downgrade for {migration_file.name}...")
-                        migration.downgrade(session)
-                    else:
-                        logger.warning(f"⚠️ No downgrade function in {migration_file.name}")
-                else:
-                    if hasattr(migration, 'upgrade'):
-                        logger.info(f"⬆️  Running upgrade for {migration_file.name}...")
-                        migration.upgrade(session)
-                    else:
-                        logger.warning(f"⚠️ No upgrade function in {migration_file.name}")
-                        
-            except Exception as e:
-                logger.error(f"❌ Error in migration {migration_file.name}: {e}")
-                raise
-        
-        logger.info(f"\n{'='*60}")
-        logger.info("✅ All migrations completed successfully!")
-        logger.info(f"{'='*60}\n")
-        
-    except Exception as e:
-        logger.error(f"❌ Migration failed: {e}", exc_info=True)
-        sys.exit(1)
+        backfill(session)
     finally:
         session.close()
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    with conn.begin():
+        record_version(conn, migration_file, step, duration_ms)
+    return duration_ms
+
+
+def run_migrations(downgrade: bool = False):
+    """Run all pending migrations (or revert the last applied one)"""
+
+    migration_files = get_migration_files()
+    if not migration_files:
+        logger.warning("⚠️ No migration files found")
+        return
+
+    with engine.connect() as conn:
+        logger.info("🔒 Waiting for migration lock...")
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        conn.commit()
+        try:
+            ensure_ledger(conn)
+            applied = applied_versions(conn)
+
+            if downgrade:
+                applied_files = [f for f in migration_files if migration_version(f) in applied]
+                if not applied_files:
+                    logger.info("✓ Nothing to downgrade")
+                    return
+                last = applied_files[-1]
+                logger.info(f"⬇️  Running downgrade for {last.name}...")
+                duration_ms = run_in_transaction(conn, last, "downgrade")
+                logger.info(f"✅ Reverted {last.name} in {duration_ms} ms")
+                return
+
+            pending = [f for f in migration_files if migration_version(f) not in applied]
+            logger.info(f"Found {len(migration_files)} migration(s), {len(pending)} pending")
+
+            total_started = time.perf_counter()
+            for migration_file in pending:
+                logger.info(f"⬆️  Running upgrade for {migration_file.name}...")
+                try:
+                    duration_ms = run_in_transaction(conn, migration_file, "upgrade")
+                except Exception as e:
+                    logger.error(f"❌ Error in migration {migration_file.name}: {e}")
+                    raise
+                logger.info(f"✅ Applied {migration_file.name} in {duration_ms} ms")
+
+            logger.info(
+                f"✅ Schema is up to date ({len(pending)} applied in "
+                f"{(time.perf_counter() - total_started) * 1000:.0f} ms)"
+            )
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            conn.commit()
+
+
+def show_status():
+    with engine.connect() as conn:
+        ensure_ledger(conn)
+        applied = applied_versions(conn)
+    for migration_file in get_migration_files():
+        row = applied.get(migration_version(migration_file))
+        if row:
+            print(f"  applied  {migration_file.name:48} {row.applied_at:%Y-%m-%d %H:%M:%S} {row.duration_ms:>7} ms")
+        else:
+            print(f"  pending  {migration_file.name}")
 
 
 if __name__ == "__main__":
+    if "--status" in sys.argv:
+        show_status()
+        sys.exit(0)
+
     downgrade = "--downgrade" in sys.argv or "--down" in sys.argv
-    
-    if downgrade:
-        logger.warning("⬇️  DOWNGRADING DATABASE...")
-        run_migrations(downgrade=True)
-    else:
-        logger.info("⬆️  UPGRADING DATABASE...")
-        run_migrations(downgrade=False)
+    try:
+        if downgrade:
+            logger.warning("⬇️  DOWNGRADING DATABASE...")
+            run_migrations(downgrade=True)
+        else:
+            logger.info("⬆️  UPGRADING DATABASE...")
+            run_migrations(downgrade=False)
+    except Exception as e:
+        logger.error(f"❌ Migration failed: {e}", exc_info=True)
+        sys.exit(1)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator - production-scale data for performance testing
+
+Populates users, auth_codes, cards, user_cards, products, orders,
+market_listings, events and coin_ledger with realistic distributions and loads them
+with COPY FROM STDIN (no ORM, no per-row INSERT):
+
+- users: referral chains through invited_by_code (preferential attachment -
+  a few recruiters bring most members), log-normal skewed up_coins
+- cards: catalog rarity mix; user_cards drawn by drop-rate weights
+- market_listings: a small share of user_cards, price driven by rarity
+- orders / auth_codes / events: proportional to the user base
+- coin_ledger: an opening entry per user for the generated up_coins
+- referral_closure / referral_level_counts: rebuilt from invited_by_code
+
+The same --seed always produces the same rows (ids, codes, timestamps
+relative to --reference-time).
+
+Usage:
+    python seed_data.py --users 1000000 --truncate
+    python seed_data.py --users 200000 --seed 7 --truncate --skip-fk-checks
+    python seed_data.py --users 1000000 --cards-per-user 12 --listing-share 0.05
+"""
+
+import argparse
+import io
+import logging
+import math
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import text
+
+from app.db.session import engine
+from backfill_referrals import rebuild_referral_tree
+from run_migrations import run_migrations
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("seed_data")
+
+COPY_CHUNK_ROWS = 50_000
+
+CLANS = ("Outcasts", "Diggers", "Wardens", "Ghosts", "Rust Saints", "Night Shift")
+CLAN_WEIGHTS = (40, 20, 15, 12, 8, 5)
+
+# Имена enum-значений в Postgres (SQLAlchemy Enum хранит имена членов)
+RARITIES = ("COMMON", "RARE", "EPIC", "LEGENDARY")
+CATALOG_RARITY_WEIGHTS = (55, 25, 14, 6)      # состав каталога карт
+DROP_RARITY_WEIGHTS = (70, 20, 8, 2)          # что реально лежит у игроков
+RARITY_PRICE = {"COMMON": 40, "RARE": 150, "EPIC": 600, "LEGENDARY": 3000}
+ROLES = ("RANGER", "STALKER", "ELDER")
+ROLE_WEIGHTS = (90, 9, 1)
+PRODUCT_TYPES = ("TICKET", "GEAR", "DIGITAL")
+ORDER_STATUSES = ("PENDING", "WAITING_APPROVAL", "PAID", "CANCELED")
+ORDER_STATUS_WEIGHTS = (10, 5, 70, 15)
+
+REFERRAL_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+def copy_value(value) -> str:
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    value = str(value)
+    if any(ch in value for ch in "\\\t\n\r"):
+        value = value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return value
+
+
+def copy_rows(table: str, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+    """COPY строк в таблицу порциями по COPY_CHUNK_ROWS"""
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    total = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        buffer = io.StringIO()
+        pending = 0
+        for row in rows:
+            buffer.write("\t".join(copy_value(v) for v in row))
+            buffer.write("\n")
+            pending += 1
+            if pending >= COPY_CHUNK_ROWS:
+                buffer.seek(0)
+                cursor.copy_expert(statement, buffer)
+                total += pending
+                buffer, pending = io.StringIO(), 0
+        if pending:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            total += pending
+        raw.commit()
+    finally:
+        raw.close()
+    return total
+
+
+class DataGenerator:
+    """Детерминированный генератор строк для всех таблиц"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = args.reference_time
+        self.user_ids: List[str] = []
+        self.referral_codes: List[str] = []
+        self.card_ids_by_rarity = {rarity: [] for rarity in RARITIES}
+        self.card_rarity = {}
+        self.user_card_count = 0
+        self.product_prices: List[Tuple[int, int]] = []
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def past(self, max_days: float) -> datetime:
+        return self.now - timedelta(seconds=self.rng.random() * max_days * 86400)
+
+    def referral_code(self, used: set) -> str:
+        while True:
+            code = "UP-" + "".join(self.rng.choice(REFERRAL_ALPHABET) for _ in range(6))
+            if code not in used:
+                used.add(code)
+                return code
+
+    # -- users ------------------------------------------------------------------
+
+    def users(self) -> Iterator[tuple]:
+        rng = self.rng
+        used_codes = set()
+        # Preferential attachment: каждый приглашённый снова попадает в пул
+        # "рекрутеров", поэтому активные рефереры приглашают всё больше
+        recruiter_pool: List[int] = []
+        for i in range(self.args.users):
+            user_id = self.uuid()
+            code = self.referral_code(used_codes)
+            invited_by = None
+            if recruiter_pool and rng.random() < self.args.referral_share:
+                parent = recruiter_pool[rng.randrange(len(recruiter_pool))]
+                invited_by = self.referral_codes[parent]
+                recruiter_pool.append(parent)
+            if rng.random() < 0.3:
+                recruiter_pool.append(i)
+
+            self.user_ids.append(user_id)
+            self.referral_codes.append(code)
+
+            created_at = self.past(730)
+            last_login = created_at + (self.now - created_at) * rng.random()
+            coins = int(math.exp(rng.gauss(4.6, 1.3)))  # медиана ~100, длинный хвост
+            yield (
+                user_id,
+                100_000_000 + i,
+                f"member_{i}",
+                f"https://api.dicebear.com/9.x/avataaars/svg?seed={code}",
+                coins,
+                rng.choices(CLANS, CLAN_WEIGHTS)[0],
+                code,
+                invited_by,
+                rng.choices(ROLES, ROLE_WEIGHTS)[0],
+                rng.random() > 0.03,
+                rng.random() > 0.1,
+                created_at,
+                last_login,
+                last_login,
+            )
+
+    USER_COLUMNS = (
+        "id", "telegram_id", "username", "avatar_url", "up_coins", "clan_name",
+        "referral_code", "invited_by_code", "role", "is_active", "is_verified",
+        "created_at", "last_login", "updated_at",
+    )
+
+    # -- auth codes -------------------------------------------------------------
+
+    def auth_codes(self) -> Iterator[tuple]:
+        rng = self.rng
+        count = int(self.args.users * self.args.auth_codes_per_user)
+        for i in range(count):
+            user_index = rng.randrange(len(self.user_ids))
+            created_at = self.past(30)
+            yield (
+                i + 1,
+                self.uuid(),
+                100_000_000 + user_index,
+                self.user_ids[user_index],
+                created_at,
+                created_at + timedelta(minutes=10),
+                rng.random() < 0.85,
+            )
+
+    AUTH_CODE_COLUMNS = ("id", "code", "telegram_id", "user_id", "created_at", "expires_at", "used")
+
+    # -- cards ------------------------------------------------------------------
+
+    def cards(self) -> Iterator[tuple]:
+        rng = self.rng
+        for card_id in range(1, self.args.cards + 1):
+            rarity = rng.choices(RARITIES, CATALOG_RARITY_WEIGHTS)[0]
+            self.card_ids_by_rarity[rarity].append(card_id)
+            self.card_rarity[card_id] = rarity
+            power = {"COMMON": 10, "RARE": 25, "EPIC": 50, "LEGENDARY": 100}[rarity]
+            yield (
+                card_id,
+                f"{rarity.title()} Card #{card_id}",
+                "Synthetic card",
+                f"/img/cards/{card_id}.png",
+                rarity,
+                power + rng.randint(0, power),
+                rng.choices(CLANS, CLAN_WEIGHTS)[0],
+            )
+
+    CARD_COLUMNS = ("id", "name", "description", "image_url", "rarity", "power", "clan")
+
+    def draw_card(self) -> int:
+        rarity = self.rng.choices(RARITIES, DROP_RARITY_WEIGHTS)[0]
+        pool = self.card_ids_by_rarity[rarity] or self.card_ids_by_rarity["COMMON"]
+        return pool[self.rng.randrange(len(pool))]
+
+    def user_cards(self) -> Iterator[tuple]:
+        rng = self.rng
+        # Геометрическое распределение: у большинства мало карт, у коллекционеров - много
+        p = 1 / (1 + self.args.cards_per_user)
+        user_card_id = 0
+        for user_id in self.user_ids:
+            owned = int(math.log(1 - rng.random()) / math.log(1 - p))
+            for _ in range(owned):
+                user_card_id += 1
+                yield (user_card_id, user_id, self.draw_card(), False)
+        self.user_card_count = user_card_id
+
+    USER_CARD_COLUMNS = ("id", "user_id", "card_id", "is_locked")
+
+    def listed_user_cards(self) -> List[int]:
+        """Какие user_cards выставлены на рынок (владелец и редкость - из БД)"""
+        rng = self.rng
+        listed = set()
+        target = int(self.user_card_count * self.args.listing_share)
+        while len(listed) < target:
+            listed.add(rng.randint(1, self.user_card_count))
+        return sorted(listed)
+
+    # -- products / orders / events --------------------------------------------
+
+    def products(self) -> Iterator[tuple]:
+        rng = self.rng
+        for product_id in range(1, self.args.products + 1):
+            product_type = rng.choice(PRODUCT_TYPES)
+            price = int(math.exp(rng.gauss(7.0, 0.8)))
+            stock = -1 if product_type == "DIGITAL" else rng.choice((-1, 50, 100, 300, 1000))
+            self.product_prices.append((product_id, price))
+            yield (
+                product_id, f"{product_type.title()} #{product_id}", "Synthetic product",
+                price, f"/img/products/{product_id}.png", product_type, stock, rng.random() > 0.1,
+            )
+
+    PRODUCT_COLUMNS = ("id", "name", "description", "price", "image_url", "product_type", "stock", "is_active")
+
+    def orders(self) -> Iterator[tuple]:
+        rng = self.rng
+        count = int(self.args.users * self.args.orders_per_user)
+        for _ in range(count):
+            product_id, price = self.product_prices[rng.randrange(len(self.product_prices))]
+            coins_used = rng.choice((0, 0, 0, min(price // 2, 500)))
+            created_at = self.past(365)
+            # Naive UTC - колонки orders без timezone
+            created_naive = created_at.replace(tzinfo=None)
+            yield (
+                self.uuid(),
+                self.user_ids[rng.randrange(len(self.user_ids))],
+                product_id,
+                price - coins_used,
+                coins_used,
+                rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0],
+                None,
+                created_naive,
+                created_naive,
+            )
+
+    ORDER_COLUMNS = (
+        "id", "user_id", "product_id", "amount_rub", "coins_used", "status",
+        "payment_proof_url", "created_at", "updated_at",
+    )
+
+    def events(self) -> Iterator[tuple]:
+        rng = self.rng
+        base = self.now.replace(tzinfo=None)
+        for event_id in range(1, self.args.events + 1):
+            start = base + timedelta(days=rng.uniform(-365, 730), hours=rng.randint(18, 23) - 12)
+            yield (
+                event_id, f"Gathering #{event_id}", "Synthetic event", start,
+                start + timedelta(hours=rng.choice((3, 4, 6, 8))),
+                rng.choice(("Bunker 1", "Bunker 2", "Tunnel", "Depot", "Rooftop")),
+                float(rng.choice((0, 500, 1000, 1500, 3000))), None,
+                rng.choice((50, 100, 200, 500)), 1 if rng.random() > 0.05 else 0,
+                base, base,
+            )
+
+    EVENT_COLUMNS = (
+        "id", "title", "description", "start_date", "end_date", "location", "price",
+        "image_url", "capacity", "is_active", "created_at", "updated_at",
+    )
+
+
+def load_market_listings(generator: DataGenerator) -> int:
+    """
+    Листинги ссылаются на владельца карты - берём его (и денормализованные
+    card_id/rarity/clan) из уже загруженных user_cards/cards одним
+    INSERT ... SELECT (выбранные id грузятся COPY во временную таблицу).
+    """
+    listed_ids = generator.listed_user_cards()
+    rng = generator.rng
+    base_price = " ".join(f"WHEN '{rarity}' THEN {price}" for rarity, price in RARITY_PRICE.items())
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TEMP TABLE seed_listing_ids (id INTEGER, price INTEGER, created_at TIMESTAMP) ON COMMIT DROP"))
+        raw = conn.connection.dbapi_connection
+        buffer = io.StringIO()
+        base = generator.now.replace(tzinfo=None)
+        for user_card_id in listed_ids:
+            created_at = base - timedelta(seconds=rng.random() * 60 * 86400)
+            # Разброс цены в процентах; базу по редкости подставляет SELECT
+            buffer.write(f"{user_card_id}\t{int(math.exp(rng.gauss(0, 0.5)) * 100)}\t{created_at.isoformat()}\n")
+        buffer.seek(0)
+        raw.cursor().copy_expert("COPY seed_listing_ids (id, price, created_at) FROM STDIN", buffer)
+        conn.execute(text(f"""
+            INSERT INTO market_listings (id, seller_id, user_card_id, price, card_id, rarity, clan, created_at)
+            SELECT row_number() OVER (ORDER BY s.id), uc.user_id, uc.id,
+                   GREATEST(1, s.price * CASE c.rarity::text {base_price} END / 100),
+                   c.id, c.rarity, COALESCE(c.clan, 'Outcasts'),
+                   s.created_at
+            FROM seed_listing_ids s
+            JOIN user_cards uc ON uc.id = s.id
+            JOIN cards c ON c.id = uc.card_id
+        """))
+        conn.execute(text("UPDATE user_cards SET is_locked = TRUE WHERE id IN (SELECT id FROM seed_listing_ids)"))
+    return len(listed_ids)
+
+
+def load_opening_entries() -> int:
+    """Журнал UP Coins: стартовая запись на баланс каждого пользователя (INSERT ... SELECT)"""
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            INSERT INTO coin_ledger (entry_id, user_id, amount, reason, created_at)
+            SELECT 'opening:' || id, id, up_coins, 'opening_balance', created_at
+            FROM users
+            WHERE COALESCE(up_coins, 0) <> 0
+            ORDER BY created_at
+        """)).rowcount
+
+
+SEEDED_TABLES = (
+    "referral_level_counts", "referral_closure", "coin_balance_snapshots", "coin_ledger",
+    "market_listings", "user_cards", "orders", "auth_codes", "cards", "products", "events", "users",
+)
+
+SERIAL_TABLES = ("auth_codes", "cards", "user_cards", "products", "market_listings", "events", "coin_ledger")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--referral-share", type=float, default=0.6, help="share of users with an inviter")
+    parser.add_argument("--auth-codes-per-user", type=float, default=0.5)
+    parser.add_argument("--cards", type=int, default=500, help="card catalog size")
+    parser.add_argument("--cards-per-user", type=float, default=8.0, help="mean owned cards per user")
+    parser.add_argument("--listing-share", type=float, default=0.02, help="share of user_cards on the market")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--orders-per-user", type=float, default=0.3)
+    parser.add_argument("--events", type=int, default=5_000)
+    parser.add_argument(
+        "--reference-time",
+        type=lambda v: datetime.fromisoformat(v).astimezone(timezone.utc),
+        default=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        help="'now' for generated timestamps (ISO 8601); fixed by default for determinism",
+    )
+    parser.add_argument("--truncate", action="store_true", help="TRUNCATE seeded tables first")
+    parser.add_argument(
+        "--skip-fk-checks", action="store_true",
+        help="load with session_replication_role=replica (needs superuser; much faster)",
+    )
+    args = parser.parse_args()
+
+    run_migrations()
+    if args.truncate:
+        with engine.begin() as conn:
+            logger.info("🔄 Truncating %s...", ", ".join(SEEDED_TABLES))
+            conn.execute(text(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY CASCADE"))
+
+    if args.skip_fk_checks:
+        from sqlalchemy import event as sa_event
+
+        @sa_event.listens_for(engine, "connect")
+        def _replica_role(dbapi_connection, connection_record):
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute("SET session_replication_role = replica")
+
+        engine.dispose()
+
+    generator = DataGenerator(args)
+    started = time.perf_counter()
+    steps = (
+        ("users", generator.USER_COLUMNS, generator.users),
+        ("auth_codes", generator.AUTH_CODE_COLUMNS, generator.auth_codes),
+        ("cards", generator.CARD_COLUMNS, generator.cards),
+        ("user_cards", generator.USER_CARD_COLUMNS, generator.user_cards),
+        ("products", generator.PRODUCT_COLUMNS, generator.products),
+        ("orders", generator.ORDER_COLUMNS, generator.orders),
+        ("events", generator.EVENT_COLUMNS, generator.events),
+    )
+    for table, columns, rows in steps:
+        step_started = time.perf_counter()
+        count = copy_rows(table, columns, rows())
+        logger.info("✅ %-16s %10d rows in %6.1fs", table, count, time.perf_counter() - step_started)
+
+    step_started = time.perf_counter()
+    count = load_market_listings(generator)
+    logger.info("✅ %-16s %10d rows in %6.1fs", "market_listings", count, time.perf_counter() - step_started)
+
+    step_started = time.perf_counter()
+    count = load_opening_entries()
+    logger.info("✅ %-16s %10d rows in %6.1fs", "coin_ledger", count, time.perf_counter() - step_started)
+
+    step_started = time.perf_counter()
+    with engine.begin() as conn:
+        tree = rebuild_referral_tree(conn)
+    logger.info(
+        "✅ %-16s %10d rows in %6.1fs (%d levels)",
+        "referral_closure", tree["links"], time.perf_counter() - step_started, tree["depth"],
+    )
+
+    with engine.begin() as conn:
+        for table in SERIAL_TABLES:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            ))
+        conn.execute(text(f"ANALYZE {', '.join(SEEDED_TABLES)}"))
+
+    logger.info("✅ Seed %d completed in %.1fs", args.seed, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()